@@ -0,0 +1,324 @@
+"""
+batch_fit
+
+Fit many profiles against the exponential decay of fit_exp_decay at once,
+i.e. every row of a solver matrix, every timestep of a run or every
+geometry: C(x) = C0 * exp(-k * x) + b, lambda = 1 / k
+
+Profiles of the same series (i.e. the timesteps of one run) are fitted one
+after another, each starting from the parameters of the previous one. The
+series are split into contiguous blocks fitted in parallel by a pool of
+processes, the warm start running within every block. No plotting involved,
+see fit_exp_decay.plot_and_fit(..., popt=...) for that.
+
+Example: python3 batch_fit.py --dirs ../../local/input_geo_175cells -o fits.csv -j 4
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import sys
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fit_exp_decay import P0, init_exp, model_func, model_jac
+from solver_io import discover_solver_out
+
+FIT_DTYPE = np.dtype(
+    [
+        ("series", "i8"),
+        ("index", "i8"),
+        ("c0", "f8"),
+        ("k", "f8"),
+        ("lam", "f8"),
+        ("b", "f8"),
+        ("rss", "f8"),
+        ("rmse", "f8"),
+        ("nfev", "i8"),
+        ("success", "?"),
+    ]
+)
+
+
+def fit_series(x, Y, p0=None, warm_start=True, x_min=None, maxfev=5000):
+    """Fit the profiles of one series in order
+
+    Parameters
+    ----------
+    x : np.ndarray
+        (n_x) positions shared by all profiles or (n_profiles, n_x)
+    Y : np.ndarray
+        (n_profiles, n_x) profiles, NaN are left out
+    p0 : tuple of float, optional
+        Starting C0, k, b of the first profile, by default init_exp
+    warm_start : bool, optional
+        Start every profile from the fit of the previous one, by default True,
+        otherwise every profile starts from p0 (or its own init_exp)
+    x_min : float, optional
+        Only fit x > x_min, i.e. 0 as get_xy_section, by default all
+    maxfev : int, optional
+        Max. number of function evaluations per profile, by default 5000
+
+    Returns
+    -------
+    np.ndarray
+        (n_profiles) table of FIT_DTYPE, NaN where the fit failed
+    """
+    from scipy.optimize import curve_fit, OptimizeWarning
+
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    x = np.asarray(x, dtype=float)
+    out = np.zeros(Y.shape[0], dtype=FIT_DTYPE)
+    out["index"] = np.arange(Y.shape[0])
+    guess = None if p0 is None else tuple(p0)
+
+    for i in range(Y.shape[0]):
+        xi = x if x.ndim == 1 else x[i]
+        valid = np.isfinite(xi) & np.isfinite(Y[i])
+        if x_min is not None:
+            valid &= xi > x_min
+        start = guess
+        if start is None:
+            start = init_exp(xi[valid], Y[i, valid])
+            if not np.all(np.isfinite(start)):
+                start = P0
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", OptimizeWarning)
+                popt, _, info, _, _ = curve_fit(
+                    model_func,
+                    xi[valid],
+                    Y[i, valid],
+                    start,
+                    jac=model_jac,
+                    maxfev=maxfev,
+                    full_output=True,
+                )
+        except (RuntimeError, ValueError, TypeError):
+            for name in ("c0", "k", "lam", "b", "rss", "rmse"):
+                out[name][i] = np.nan
+            continue
+
+        resid = Y[i, valid] - model_func(xi[valid], *popt)
+        rss = float(resid @ resid)
+        out[i] = (
+            0,
+            i,
+            popt[0],
+            popt[1],
+            1 / popt[1],
+            popt[2],
+            rss,
+            np.sqrt(rss / max(resid.size, 1)),
+            info["nfev"],
+            True,
+        )
+        if warm_start:
+            guess = tuple(popt)
+
+    return out
+
+
+def _fit_series_job(args):
+    series, start, x, Y, kwargs = args
+    out = fit_series(x, Y, **kwargs)
+    out["series"] = series
+    out["index"] += start
+    return out
+
+
+def _blocks(n, n_blocks):
+    """Bounds of n_blocks contiguous blocks over n items, as even as possible"""
+    return np.linspace(0, n, n_blocks + 1).astype(int)
+
+
+def fit_profiles(x, Y, series=None, workers=None, **kwargs):
+    """Fit a stack of profiles in parallel
+
+    Every series is split into contiguous blocks, about one per worker over
+    all the series, each warm started in order on its own. A single long
+    series (i.e. the timesteps of one run) thus still uses all the workers.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        (n_x) positions shared by all profiles or (n_profiles, n_x)
+    Y : np.ndarray
+        (n_profiles, n_x) profiles
+    series : np.ndarray of int, optional
+        Series of every profile (i.e. the run), warm started in order within
+        its blocks. By default the profiles are split into contiguous blocks,
+        one per worker, each its own series.
+    workers : int, optional
+        Number of processes, by default os.cpu_count()
+    **kwargs
+        Passed to fit_series
+
+    Returns
+    -------
+    np.ndarray
+        (n_profiles) table of FIT_DTYPE in the order of Y, the index is the
+        position within the series
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    x = np.asarray(x, dtype=float)
+    n_profiles = Y.shape[0]
+    workers = workers or os.cpu_count() or 1
+
+    if series is None:
+        n_blocks = min(workers, n_profiles) or 1
+        series = np.repeat(np.arange(n_blocks), np.diff(_blocks(n_profiles, n_blocks)))
+    series = np.asarray(series)
+
+    jobs, rows = [], []
+    for label in np.unique(series):
+        idx = np.flatnonzero(series == label)
+        # the workers shared in proportion to the length of the series
+        n_blocks = int(min(max(round(workers * idx.size / n_profiles), 1), idx.size))
+        bounds = _blocks(idx.size, n_blocks)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            block = idx[start:stop]
+            rows.append(block)
+            jobs.append(
+                (label, start, x if x.ndim == 1 else x[block], Y[block], kwargs)
+            )
+
+    if workers == 1 or len(jobs) == 1:
+        results = map(_fit_series_job, jobs)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(_fit_series_job, jobs)
+
+    out = np.zeros(n_profiles, dtype=FIT_DTYPE)
+    try:
+        for idx, result in zip(rows, results):
+            out[idx] = result
+    finally:
+        if workers != 1 and len(jobs) != 1:
+            executor.shutdown()
+
+    return out
+
+
+def read_to_fit_dir(dir):
+    """Stack the Cells_<timestep>_to_fit.txt of a dir
+
+    Returns
+    -------
+    steps : list of int
+        Timesteps in order
+    x : np.ndarray
+        (n_steps, n_x) positions
+    Y : np.ndarray
+        (n_steps, n_x) profiles
+    """
+    found = discover_solver_out(dir, "_to_fit")
+
+    if not found:
+        return [], np.empty((0, 0)), np.empty((0, 0))
+
+    data = [np.loadtxt(file, delimiter=",", ndmin=2) for _, file in found]
+    n_x = min(d.shape[0] for d in data)
+    x = np.stack([d[:n_x, 0] for d in data])
+    Y = np.stack([d[:n_x, 1] for d in data])
+
+    return [step for step, _ in found], x, Y
+
+
+def save_fit_table(filename, table, names=None, steps=None):
+    """Write a table of FIT_DTYPE as csv"""
+    with open(filename, "w") as f_out:
+        f_out.write("series,step,c0,k,lambda,b,rss,rmse,nfev,success\n")
+        for i, row in enumerate(table):
+            series = names[row["series"]] if names is not None else row["series"]
+            step = steps[i] if steps is not None else row["index"]
+            f_out.write(
+                "{},{},{:.10e},{:.10e},{:.10e},{:.10e},{:.6e},{:.6e},{:d},{:d}\n".format(
+                    series,
+                    step,
+                    row["c0"],
+                    row["k"],
+                    row["lam"],
+                    row["b"],
+                    row["rss"],
+                    row["rmse"],
+                    row["nfev"],
+                    row["success"],
+                )
+            )
+
+
+def main(argv=None, prog=None):
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Fit the Cells_*_to_fit.txt profiles of every timestep",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--dirs",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Directories with Cells_*_to_fit.txt (from flatter_solver_output.py)",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default="fits.csv", help="Output csv"
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="Number of processes"
+    )
+    parser.add_argument(
+        "--x_min",
+        type=float,
+        default=0.0,
+        help="Only fit x > x_min, by default 0 (away from the source)",
+    )
+    parser.add_argument(
+        "--no_warm_start",
+        action="store_true",
+        help="Start every timestep from its own closed-form estimate",
+    )
+    args = parser.parse_args(argv)
+
+    names, steps, xs, Ys, series = [], [], [], [], []
+    for dir in args.dirs:
+        dir_steps, x, Y = read_to_fit_dir(dir)
+        if not dir_steps:
+            print("No Cells_*_to_fit.txt found in {}".format(dir))
+            continue
+        series += [len(names)] * len(dir_steps)
+        names.append(dir)
+        steps += dir_steps
+        xs.append(x)
+        Ys.append(Y)
+
+    if not names:
+        sys.exit(1)
+
+    # pad to the longest profile, NaN are left out of the fit
+    n_x = max(Y.shape[1] for Y in Ys)
+    pad = [((0, 0), (0, n_x - Y.shape[1])) for Y in Ys]
+    x = np.vstack([np.pad(a, p, constant_values=np.nan) for a, p in zip(xs, pad)])
+    Y = np.vstack([np.pad(a, p, constant_values=np.nan) for a, p in zip(Ys, pad)])
+
+    table = fit_profiles(
+        x,
+        Y,
+        series=np.array(series),
+        workers=args.workers,
+        warm_start=not args.no_warm_start,
+        x_min=args.x_min,
+    )
+    save_fit_table(args.output, table, names, steps)
+    print(
+        "{:d} profiles fitted ({:d} failed), saved to {}".format(
+            table.shape[0], int(np.count_nonzero(~table["success"])), args.output
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+benchmark
+
+Time the main steps of the pipeline on synthetic inputs (synthetic_data.py)
+at several scales and append the results to a JSON lines file, one record
+per benchmark and scale tagged with the git commit, so runs on different
+commits can be compared:
+
+    python3 benchmark.py                          # all benchmarks, all scales
+    python3 benchmark.py --bench fit_exp --scales small large
+    python3 benchmark.py --compare 1a2b3c4 5d6e7f8
+
+Every benchmark runs once untimed (warm up), then --repeat times; the
+minimum and the median are kept. Setup (writing the inputs, removing caches)
+is never timed. Every record is appended as soon as it is done, a benchmark
+that fails is recorded with its error and the others go on.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from synthetic_data import solver_field, tissue_polydata, write_solver_out
+
+RESULTS_FILE = "benchmarks.jsonl"
+SCALES = ("small", "medium", "large")
+# lattice nx x ny of the solver outputs and number of cells of the tissues
+LATTICE = {"small": (200, 100), "medium": (600, 300), "large": (1005, 1005)}
+N_CELLS = {"small": 50, "medium": 500, "large": 5000}
+
+
+def _tissue(tmp_dir, scale):
+    from vtk_io import write_polydata
+
+    filename = os.path.join(tmp_dir, "tissue_{}.vtp".format(scale))
+    if not os.path.exists(filename):
+        write_polydata(tissue_polydata(N_CELLS[scale], seed=0), filename)
+
+    return filename
+
+
+def _solver_out(tmp_dir, scale):
+    filename = os.path.join(tmp_dir, "Cells_{}.txt".format(scale))
+    if not os.path.exists(filename):
+        write_solver_out(filename, solver_field(*LATTICE[scale], noise=1e-3, seed=0))
+
+    return filename
+
+
+def bench_read_solver_out_flat(tmp_dir, scale):
+    from flatter_solver_output import read_solver_out_flat
+
+    filename = _solver_out(tmp_dir, scale)
+    cache = "{}.npy".format(os.path.splitext(filename)[0])
+
+    def setup():
+        # parse the text every time, not the .npy cache
+        for name in (cache, cache + ".json"):
+            if os.path.exists(name):
+                os.remove(name)
+
+    return setup, lambda: read_solver_out_flat(filename)
+
+
+def bench_read_solver_out_flat_cached(tmp_dir, scale):
+    from flatter_solver_output import read_solver_out_flat
+
+    filename = _solver_out(tmp_dir, scale)
+    read_solver_out_flat(filename)
+
+    return None, lambda: read_solver_out_flat(filename)
+
+
+def bench_center_centroid_celltype_id(tmp_dir, scale):
+    from flatter_solver_output import center_centroid_celltype_id
+
+    filename = _tissue(tmp_dir, scale)
+
+    return None, lambda: center_centroid_celltype_id(1.0, filename)
+
+
+def bench_write_celltype_id(tmp_dir, scale):
+    from set_cell_id_within_box import write_celltype_id
+
+    filename = _tissue(tmp_dir, scale)
+    output = os.path.join(tmp_dir, "box_{}.vtp".format(scale))
+    box = (0, 0, 200, 200)
+
+    return None, lambda: write_celltype_id(box, 2.0, filename, output)
+
+
+def bench_move_vtp_along(tmp_dir, scale):
+    from move_vtp import move_vtp_along
+
+    filename = _tissue(tmp_dir, scale)
+    output = os.path.join(tmp_dir, "moved_{}.vtp".format(scale))
+
+    return None, lambda: move_vtp_along(filename, output, 10.0)
+
+
+def bench_fit_exp(tmp_dir, scale):
+    from fit_exp_decay import fit_exp
+
+    nx, ny = LATTICE[scale]
+    y = solver_field(nx, 1, noise=1e-3, seed=0)[:, 0]
+    x = np.arange(nx) - nx / 10
+    x, y = x[x > 0], y[x > 0]
+
+    return None, lambda: fit_exp(x, y)
+
+
+def bench_plot_mesh_with_cell_type(tmp_dir, scale):
+    from plot_vtp_over_dir import plot_mesh_with_cell_type
+
+    filename = _tissue(tmp_dir, scale)
+    figname = os.path.join(tmp_dir, "tissue_{}.png".format(scale))
+
+    return None, lambda: plot_mesh_with_cell_type(filename, figname)
+
+
+BENCHMARKS = {
+    "read_solver_out_flat": bench_read_solver_out_flat,
+    "read_solver_out_flat_cached": bench_read_solver_out_flat_cached,
+    "center_centroid_celltype_id": bench_center_centroid_celltype_id,
+    "write_celltype_id": bench_write_celltype_id,
+    "move_vtp_along": bench_move_vtp_along,
+    "fit_exp": bench_fit_exp,
+    "plot_mesh_with_cell_type": bench_plot_mesh_with_cell_type,
+}
+
+
+def time_benchmark(setup, func, repeat=5):
+    """Min. and median of the wall time of func in seconds
+
+    setup (if any) runs untimed before every call, the prints of func are
+    swallowed.
+    """
+    times = []
+    for i in range(repeat + 1):
+        if setup is not None:
+            setup()
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        # the first call is the warm up
+        if i:
+            times.append(elapsed)
+
+    return float(np.min(times)), float(np.median(times))
+
+
+def git_commit():
+    """Commit of the working tree and whether it has local changes"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=here,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=here,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+    return commit, bool(status.strip())
+
+
+def run_benchmarks(names, scales, repeat=5, results_file=RESULTS_FILE):
+    """Run the benchmarks and append every record to results_file as it is done
+
+    A benchmark that raises is recorded with its error instead of the
+    times, the others go on. Missing optional packages skip a benchmark.
+
+    Returns
+    -------
+    list of dict
+        Records appended
+    """
+    commit, dirty = git_commit()
+    tmp_dir = tempfile.mkdtemp(prefix="lbibcell_bench_")
+    records = []
+    n_failed = 0
+    try:
+        with open(results_file, "a") as f_out:
+            for name in names:
+                for scale in scales:
+                    record = dict(
+                        commit=commit,
+                        dirty=dirty,
+                        date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        host=platform.node(),
+                        python=platform.python_version(),
+                        numpy=np.__version__,
+                        benchmark=name,
+                        scale=scale,
+                        lattice=LATTICE[scale],
+                        n_cells=N_CELLS[scale],
+                        repeat=repeat,
+                    )
+                    try:
+                        with redirect_stdout(io.StringIO()):
+                            setup, func = BENCHMARKS[name](tmp_dir, scale)
+                        best, median = time_benchmark(setup, func, repeat)
+                    except ImportError as err:
+                        print("{:<30} {:<7} skipped: {}".format(name, scale, err))
+                        continue
+                    except Exception as err:
+                        n_failed += 1
+                        record["error"] = "{}: {}".format(type(err).__name__, err)
+                        print("{:<30} {:<7} failed: {}".format(name, scale, err))
+                    else:
+                        record.update(min=best, median=median)
+                        print(
+                            "{:<30} {:<7} {:10.4f}s {:10.4f}s".format(
+                                name, scale, best, median
+                            )
+                        )
+                    # written at once, an interrupted run keeps what is done
+                    f_out.write(json.dumps(record) + "\n")
+                    f_out.flush()
+                    records.append(record)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(
+            "{:d} results of {}{} appended to {} ({:d} failed)".format(
+                len(records),
+                commit,
+                " (dirty)" if dirty else "",
+                results_file,
+                n_failed,
+            )
+        )
+
+    return records
+
+
+def compare(results_file, base, head):
+    """Print the ratio of the min. time of head over base per benchmark"""
+    best = {}
+    with open(results_file) as f_in:
+        for line in f_in:
+            record = json.loads(line)
+            if "min" not in record:
+                # failed benchmark
+                continue
+            key = (record["commit"], record["benchmark"], record["scale"])
+            best[key] = min(best.get(key, np.inf), record["min"])
+
+    print(
+        "{:<30} {:<7} {:>10} {:>10} {:>7}".format(
+            "benchmark", "scale", base, head, "ratio"
+        )
+    )
+    for (commit, name, scale), t_base in sorted(best.items()):
+        if commit != base or (head, name, scale) not in best:
+            continue
+        t_head = best[(head, name, scale)]
+        print(
+            "{:<30} {:<7} {:9.4f}s {:9.4f}s {:7.2f}".format(
+                name, scale, t_base, t_head, t_head / t_base
+            )
+        )
+
+
+def main(argv=None, prog=None):
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Benchmark the scripts on synthetic LBIBCell data",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--bench",
+        type=str,
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Benchmarks to run, by default all",
+    )
+    parser.add_argument(
+        "--scales",
+        type=str,
+        nargs="+",
+        choices=SCALES,
+        default=list(SCALES),
+        help="Scales to run, by default all",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timed runs per benchmark"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=RESULTS_FILE,
+        help="JSON lines file the results are appended to",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        nargs=2,
+        metavar=("BASE", "HEAD"),
+        default=None,
+        help="Compare the results of two commits instead of running",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        if not os.path.exists(args.output):
+            print("{} not found".format(args.output))
+            sys.exit(1)
+        compare(args.output, *args.compare)
+    else:
+        run_benchmarks(args.bench, args.scales, args.repeat, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+bootstrap_fit
+
+Confidence intervals of C0, lambda and b of the exponential decay
+C(x) = C0 * exp(-x / lambda) + b of a profile (i.e. from get_xy_section or
+get_xy_avg in fit_exp_decay) by bootstrap or jackknife.
+
+The positions of a profile are fixed, so a replicate is the same profile
+with every point weighted by how many times it was drawn (bootstrap) or with
+one point left out (jackknife). All replicates of a batch are then fitted at
+once by a weighted Levenberg-Marquardt vectorized over the batch, and the
+batches are spread over a pool of processes. Every batch draws from its own
+child of np.random.SeedSequence(seed), so the replicates only depend on the
+seed and the batch size, not on the number of workers.
+
+Example: python3 bootstrap_fit.py --inputs Cells_1000_to_fit.txt -n 5000 -j 4
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import sys
+import argparse
+import warnings
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fit_exp_decay import fit_exp, model_func, model_jac
+
+METHODS = ("bootstrap", "jackknife")
+PARAMS = ("c0", "lam", "b")
+
+
+def fit_exp_batch(x, Y, weights=None, p0=None, max_iter=100, tol=1e-10):
+    """Fit model_func to many profiles at once (weighted Levenberg-Marquardt)
+
+    Parameters
+    ----------
+    x : np.ndarray
+        (n) positions shared by all profiles
+    Y : np.ndarray
+        (n_rep, n) profiles, or (n) if only the weights change
+    weights : np.ndarray, optional
+        (n_rep, n) weight of every point, by default 1
+    p0 : np.ndarray, optional
+        (3) or (n_rep, 3) starting C0, k, b, by default fit_exp of the mean
+    max_iter : int, optional
+        Max. number of iterations, by default 100
+    tol : float, optional
+        Relative decrease of the cost to stop at, by default 1e-10
+
+    Returns
+    -------
+    popt : np.ndarray
+        (n_rep, 3) C0, k, b
+    converged : np.ndarray of bool
+        (n_rep) whether the fit stopped before max_iter
+    """
+    x = np.asarray(x, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if weights is None:
+        weights = np.ones(np.atleast_2d(Y).shape)
+    weights = np.asarray(weights, dtype=float)
+    n_rep = max(np.atleast_2d(Y).shape[0], weights.shape[0])
+    Y = np.broadcast_to(Y, (n_rep, x.size))
+    weights = np.broadcast_to(weights, (n_rep, x.size))
+
+    if p0 is None:
+        p0 = fit_exp(x, np.average(Y, axis=0, weights=weights.sum(axis=1)))
+    p = np.array(np.broadcast_to(p0, (n_rep, 3)), dtype=float)
+
+    def cost_of(p, rows):
+        r = Y[rows] - model_func(x, *(p[:, [i]] for i in range(3)))
+        return r, np.einsum("rn,rn->r", weights[rows], r * r)
+
+    damping = np.full(n_rep, 1e-3)
+    converged = np.zeros(n_rep, dtype=bool)
+    _, cost = cost_of(p, slice(None))
+
+    for _ in range(max_iter):
+        rows = np.flatnonzero(~converged)
+        if rows.size == 0:
+            break
+        pr, w = p[rows], weights[rows]
+        r, _ = cost_of(pr, rows)
+        J = model_jac(x, *(pr[:, [i]] for i in range(3)))
+        A = np.einsum("rn,rni,rnj->rij", w, J, J)
+        g = np.einsum("rn,rni,rn->ri", w, J, r)
+
+        # Marquardt scaling, the diagonal keeps C0, k and b comparable
+        diag = np.einsum("rii->ri", A) + 1e-30
+        A_damped = A + (damping[rows, None] * diag)[:, :, None] * np.eye(3)
+        with np.errstate(all="ignore"):
+            try:
+                step = np.linalg.solve(A_damped, g[:, :, None])[:, :, 0]
+            except np.linalg.LinAlgError:
+                step = np.stack(
+                    [np.linalg.lstsq(a, v, rcond=None)[0] for a, v in zip(A_damped, g)]
+                )
+            p_new = pr + step
+            _, cost_new = cost_of(p_new, rows)
+
+        better = np.isfinite(cost_new) & (cost_new <= cost[rows])
+        done = better & (cost[rows] - cost_new <= tol * cost[rows])
+        p[rows[better]] = p_new[better]
+        damping[rows[better]] /= 10
+        damping[rows[~better]] *= 10
+        cost[rows[better]] = cost_new[better]
+        # no step is accepted anymore: at the minimum up to round off
+        converged[rows[done | (damping[rows] > 1e16)]] = True
+
+    return p, converged
+
+
+def resample_weights(n, n_rep, method="bootstrap", rng=None, start=0):
+    """Weights of the replicates of a profile with n points
+
+    Parameters
+    ----------
+    n : int
+        Number of points in the profile
+    n_rep : int
+        Number of replicates
+    method : str, optional
+        "bootstrap" (multinomial counts) or "jackknife" (leave one out,
+        replicates start to start + n_rep), by default "bootstrap"
+    rng : np.random.Generator, optional
+        Random generator of the bootstrap
+    start : int, optional
+        First point left out by the jackknife, by default 0
+
+    Returns
+    -------
+    np.ndarray
+        (n_rep, n) weight of every point
+    """
+    if method == "bootstrap":
+        rng = rng if rng is not None else np.random.default_rng()
+        return rng.multinomial(n, np.full(n, 1 / n), size=n_rep).astype(float)
+    if method == "jackknife":
+        weights = np.ones((n_rep, n))
+        weights[np.arange(n_rep), start + np.arange(n_rep)] = 0
+        return weights
+
+    raise ValueError("method should be one of {}".format(METHODS))
+
+
+def _replicate_job(args):
+    x, y, popt, method, n_rep, seed, start = args
+    rng = np.random.default_rng(seed) if seed is not None else None
+    weights = resample_weights(x.size, n_rep, method, rng, start)
+    p, converged = fit_exp_batch(x, y, weights, popt)
+    p[~converged] = np.nan
+
+    return p
+
+
+def bootstrap_fit(
+    x,
+    y,
+    n_rep=2000,
+    method="bootstrap",
+    ci=0.95,
+    seed=0,
+    workers=None,
+    batch_size=500,
+):
+    """Fit a profile and resample it for the confidence intervals
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        Profile, i.e. from get_xy_section
+    n_rep : int, optional
+        Number of bootstrap replicates, by default 2000 (the jackknife
+        always has one per point)
+    method : str, optional
+        "bootstrap" or "jackknife", by default "bootstrap"
+    ci : float, optional
+        Confidence level, by default 0.95
+    seed : int, optional
+        Seed of the bootstrap, by default 0
+    workers : int, optional
+        Number of processes, by default os.cpu_count()
+    batch_size : int, optional
+        Replicates fitted at once, by default 500
+
+    Returns
+    -------
+    dict
+        "popt": C0, lambda, b of the profile, "replicates": (n_rep, 3) C0,
+        lambda, b (NaN if not converged), "ci": {"c0", "lam", "b"} to
+        (low, high), "se": standard errors, "n_failed"
+    """
+    from scipy.optimize import OptimizeWarning
+
+    if method not in METHODS:
+        raise ValueError("method should be one of {}".format(METHODS))
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", OptimizeWarning)
+        popt = fit_exp(x, y)
+
+    if method == "jackknife":
+        n_rep = x.size
+    starts = np.arange(0, n_rep, batch_size)
+    sizes = np.minimum(batch_size, n_rep - starts)
+    if method == "bootstrap":
+        seeds = np.random.SeedSequence(seed).spawn(starts.size)
+    else:
+        seeds = [None] * starts.size
+    jobs = [
+        (x, y, popt, method, int(size), s, int(start))
+        for start, size, s in zip(starts, sizes, seeds)
+    ]
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers == 1:
+        replicates = np.vstack(list(map(_replicate_job, jobs)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            replicates = np.vstack(list(executor.map(_replicate_job, jobs)))
+
+    # fit in k, report lambda
+    replicates[:, 1] = 1 / replicates[:, 1]
+    estimate = np.array((popt[0], 1 / popt[1], popt[2]))
+    ok = np.isfinite(replicates).all(axis=1)
+    good = replicates[ok]
+
+    alpha = 1 - ci
+    if method == "bootstrap":
+        se = np.std(good, axis=0, ddof=1)
+        low, high = np.percentile(
+            good, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0
+        )
+    else:
+        m = good.shape[0]
+        se = np.sqrt((m - 1) / m * np.sum((good - good.mean(axis=0)) ** 2, axis=0))
+        z = NormalDist().inv_cdf(1 - alpha / 2)
+        low, high = estimate - z * se, estimate + z * se
+
+    return {
+        "popt": estimate,
+        "replicates": replicates,
+        "ci": {name: (low[i], high[i]) for i, name in enumerate(PARAMS)},
+        "se": dict(zip(PARAMS, se)),
+        "n_failed": int(np.count_nonzero(~ok)),
+    }
+
+
+def main(argv=None, prog=None):
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Confidence intervals of C0, lambda and b of Cells_*_to_fit.txt profiles",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--inputs",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Cells_*_to_fit.txt (from flatter_solver_output.py)",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, help="Output csv, by default print"
+    )
+    parser.add_argument(
+        "-n", "--n_rep", type=int, default=2000, help="Number of bootstrap replicates"
+    )
+    parser.add_argument(
+        "--method", type=str, choices=METHODS, default="bootstrap", help="Resampling"
+    )
+    parser.add_argument(
+        "--ci", type=float, default=0.95, help="Confidence level, by default 0.95"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed, by default 0")
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="Number of processes"
+    )
+    args = parser.parse_args(argv)
+
+    lines = ["file,param,estimate,se,low,high,n_failed"]
+    for file in args.inputs:
+        if not os.path.exists(file):
+            print("{} not found".format(file))
+            sys.exit(1)
+        to_fit = np.loadtxt(file, delimiter=",", ndmin=2)
+        x, y = to_fit[:, 0], to_fit[:, 1]
+        # away from the source, as get_xy_section
+        res = bootstrap_fit(
+            x[x > 0],
+            y[x > 0],
+            n_rep=args.n_rep,
+            method=args.method,
+            ci=args.ci,
+            seed=args.seed,
+            workers=args.workers,
+        )
+        for i, name in enumerate(PARAMS):
+            lines.append(
+                "{},{},{:.10e},{:.6e},{:.10e},{:.10e},{:d}".format(
+                    file,
+                    name,
+                    res["popt"][i],
+                    res["se"][name],
+                    *res["ci"][name],
+                    res["n_failed"]
+                )
+            )
+
+    if args.output:
+        with open(args.output, "w") as f_out:
+            f_out.write("\n".join(lines) + "\n")
+        print("Saved to {}".format(args.output))
+    else:
+        print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+cell_geometry
+
+Per-cell reductions over a vtkPolyData from vtkCellReporter in LBIBCell.
+
+The polygon connectivity, the offsets, the points and the cell_type array are
+pulled out once as numpy views, so the cells are never visited one by one
+through the vtk wrapper (GetCell(i).GetPointIds().GetId(j)).
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import numpy as np
+
+from vtp_numpy import VtpPolyData
+
+
+class CellArrays:
+    """Numpy views on the polygons of a vtkPolyData
+
+    Attributes
+    ----------
+    points : np.ndarray
+        (nb of points, 3) coordinates, a view on the vtkPoints
+    connectivity : np.ndarray
+        Point ids of all polygons one after another
+    offsets : np.ndarray
+        (nb of cells + 1) start of every polygon in connectivity
+    cell_type : np.ndarray or None
+        Point array cell_type, a view on the vtk array, None if missing
+    """
+
+    def __init__(self, points, connectivity, offsets, cell_type=None, vtk_array=None):
+        self.points = points
+        self.connectivity = connectivity
+        self.offsets = offsets
+        self.cell_type = cell_type
+        self._vtk_array = vtk_array
+
+    @property
+    def n_cells(self):
+        return self.offsets.shape[0] - 1
+
+    @property
+    def n_points_per_cell(self):
+        return np.diff(self.offsets)
+
+    @property
+    def cell_ids(self):
+        """Cell id of every entry in connectivity"""
+        return np.repeat(np.arange(self.n_cells), self.n_points_per_cell)
+
+    def modified(self):
+        """Tell vtk the cell_type array changed through the numpy view"""
+        if self._vtk_array is not None:
+            self._vtk_array.Modified()
+
+
+def _polys_to_numpy(polys):
+    """Connectivity and offsets of a vtkCellArray"""
+    from vtk.util.numpy_support import vtk_to_numpy
+
+    if hasattr(polys, "GetOffsetsArray"):
+        # vtk >= 9 stores offsets and connectivity separately
+        offsets = vtk_to_numpy(polys.GetOffsetsArray()).astype(np.intp, copy=False)
+        connectivity = vtk_to_numpy(polys.GetConnectivityArray())
+        return connectivity.astype(np.intp, copy=False), offsets
+
+    # legacy layout: [n0, id, id, ..., n1, id, ...]
+    legacy = vtk_to_numpy(polys.GetData()).astype(np.intp, copy=False)
+    n_cells = polys.GetNumberOfCells()
+    starts = np.empty(n_cells, dtype=np.intp)
+    pos = 0
+    for i in range(n_cells):
+        starts[i] = pos
+        pos += legacy[pos] + 1
+    counts = legacy[starts]
+    offsets = np.zeros(n_cells + 1, dtype=np.intp)
+    np.cumsum(counts, out=offsets[1:])
+    keep = np.ones(legacy.shape[0], dtype=bool)
+    keep[starts] = False
+
+    return legacy[keep], offsets
+
+
+def cell_arrays(polyData, array_name="cell_type"):
+    """Pull the polygons of a vtkPolyData out as numpy views
+
+    Parameters
+    ----------
+    polyData : vtkPolyData or vtp_numpy.VtpPolyData
+        Output of vtk_io.read_polydata
+    array_name : str, optional
+        Point array with the cell type, by default "cell_type"
+
+    Returns
+    -------
+    CellArrays
+        Writing to CellArrays.cell_type changes the vtkPolyData
+    """
+    if isinstance(polyData, VtpPolyData):
+        return CellArrays(
+            polyData.points,
+            polyData.connectivity,
+            polyData.offsets,
+            polyData.point_data.get(array_name),
+        )
+
+    from vtk.util.numpy_support import vtk_to_numpy
+
+    points = vtk_to_numpy(polyData.GetPoints().GetData())
+    connectivity, offsets = _polys_to_numpy(polyData.GetPolys())
+    vtk_array = polyData.GetPointData().GetArray(array_name)
+    cell_type = vtk_to_numpy(vtk_array) if vtk_array is not None else None
+
+    return CellArrays(points, connectivity, offsets, cell_type, vtk_array)
+
+
+def _reduce_per_cell(ufunc, values, cells, empty):
+    """ufunc.reduceat over every cell, empty cells get the value empty"""
+    counts = cells.n_points_per_cell
+    out = np.full((cells.n_cells,) + values.shape[1:], empty, dtype=float)
+    has_points = counts > 0
+    if values.shape[0] > 0:
+        out[has_points] = ufunc.reduceat(values, cells.offsets[:-1][has_points], axis=0)
+
+    return out
+
+
+def cell_bounds(cells):
+    """Bounding box of every cell
+
+    Returns
+    -------
+    np.ndarray
+        (nb of cells, 4) min_x, min_y, max_x, max_y, NaN for empty cells
+    """
+    coor = cells.points[cells.connectivity, :2]
+    lower = _reduce_per_cell(np.minimum, coor, cells, np.nan)
+    upper = _reduce_per_cell(np.maximum, coor, cells, np.nan)
+
+    return np.hstack((lower, upper))
+
+
+def cells_all_type(cells, celltype_id):
+    """Whether all points of every cell are of celltype_id
+
+    Returns
+    -------
+    np.ndarray of bool
+        (nb of cells) mask
+    """
+    mismatch = cells.cell_type[cells.connectivity] != celltype_id
+    n_mismatch = np.bincount(cells.cell_ids, weights=mismatch, minlength=cells.n_cells)
+
+    return n_mismatch == 0
+
+
+def cell_vertex_mean(cells):
+    """Mean of the vertices of every cell
+
+    Returns
+    -------
+    np.ndarray
+        (nb of cells, 2) x, y, NaN for empty cells
+    """
+    coor = cells.points[cells.connectivity, :2]
+    ids = cells.cell_ids
+    counts = cells.n_points_per_cell
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = np.bincount(ids, weights=coor[:, 0], minlength=cells.n_cells) / counts
+        mean_y = np.bincount(ids, weights=coor[:, 1], minlength=cells.n_cells) / counts
+
+    return np.stack((mean_x, mean_y), axis=1)
+
+
+def cell_type_per_cell(cells):
+    """cell_type of every cell, NaN if its points do not agree
+
+    Returns
+    -------
+    np.ndarray
+        (nb of cells) cell type
+    """
+    values = cells.cell_type[cells.connectivity].astype(float)
+    lower = _reduce_per_cell(np.minimum, values, cells, np.nan)
+    upper = _reduce_per_cell(np.maximum, values, cells, np.nan)
+
+    return np.where(lower == upper, lower, np.nan)
+
+
+def _next_vertex(cells):
+    """Position in connectivity of the next vertex, closing every polygon"""
+    nxt = np.arange(1, cells.connectivity.shape[0] + 1)
+    counts = cells.n_points_per_cell
+    has_points = counts > 0
+    nxt[cells.offsets[1:][has_points] - 1] = cells.offsets[:-1][has_points]
+
+    return nxt
+
+
+def polygon_properties(cells, group_by_cell_type=False):
+    """Area, centroid, perimeter and second moments of every cell
+
+    Uses the shoelace formula over the edges of every polygon, so unlike the
+    mean of the vertices the centroid is not biased by uneven vertex density
+    and holds for non-convex cells. Vertices are taken relative to their
+    vertex mean in float64 to keep the float32 points of LBIBCell precise.
+
+    Parameters
+    ----------
+    cells : CellArrays
+        Polygons of the vtkPolyData
+    group_by_cell_type : bool, optional
+        Return the properties per cell_type (see cell_type_per_cell), by default False
+
+    Returns
+    -------
+    dict of np.ndarray
+        (nb of cells) arrays: area, centroid_x, centroid_y, perimeter,
+        ixx, iyy, ixy (second moments about the centroid), circularity
+        (4 pi area / perimeter^2) and aspect_ratio (of the inertia ellipse).
+        With group_by_cell_type a dict of cell_type to such a dict, also with
+        the cell ids under "cell_id".
+    """
+    ids = cells.cell_ids
+    n_cells = cells.n_cells
+    mean = cell_vertex_mean(cells)
+    coor = cells.points[cells.connectivity, :2].astype(float) - mean[ids]
+    x0, y0 = coor[:, 0], coor[:, 1]
+    nxt = _next_vertex(cells)
+    x1, y1 = x0[nxt], y0[nxt]
+    cross = x0 * y1 - x1 * y0
+
+    def per_cell(weights):
+        return np.bincount(ids, weights=weights, minlength=n_cells)
+
+    signed_area = per_cell(cross) / 2
+    perimeter = per_cell(np.hypot(x1 - x0, y1 - y0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cx = per_cell((x0 + x1) * cross) / (6 * signed_area)
+        cy = per_cell((y0 + y1) * cross) / (6 * signed_area)
+    # degenerated polygons fall back to the vertex mean
+    degenerate = ~np.isfinite(cx) | ~np.isfinite(cy)
+    cx[degenerate] = 0.0
+    cy[degenerate] = 0.0
+
+    # second moments about the vertex mean, positive for either orientation
+    sign = np.where(signed_area < 0, -1.0, 1.0)
+    ixx = sign * per_cell((y0 * y0 + y0 * y1 + y1 * y1) * cross) / 12
+    iyy = sign * per_cell((x0 * x0 + x0 * x1 + x1 * x1) * cross) / 12
+    ixy = sign * per_cell((x0 * y1 + 2 * x0 * y0 + 2 * x1 * y1 + x1 * y0) * cross) / 24
+    area = np.abs(signed_area)
+    # parallel axis theorem, moved to the centroid
+    ixx -= area * cy**2
+    iyy -= area * cx**2
+    ixy -= area * cx * cy
+
+    half_trace = (ixx + iyy) / 2
+    root = np.sqrt(((ixx - iyy) / 2) ** 2 + ixy**2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        circularity = 4 * np.pi * area / perimeter**2
+        aspect_ratio = np.sqrt((half_trace + root) / (half_trace - root))
+
+    props = {
+        "area": area,
+        "centroid_x": cx + mean[:, 0],
+        "centroid_y": cy + mean[:, 1],
+        "perimeter": perimeter,
+        "ixx": ixx,
+        "iyy": iyy,
+        "ixy": ixy,
+        "circularity": circularity,
+        "aspect_ratio": aspect_ratio,
+    }
+
+    if not group_by_cell_type:
+        return props
+
+    props["cell_id"] = np.arange(n_cells)
+    types = cell_type_per_cell(cells)
+    groups = {}
+    for celltype_id in np.unique(types[~np.isnan(types)]):
+        selected = types == celltype_id
+        groups[celltype_id] = {key: value[selected] for key, value in props.items()}
+
+    return groups
+
+
+def cell_point_positions(cells, selected):
+    """Position in connectivity of every point of the selected cells
+
+    Parameters
+    ----------
+    cells : CellArrays
+        Polygons of the vtkPolyData
+    selected : np.ndarray of int
+        Indices of the cells
+
+    Returns
+    -------
+    pos : np.ndarray of int
+        Position in connectivity, cell after cell
+    owner : np.ndarray of int
+        Index into selected of the cell of every position
+    """
+    selected = np.asarray(selected, dtype=np.intp)
+    starts = cells.offsets[selected]
+    counts = cells.offsets[selected + 1] - starts
+    owner = np.repeat(np.arange(selected.size), counts)
+    pos = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(
+        counts.sum()
+    )
+
+    return pos, owner
+
+
+def set_cells_type(cells, selected, celltype_id):
+    """Set the cell_type of all points of the selected cells
+
+    Parameters
+    ----------
+    cells : CellArrays
+        Polygons of the vtkPolyData
+    selected : np.ndarray
+        Mask over the cells or indices of the cells
+    celltype_id : float
+        New cell type
+
+    Returns
+    -------
+    int
+        Number of cells changed
+    """
+    selected = np.asarray(selected)
+    if selected.dtype == bool:
+        selected = np.flatnonzero(selected)
+    if selected.size == 0:
+        return 0
+
+    pos, _ = cell_point_positions(cells, selected)
+    cells.cell_type[cells.connectivity[pos]] = celltype_id
+    cells.modified()
+
+    return selected.size
@@ -0,0 +1,253 @@
+"""
+cell_index
+
+Uniform grid over the bounding boxes of the cells of a tissue, built once to
+select the cells in many regions (box, circle or polygon) without testing
+every cell against every region.
+
+A region is written as <shape>:<coordinates>:<cell_type>[:<mode>], i.e.
+
+    box:0,0,200,200:2               MIN_X, MIN_Y, MAX_X, MAX_Y
+    circle:150,500,80:1             center x, center y, radius
+    polygon:0,0,300,0,150,200:2     x, y of every vertex
+    box:0,0,200,200:2:intersect
+
+With the mode "contain" (default) all points of a cell must be inside the
+region, with "intersect" at least one.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import numpy as np
+
+from cell_geometry import cell_bounds, cell_point_positions, set_cells_type
+
+SHAPES = ("box", "circle", "polygon")
+MODES = ("contain", "intersect")
+
+
+class Region:
+    """A box, circle or polygon with the cell type painted in it
+
+    Parameters
+    ----------
+    shape : str
+        One of "box", "circle" or "polygon"
+    coords : sequence of float
+        See the module doc
+    celltype_id : float
+        Cell type of the cells selected
+    mode : str, optional
+        "contain" or "intersect", by default "contain"
+    """
+
+    def __init__(self, shape, coords, celltype_id, mode="contain"):
+        coords = np.asarray(coords, dtype=float)
+        if shape not in SHAPES:
+            raise ValueError("Region shape should be one of {}".format(SHAPES))
+        if mode not in MODES:
+            raise ValueError("Region mode should be one of {}".format(MODES))
+        if shape == "box" and (
+            coords.size != 4 or coords[0] > coords[2] or coords[1] > coords[3]
+        ):
+            raise ValueError("Box should be MIN_X, MIN_Y, MAX_X, MAX_Y")
+        if shape == "circle" and (coords.size != 3 or coords[2] <= 0):
+            raise ValueError("Circle should be x, y, radius")
+        if shape == "polygon" and (coords.size < 6 or coords.size % 2):
+            raise ValueError("Polygon should be x, y of at least 3 vertices")
+
+        self.shape = shape
+        self.coords = coords
+        self.celltype_id = celltype_id
+        self.mode = mode
+
+    @classmethod
+    def parse(cls, spec):
+        """Region from <shape>:<coordinates>:<cell_type>[:<mode>]"""
+        parts = spec.split(":")
+        if len(parts) not in (3, 4):
+            raise ValueError("Region {} not valid, i.e. box:0,0,200,200:2".format(spec))
+        coords = [float(v) for v in parts[1].split(",")]
+        mode = parts[3] if len(parts) == 4 else "contain"
+
+        return cls(parts[0], coords, float(parts[2]), mode)
+
+    @property
+    def bounds(self):
+        """min_x, min_y, max_x, max_y of the region"""
+        if self.shape == "box":
+            return tuple(self.coords)
+        if self.shape == "circle":
+            x, y, r = self.coords
+            return x - r, y - r, x + r, y + r
+        xy = self.coords.reshape(-1, 2)
+        return tuple(xy.min(axis=0)) + tuple(xy.max(axis=0))
+
+    def contains_points(self, xy):
+        """Whether the points (n, 2) are strictly inside the region"""
+        x, y = xy[:, 0], xy[:, 1]
+        if self.shape == "box":
+            min_x, min_y, max_x, max_y = self.coords
+            return (x > min_x) & (y > min_y) & (x < max_x) & (y < max_y)
+        if self.shape == "circle":
+            cx, cy, r = self.coords
+            return (x - cx) ** 2 + (y - cy) ** 2 < r**2
+
+        # even-odd rule, casting a ray along +x from every point
+        vx, vy = self.coords[0::2], self.coords[1::2]
+        wx, wy = np.roll(vx, -1), np.roll(vy, -1)
+        inside = np.zeros(xy.shape[0], dtype=bool)
+        for x0, y0, x1, y1 in zip(vx, vy, wx, wy):
+            crosses = (y0 > y) != (y1 > y)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= crosses & (x < x_cross)
+
+        return inside
+
+
+class CellGridIndex:
+    """Uniform grid over the bounding boxes of the cells
+
+    Every cell is registered in all the grid buckets its bounding box
+    overlaps, a query only tests the cells in the buckets under the region.
+
+    Parameters
+    ----------
+    cells : CellArrays
+        Polygons of the vtkPolyData
+    bucket_size : float, optional
+        Side of a bucket, by default twice the median cell size (or the
+        extent of all cells over sqrt(nb of cells) if most cells have no
+        extent), never so small that there are more than about 16 buckets
+        per cell
+    """
+
+    def __init__(self, cells, bucket_size=None):
+        self.cells = cells
+        self.bounds = cell_bounds(cells)
+        valid = ~np.isnan(self.bounds).any(axis=1)
+
+        if not valid.any():
+            self.origin = np.zeros(2)
+            self.bucket_size = 1.0
+            self.n_buckets = np.ones(2, dtype=np.intp)
+            self.bucket_start = np.zeros(2, dtype=np.intp)
+            self.bucket_cells = np.empty(0, dtype=np.intp)
+            return
+
+        lower, upper = self.bounds[valid, :2], self.bounds[valid, 2:]
+        n_valid = np.count_nonzero(valid)
+        extent = float(np.max(upper.max(axis=0) - lower.min(axis=0)))
+        if bucket_size is None:
+            bucket_size = 2 * np.median(np.max(upper - lower, axis=1))
+            if not bucket_size > 0:
+                # mostly cells of no extent, about one cell per bucket
+                bucket_size = extent / np.sqrt(n_valid)
+        # at most about 16 buckets per cell, whatever the bucket size given
+        bucket_size = max(float(bucket_size), extent / (4 * np.sqrt(n_valid)))
+        self.bucket_size = max(bucket_size, 1e-6)
+        self.origin = lower.min(axis=0)
+        self.n_buckets = (
+            np.floor((upper.max(axis=0) - self.origin) / self.bucket_size).astype(
+                np.intp
+            )
+            + 1
+        )
+
+        # expand every cell to the buckets it overlaps
+        ids = np.flatnonzero(valid)
+        first = self._bucket_of(lower)
+        last = self._bucket_of(upper)
+        span = last - first + 1
+        count = span[:, 0] * span[:, 1]
+        owner = np.repeat(np.arange(ids.size), count)
+        local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        bx = first[owner, 0] + local // span[owner, 1]
+        by = first[owner, 1] + local % span[owner, 1]
+        key = bx * self.n_buckets[1] + by
+
+        order = np.argsort(key, kind="stable")
+        self.bucket_cells = ids[owner[order]]
+        self.bucket_start = np.searchsorted(
+            key[order], np.arange(self.n_buckets[0] * self.n_buckets[1] + 1)
+        )
+
+    def _bucket_of(self, xy):
+        b = np.floor((np.asarray(xy) - self.origin) / self.bucket_size).astype(np.intp)
+        return np.clip(b, 0, self.n_buckets - 1)
+
+    def candidates(self, bounds):
+        """Cells whose bucket overlaps the bounds min_x, min_y, max_x, max_y"""
+        min_x, min_y, max_x, max_y = bounds
+        first = self._bucket_of((min_x, min_y))
+        last = self._bucket_of((max_x, max_y))
+        keys = (
+            np.arange(first[0], last[0] + 1)[:, None] * self.n_buckets[1]
+            + np.arange(first[1], last[1] + 1)[None, :]
+        ).ravel()
+        found = [
+            self.bucket_cells[self.bucket_start[k] : self.bucket_start[k + 1]]
+            for k in keys
+        ]
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        ids = np.unique(np.concatenate(found))
+
+        # drop the cells whose bounding box misses the bounds
+        b = self.bounds[ids]
+        overlap = (
+            (b[:, 0] <= max_x)
+            & (b[:, 2] >= min_x)
+            & (b[:, 1] <= max_y)
+            & (b[:, 3] >= min_y)
+        )
+        return ids[overlap]
+
+    def query(self, region):
+        """Indices of the cells selected by the region"""
+        ids = self.candidates(region.bounds)
+        if ids.size == 0:
+            return ids
+
+        pos, owner = cell_point_positions(self.cells, ids)
+        xy = self.cells.points[self.cells.connectivity[pos], :2]
+        inside = region.contains_points(xy)
+        n_inside = np.bincount(owner, weights=inside, minlength=ids.size)
+        if region.mode == "contain":
+            n_points = np.bincount(owner, minlength=ids.size)
+            return ids[(n_inside == n_points) & (n_points > 0)]
+
+        return ids[n_inside > 0]
+
+    def query_many(self, regions):
+        """Indices of the cells selected by every region"""
+        return [self.query(region) for region in regions]
+
+
+def paint_regions(cells, regions, index=None):
+    """Set the cell type of the cells in every region, in order
+
+    A cell in several regions ends up with the type of the last one.
+
+    Parameters
+    ----------
+    cells : CellArrays
+        Polygons of the vtkPolyData
+    regions : list of Region
+        Regions with the cell type painted
+    index : CellGridIndex, optional
+        Prebuilt index of cells, by default built here
+
+    Returns
+    -------
+    list of int
+        Number of cells changed by every region
+    """
+    if index is None:
+        index = CellGridIndex(cells)
+
+    counts = []
+    for region, ids in zip(regions, index.query_many(regions)):
+        counts.append(set_cells_type(cells, ids, region.celltype_id))
+
+    return counts
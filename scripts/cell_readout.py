@@ -0,0 +1,299 @@
+"""
+cell_readout
+
+Concentration read out per cell instead of along the lattice: the polygons
+of the cells (vtp from vtkCellReporter) are rasterized once into a label
+image of the size of the lattice, labels[x, y] = id of the cell covering the
+lattice node (x, y) or -1, and the count, mean, max and variance of every
+cell then come from a few np.bincount over the solver output.
+
+The label image only depends on the geometry, so it is kept per geometry
+hash (and optionally as labels-<hash>.npy in a cache dir) and reused for
+all the solver outputs read out against the same cells.
+
+Example: python3 cell_readout.py --input_dir output --reporter_dir output -o readout.csv
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import sys
+import hashlib
+import argparse
+from bisect import bisect_right
+
+import numpy as np
+
+from cell_geometry import _next_vertex, cell_type_per_cell
+
+
+def geometry_hash(cells, shape):
+    """Hash of the polygons and the lattice size, key of the label image"""
+    sha = hashlib.sha1()
+    sha.update(np.asarray(shape, dtype=np.int64).tobytes())
+    sha.update(np.ascontiguousarray(cells.points[:, :2], dtype=np.float64).tobytes())
+    sha.update(np.ascontiguousarray(cells.connectivity, dtype=np.int64).tobytes())
+    sha.update(np.ascontiguousarray(cells.offsets, dtype=np.int64).tobytes())
+
+    return sha.hexdigest()
+
+
+def rasterize_cells(cells, shape):
+    """Label image of the cells on the lattice, by scanlines along y
+
+    A lattice node (x, y) belongs to a cell if it is inside its polygon
+    (even-odd rule, nodes on the left and lower edges are inside). A node
+    inside overlapping cells gets the last one.
+
+    Parameters
+    ----------
+    cells : CellArrays
+        Polygons of the vtkPolyData
+    shape : tuple of int
+        Size of the lattice (nx, ny)
+
+    Returns
+    -------
+    np.ndarray of int32
+        (nx, ny) cell id, -1 outside of every cell
+    """
+    nx, ny = shape
+    labels = np.full(shape, -1, dtype=np.int32)
+    if cells.connectivity.size == 0:
+        return labels
+
+    xy = cells.points[:, :2]
+    start = xy[cells.connectivity]
+    end = xy[cells.connectivity[_next_vertex(cells)]]
+    owner = cells.cell_ids
+
+    # every edge crosses the rows y = j with y_low <= j < y_high
+    y_low = np.minimum(start[:, 1], end[:, 1])
+    y_high = np.maximum(start[:, 1], end[:, 1])
+    j_first = np.clip(np.ceil(y_low), 0, ny).astype(np.intp)
+    j_last = np.clip(np.ceil(y_high), 0, ny).astype(np.intp)
+    n_rows = np.maximum(j_last - j_first, 0)
+    if n_rows.sum() == 0:
+        return labels
+
+    edge = np.repeat(np.arange(n_rows.size), n_rows)
+    j = j_first[edge] + (
+        np.arange(edge.size) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+    )
+    x0, y0 = start[edge, 0], start[edge, 1]
+    x1, y1 = end[edge, 0], end[edge, 1]
+    x_cross = x0 + (j - y0) * (x1 - x0) / (y1 - y0)
+    cell = owner[edge]
+
+    # crossings of a cell on a row in pairs: inside between the two
+    order = np.lexsort((x_cross, j, cell))
+    x_cross, j, cell = x_cross[order], j[order], cell[order]
+    x_in = np.clip(np.ceil(x_cross[0::2]), 0, nx).astype(np.intp)
+    x_out = np.clip(np.ceil(x_cross[1::2]), 0, nx).astype(np.intp)
+    j, cell = j[0::2], cell[0::2]
+
+    width = np.maximum(x_out - x_in, 0)
+    span = np.repeat(np.arange(width.size), width)
+    i = x_in[span] + (np.arange(span.size) - np.repeat(np.cumsum(width) - width, width))
+    labels[i, j[span]] = cell[span]
+
+    return labels
+
+
+class CellReadout:
+    """Per cell statistics of solver outputs, label images kept per geometry
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Also keep the label images as labels-<hash>.npy in this dir, by
+        default only in memory
+    max_geometries : int, optional
+        Number of label images kept in memory, by default 4
+    """
+
+    def __init__(self, cache_dir=None, max_geometries=4):
+        self.cache_dir = cache_dir
+        self.max_geometries = max(int(max_geometries), 1)
+        self._labels = {}
+        self.n_rasterized = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def labels(self, cells, shape):
+        """Label image of the cells, rasterized only for a new geometry"""
+        key = geometry_hash(cells, shape)
+        if key in self._labels:
+            return self._labels[key]
+
+        npy_name = None
+        if self.cache_dir:
+            npy_name = os.path.join(self.cache_dir, "labels-{}.npy".format(key))
+        if npy_name and os.path.exists(npy_name):
+            labels = np.load(npy_name)
+        else:
+            labels = rasterize_cells(cells, shape)
+            self.n_rasterized += 1
+            if npy_name:
+                np.save(npy_name + ".tmp.npy", labels)
+                os.replace(npy_name + ".tmp.npy", npy_name)
+
+        if len(self._labels) >= self.max_geometries:
+            self._labels.pop(next(iter(self._labels)))
+        self._labels[key] = labels
+
+        return labels
+
+    def readout(self, arr, cells):
+        """Count, mean, max and variance of arr over every cell
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            Concentration indexed as arr[x, y]
+        cells : CellArrays
+            Polygons of the vtkPolyData
+
+        Returns
+        -------
+        dict of np.ndarray
+            (nb of cells) count, mean, max and var, NaN for a cell covering
+            no lattice node
+        """
+        return cell_stats(arr, self.labels(cells, arr.shape), cells.n_cells)
+
+
+def cell_stats(arr, labels, n_cells):
+    """Count, mean, max and variance of arr per label, see CellReadout.readout"""
+    labels = labels.ravel()
+    inside = labels >= 0
+    ids = labels[inside]
+    values = np.asarray(arr, dtype=float).ravel()[inside]
+
+    count = np.bincount(ids, minlength=n_cells)
+    total = np.bincount(ids, weights=values, minlength=n_cells)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        # variance around the mean, not E[x^2] - E[x]^2, against cancellation
+        var = (
+            np.bincount(ids, weights=(values - mean[ids]) ** 2, minlength=n_cells)
+            / count
+        )
+    upper = np.full(n_cells, -np.inf)
+    np.maximum.at(upper, ids, values)
+    upper[count == 0] = np.nan
+
+    return {"count": count, "mean": mean, "max": upper, "var": var}
+
+
+def readout_run(input_dir, reporter_dir, output, cache_dir=None):
+    """Per cell readout of every solver output against the latest geometry
+
+    Every Cells_<timestep>.txt is read out against the cells reported at the
+    same timestep, or the last one before it.
+
+    Parameters
+    ----------
+    input_dir : str
+        Directory with the solver outputs Cells_*.txt
+    reporter_dir : str
+        Cell reporter output dir
+    output : str
+        Output csv, one line per timestep and cell
+    cache_dir : str, optional
+        See CellReadout
+    """
+    from reporter_timeline import discover_timesteps
+    from solver_io import discover_solver_out, load_solver_field
+    from vtk_io import read_polydata
+    from cell_geometry import cell_arrays
+
+    frames = discover_timesteps(reporter_dir)
+    if not frames:
+        raise IOError("No cell reporter files found in {}".format(reporter_dir))
+    frame_steps = [step for step, _ in frames]
+
+    solver = discover_solver_out(input_dir)
+
+    reader = CellReadout(cache_dir)
+    geometry = (None, None)
+    with open(output, "w") as f_out:
+        f_out.write("step,cell_id,cell_type,count,mean,max,var\n")
+        for step, file in solver:
+            k = bisect_right(frame_steps, step) - 1
+            if k < 0:
+                print("No cells reported before timestep {:d}, skipped".format(step))
+                continue
+            if geometry[0] != frame_steps[k]:
+                cells = cell_arrays(read_polydata(frames[k][1]))
+                geometry = (frame_steps[k], cells)
+            cells = geometry[1]
+
+            stats = reader.readout(load_solver_field(file), cells)
+            cell_type = (
+                cell_type_per_cell(cells)
+                if cells.cell_type is not None
+                else np.full(cells.n_cells, np.nan)
+            )
+            table = np.column_stack(
+                (
+                    np.full(cells.n_cells, step),
+                    np.arange(cells.n_cells),
+                    cell_type,
+                    stats["count"],
+                    stats["mean"],
+                    stats["max"],
+                    stats["var"],
+                )
+            )
+            np.savetxt(
+                f_out,
+                table,
+                fmt=["%d", "%d", "%g", "%d", "%.10e", "%.10e", "%.10e"],
+                delimiter=",",
+            )
+            print("{} read out over {:d} cells".format(file, cells.n_cells))
+
+    print(
+        "Saved to {} ({:d} label images rasterized)".format(output, reader.n_rasterized)
+    )
+
+
+def main(argv=None, prog=None):
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Mean, max and variance of the concentration in every cell",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        required=True,
+        help="Directory with the solver outputs Cells_*.txt",
+    )
+    parser.add_argument(
+        "--reporter_dir",
+        type=str,
+        required=True,
+        help="Cell reporter output dir (Cells_*.vtm)",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default="cell_readout.csv", help="Output csv"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Keep the label images as .npy in this dir, by default in memory",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        readout_run(args.input_dir, args.reporter_dir, args.output, args.cache_dir)
+    except IOError as err:
+        print(err)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+celltype_rules
+
+Edit the cell types of many vtp (from vtkCellReporter) with a list of rules
+applied in order, one read and one write per vtp, the vtp edited in
+parallel without asking anything.
+
+The rules are a JSON file:
+
+    {
+        "rules": [
+            {"box": [0, 0, 200, 1000], "set": 1},
+            {"circle": [150, 500, 80], "mode": "intersect", "set": 2},
+            {"polygon": [0, 0, 300, 0, 150, 200], "set": 2},
+            {"distance": {"min": 0, "max": 150, "from_type": 1}, "type": 0, "set": 3},
+            {"random": 0.1, "seed": 42, "type": 0, "set": 4},
+            {"type": 4, "set": 0}
+        ]
+    }
+
+Every rule sets the cell type "set" on the cells selected by one of:
+
+    box, circle, polygon    cells inside the region, see cell_index.Region
+                            ("mode": "contain" by default or "intersect")
+    distance                cells whose centroid is between "min" and "max"
+                            (by default 0 and inf) from the centroid of the
+                            cells of type "from_type" (by default 1) or from
+                            the point "from": [x, y]
+    random                  this fraction of the cells, drawn with "seed"
+    (none)                  all the cells
+
+and, if given, only among the cells of the current type "type". The rules
+see the cell types left by the ones before.
+
+Example: python3 celltype_rules.py --rules sweep.json -i tissue_*.vtp --output_dir sweep -j 4
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import sys
+from numbers import Real
+import json
+import argparse
+
+import numpy as np
+
+from cell_geometry import (
+    cell_arrays,
+    cell_type_per_cell,
+    polygon_properties,
+    set_cells_type,
+)
+from cell_index import SHAPES, CellGridIndex, Region
+from vtk_io import (
+    read_polydata,
+    write_polydata,
+    add_writer_arguments,
+    map_vtp,
+    plan_outputs,
+)
+
+SELECTORS = SHAPES + ("distance", "random")
+
+
+def _is_number(value):
+    # bool is an int, but "random": true is a mistake
+    return isinstance(value, Real) and not isinstance(value, bool)
+
+
+def _is_int(value):
+    return _is_number(value) and float(value).is_integer()
+
+
+def check_rule(rule):
+    """Raise ValueError if a rule is not valid, return it otherwise"""
+    if not isinstance(rule, dict) or "set" not in rule:
+        raise ValueError(
+            "Rule {} should be an object with a cell type 'set'".format(rule)
+        )
+    selectors = [key for key in SELECTORS if key in rule]
+    if len(selectors) > 1:
+        raise ValueError("Rule {} has more than one of {}".format(rule, selectors))
+    unknown = set(rule) - set(SELECTORS) - {"set", "type", "mode", "seed"}
+    if unknown:
+        raise ValueError("Rule {} has unknown keys {}".format(rule, sorted(unknown)))
+    for key in ("set", "type"):
+        if key in rule and not _is_int(rule[key]):
+            raise ValueError("Rule {}: {} should be a cell type".format(rule, key))
+
+    if selectors and selectors[0] in SHAPES:
+        # validated by Region
+        Region(
+            selectors[0], rule[selectors[0]], rule["set"], rule.get("mode", "contain")
+        )
+    elif "mode" in rule:
+        raise ValueError("Rule {}: mode is only for {}".format(rule, SHAPES))
+    if "random" in rule and not (
+        _is_number(rule["random"]) and 0 <= rule["random"] <= 1
+    ):
+        raise ValueError("Rule {}: random should be a fraction".format(rule))
+    if "seed" in rule and not _is_int(rule["seed"]):
+        raise ValueError("Rule {}: seed should be an integer".format(rule))
+    if "distance" in rule:
+        distance = rule["distance"]
+        if not isinstance(distance, dict) or set(distance) - {
+            "min",
+            "max",
+            "from_type",
+            "from",
+        }:
+            raise ValueError(
+                "Rule {}: distance takes min, max and from_type or from".format(rule)
+            )
+        d_min, d_max = distance.get("min", 0), distance.get("max", np.inf)
+        if not (_is_number(d_min) and _is_number(d_max) and 0 <= d_min <= d_max):
+            raise ValueError(
+                "Rule {}: distance should have 0 <= min <= max".format(rule)
+            )
+        if "from_type" in distance and not _is_int(distance["from_type"]):
+            raise ValueError("Rule {}: from_type should be a cell type".format(rule))
+        if "from" in distance and not (
+            isinstance(distance["from"], (list, tuple))
+            and len(distance["from"]) == 2
+            and all(_is_number(value) for value in distance["from"])
+        ):
+            raise ValueError("Rule {}: from should be a point [x, y]".format(rule))
+
+    return rule
+
+
+def load_rules(filename):
+    """Rules of a JSON file, see the module doc"""
+    with open(filename) as f_in:
+        content = json.load(f_in)
+    rules = content["rules"] if isinstance(content, dict) else content
+
+    return [check_rule(rule) for rule in rules]
+
+
+def select_cells(cells, rule, index=None, props=None):
+    """Mask of the cells selected by a rule
+
+    Parameters
+    ----------
+    cells : CellArrays
+        Polygons of the vtkPolyData
+    rule : dict
+        See the module doc
+    index : CellGridIndex, optional
+        Prebuilt index for the region rules
+    props : dict, optional
+        polygon_properties of the cells for the distance rules
+
+    Returns
+    -------
+    np.ndarray of bool
+        (nb of cells) selected
+    """
+    n_cells = cells.n_cells
+    eligible = np.ones(n_cells, dtype=bool)
+    if "type" in rule:
+        eligible = cell_type_per_cell(cells) == rule["type"]
+
+    shape = next((key for key in SHAPES if key in rule), None)
+    if shape is not None:
+        region = Region(shape, rule[shape], rule["set"], rule.get("mode", "contain"))
+        index = index if index is not None else CellGridIndex(cells)
+        selected = np.zeros(n_cells, dtype=bool)
+        selected[index.query(region)] = True
+        return selected & eligible
+
+    if "distance" in rule:
+        distance = rule["distance"]
+        props = props if props is not None else polygon_properties(cells)
+        centroids = np.stack((props["centroid_x"], props["centroid_y"]), axis=1)
+        if "from" in distance:
+            origin = np.asarray(distance["from"], dtype=float)
+        else:
+            source = cell_type_per_cell(cells) == distance.get("from_type", 1)
+            if not source.any():
+                print(
+                    "No cell of type {} to measure from".format(
+                        distance.get("from_type", 1)
+                    )
+                )
+                return np.zeros(n_cells, dtype=bool)
+            origin = centroids[source].mean(axis=0)
+        d = np.hypot(*(centroids - origin).T)
+        within = (d >= distance.get("min", 0)) & (d <= distance.get("max", np.inf))
+        return within & eligible
+
+    if "random" in rule:
+        rng = np.random.default_rng(rule.get("seed"))
+        candidates = np.flatnonzero(eligible)
+        size = int(candidates.size * rule["random"])
+        selected = np.zeros(n_cells, dtype=bool)
+        selected[rng.choice(candidates, size=size, replace=False)] = True
+        return selected
+
+    return eligible
+
+
+def apply_rules(cells, rules):
+    """Apply the rules in order on the cell types
+
+    Returns
+    -------
+    list of int
+        Number of cells set by every rule
+    """
+    index = None
+    props = None
+    counts = []
+    for rule in rules:
+        # the geometry does not change, only build what the rules need
+        if index is None and any(key in rule for key in SHAPES):
+            index = CellGridIndex(cells)
+        if props is None and "distance" in rule:
+            props = polygon_properties(cells)
+        selected = select_cells(cells, rule, index, props)
+        counts.append(set_cells_type(cells, selected, rule["set"]))
+
+    return counts
+
+
+def edit_vtp(input_file, output_file, rules, data_mode="binary", compressor="zlib"):
+    """Read a vtp, apply the rules and write it
+
+    Returns
+    -------
+    input_file : str
+        The vtp edited
+    counts : list of int
+        Number of cells set by every rule
+    """
+    polyData = read_polydata(input_file)
+    cells = cell_arrays(polyData)
+    if cells.cell_type is None:
+        raise ValueError("{} has no cell_type array".format(input_file))
+    counts = apply_rules(cells, rules)
+    write_polydata(polyData, output_file, data_mode, compressor)
+
+    return input_file, counts
+
+
+def edit_many(jobs, rules, workers=None, **kwargs):
+    """Edit the vtp in a pool of processes
+
+    Parameters
+    ----------
+    jobs : list of (str, str)
+        Input and output vtp
+    rules : list of dict
+        See the module doc
+    workers : int, optional
+        Number of processes, by default os.cpu_count()
+    **kwargs
+        Passed to edit_vtp
+
+    Returns
+    -------
+    list of str
+        Input vtp failed
+    """
+
+    def report(input_file, result):
+        _, counts = result
+        print("{}: {}".format(input_file, ", ".join(str(count) for count in counts)))
+
+    return map_vtp(edit_vtp, jobs, workers, report, rules=rules, **kwargs)
+
+
+def main(argv=None, prog=None):
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Apply a rule file of cell type edits to many vtp",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--rules", type=str, required=True, help="JSON rule file, see the doc"
+    )
+    parser.add_argument(
+        "-i", "--inputs", type=str, nargs="+", required=True, help="Input vtp"
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Write the outputs here under the same names, by default\n"
+        "<name>_rules.vtp next to every input",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="Number of processes"
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Overwrite existing outputs"
+    )
+    add_writer_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        rules = load_rules(args.rules)
+    except (OSError, ValueError, KeyError) as err:
+        print("Rules {} not valid: {}".format(args.rules, err))
+        sys.exit(1)
+    try:
+        jobs = plan_outputs(args.inputs, args.output_dir, "_rules", force=args.force)
+    except ValueError as err:
+        print(err)
+        sys.exit(1)
+
+    failed = edit_many(
+        jobs,
+        rules,
+        args.workers,
+        data_mode="ascii" if args.ascii else "binary",
+        compressor=args.compressor,
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
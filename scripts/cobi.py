@@ -0,0 +1,107 @@
+"""
+cobi
+
+One entry point for the scripts, every subcommand is the main() of a script
+and its module is only imported when the subcommand runs, so the help and
+the light subcommands start without matplotlib, scipy, pyvista or vtk:
+
+    python3 cobi.py solver-flatten --dirs output --source_vtp output/Cells_0_0.vtp
+    python3 cobi.py set-cell-type -i Cells_1000_0.vtp --region box:0,0,200,200:2
+    python3 cobi.py move -i output --ops translate:-350,0 --output_dir moved
+    python3 cobi.py plot-dir --input_dir output --movie cells
+    python3 cobi.py fit --dirs output -o fit.csv
+    python3 cobi.py init-cell --packing hex --box 0 0 300 1000 -r 20
+    python3 cobi.py bootstrap --inputs output/Cells_1000_to_fit.txt -n 5000
+    python3 cobi.py watch --dirs output --source_vtp output/Cells_0_0.vtp
+    python3 cobi.py <command> -h
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import sys
+import argparse
+import importlib
+
+# subcommand: module with main(argv, prog), help
+COMMANDS = {
+    "solver-flatten": (
+        "flatter_solver_output",
+        "Flatten the solver outputs (Cells_*.txt) into profiles to fit",
+    ),
+    "set-cell-type": (
+        "set_cell_id_within_box",
+        "Set the cell type of the cells within a box or regions of a vtp",
+    ),
+    "cell-rules": (
+        "celltype_rules",
+        "Apply a rule file of cell type edits to many vtp",
+    ),
+    "move": (
+        "transform_vtp",
+        "Translate, rotate, scale or mirror many vtp",
+    ),
+    "plot-dir": (
+        "plot_vtp_over_dir",
+        "Plot the cell type of every timestep of a reporter output dir",
+    ),
+    "fit": (
+        "batch_fit",
+        "Fit the Cells_*_to_fit.txt profiles of every timestep",
+    ),
+    "readout": (
+        "cell_readout",
+        "Mean, max and variance of the concentration in every cell",
+    ),
+    "init-cell": (
+        "write_init_cond_lbibcell",
+        "Write the initial cells (or a tissue) and parameters for LBIBCell",
+    ),
+    "bootstrap": (
+        "bootstrap_fit",
+        "Confidence intervals of C0, lambda and b of Cells_*_to_fit.txt profiles",
+    ),
+    "watch": (
+        "watch_solver_out",
+        "Process the solver outputs (Cells_*.txt) while LBIBCell is running",
+    ),
+    "pack-run": (
+        "run_store",
+        "Pack a LBIBCell run into one chunked compressed store",
+    ),
+    "benchmark": (
+        "benchmark",
+        "Benchmark the scripts on synthetic LBIBCell data",
+    ),
+}
+
+
+def run(command, argv=None):
+    """Import the module of a subcommand and run its main()"""
+    module_name, _ = COMMANDS[command]
+    module = importlib.import_module(module_name)
+
+    return module.main(argv, prog="cobi {}".format(command))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    parser = argparse.ArgumentParser(
+        prog="cobi",
+        description="Pre- and post-processing of LBIBCell simulations",
+        epilog="\n".join(
+            "  {:<16}{}".format(command, help)
+            for command, (_, help) in COMMANDS.items()
+        ),
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "command", choices=list(COMMANDS), metavar="command", help="See below"
+    )
+    # only the command is parsed here, the rest goes to its own parser
+    args = parser.parse_args(argv[:1])
+
+    return run(args.command, argv[1:])
+
+
+if __name__ == "__main__":
+    main()
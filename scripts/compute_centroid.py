@@ -1,52 +1,35 @@
 import numpy as np
-from vtk import vtkXMLPolyDataReader
-from vtk.util.numpy_support import vtk_to_numpy
 
-# Now only works with convex polygon
+from cell_geometry import CellArrays, cell_arrays, cells_all_type, polygon_properties
+from vtk_io import read_polydata
 
 
 def calculate_centeroid_np(cell):
+    from vtk.util.numpy_support import vtk_to_numpy
+
     # conver vtk polygon cooridinates to array
     coor = vtk_to_numpy(cell.GetPoints().GetData())
 
+    # area weighted, also for non-convex polygon
     length = coor.shape[0]
-    sum_x = np.sum(coor[:, 0])
-    sum_y = np.sum(coor[:, 1])
-    return sum_x / length, sum_y / length
+    props = polygon_properties(
+        CellArrays(coor, np.arange(length), np.array([0, length]))
+    )
+    return props["centroid_x"][0], props["centroid_y"][0]
 
 
 def center_centroid_celltype_id(celltype_id, input_file):
-    reader = vtkXMLPolyDataReader()
-    reader.SetFileName(input_file)
-    reader.Update()
-    polyData = reader.GetOutput()
-    polyDataPointData = polyData.GetPointData()
-    # change only this
-    cell_type = polyDataPointData.GetArray("cell_type")
-
-    nbOfCells = polyData.GetNumberOfPolys()
-    count = 0
-
-    centroid_x, centroid_y = [], []
-
-    for i in range(nbOfCells):
-        cell = polyData.GetCell(i)
-        # make sure the celltype_id is correct
-        nbOfPoints = cell.GetNumberOfPoints()
-        is_celltype_id = True
-        for i in range(nbOfPoints):
-            Id = cell.GetPointIds().GetId(i)
-            if cell_type.GetValue(Id) != celltype_id:
-                is_celltype_id = False
-                break
-
-        if is_celltype_id:
-            x, y = calculate_centeroid_np(cell)
-            centroid_x.append(x)
-            centroid_y.append(y)
-            count += 1
+    cells = cell_arrays(read_polydata(input_file))
+
+    # make sure the celltype_id is correct for all points of a cell
+    is_celltype_id = cells_all_type(cells, celltype_id)
+    count = np.count_nonzero(is_celltype_id)
 
     print("{} cells are type: {}".format(count, celltype_id))
-    centroids = np.array([centroid_x, centroid_y], dtype=np.float32)
+    props = polygon_properties(cells)
+    centroids = np.array(
+        [props["centroid_x"][is_celltype_id], props["centroid_y"][is_celltype_id]],
+        dtype=np.float32,
+    )
 
     return centroids
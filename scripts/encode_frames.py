@@ -0,0 +1,172 @@
+"""
+encode_frames
+
+Stream rendered frames (RGB arrays) straight into ffmpeg and get the mp4 and
+the palette optimized gif out of a single pass, replacing the chain of
+convert_mp4_from_euler.sh and gifenc.sh (PNG -> mp4 -> palette -> gif).
+
+No PNG nor temp. dir is written: the frames go through a pipe, the gif
+palette is generated inside the same ffmpeg filter graph. Note that
+palettegen needs all frames before the gif is written, so ffmpeg buffers
+the gif branch in memory until the last frame.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import shutil
+import subprocess
+import numpy as np
+
+
+def check_ffmpeg():
+    """Raise OSError if ffmpeg is not in PATH, before any frame is rendered"""
+    if shutil.which("ffmpeg") is None:
+        raise OSError("ffmpeg not found in PATH, install it to encode movies")
+
+
+class FrameEncoder:
+    """Encode frames into <output>.mp4 and <output>.gif through one ffmpeg
+
+    Parameters
+    ----------
+    output : str
+        Output path without extension, i.e. fig/shh_gradient_100_out
+    fps : int, optional
+        Frame rate of the input frames, by default 10
+    mp4 : bool, optional
+        Write <output>.mp4, by default True
+    gif : bool, optional
+        Write <output>.gif, by default True
+    gif_width : int, optional
+        Horizontal resolution of the gif, by default 500 (as gifenc.sh)
+    gif_fps : int, optional
+        Frame rate of the gif, by default same as fps
+
+    Examples
+    --------
+    >>> with FrameEncoder("shh_gradient_100_out", fps=10) as encoder:
+    ...     for img in frames:
+    ...         encoder.write(img)
+    """
+
+    def __init__(self, output, fps=10, mp4=True, gif=True, gif_width=500, gif_fps=None):
+        if not mp4 and not gif:
+            raise ValueError("Nothing to encode, enable mp4 or gif")
+        check_ffmpeg()
+
+        self.output = output
+        self.fps = fps
+        self.mp4 = mp4
+        self.gif = gif
+        self.gif_width = gif_width
+        self.gif_fps = gif_fps or fps
+        self.n_frames = 0
+        self._shape = None
+        self._proc = None
+
+    def _command(self, width, height):
+        branches = []
+        if self.mp4:
+            branches.append("mp4")
+        if self.gif:
+            branches.append("gif")
+
+        graph = [
+            "[0:v]split={:d}{}".format(
+                len(branches), "".join("[{}_in]".format(b) for b in branches)
+            )
+        ]
+        if self.mp4:
+            # yuv420p needs even width and height
+            graph.append("[mp4_in]pad=ceil(iw/2)*2:ceil(ih/2)*2[mp4]")
+        if self.gif:
+            graph.append(
+                "[gif_in]fps={:d},scale={:d}:-1:flags=lanczos,split[g1][g2]".format(
+                    self.gif_fps, self.gif_width
+                )
+            )
+            graph.append("[g1]palettegen[palette]")
+            graph.append("[g2][palette]paletteuse[gif]")
+
+        cmd = [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-s",
+            "{:d}x{:d}".format(width, height),
+            "-framerate",
+            str(self.fps),
+            "-i",
+            "-",
+            "-filter_complex",
+            ";".join(graph),
+        ]
+        if self.mp4:
+            cmd += [
+                "-map",
+                "[mp4]",
+                "-c:v",
+                "libx264",
+                "-pix_fmt",
+                "yuv420p",
+                "{}.mp4".format(self.output),
+            ]
+        if self.gif:
+            cmd += ["-map", "[gif]", "-loop", "0", "{}.gif".format(self.output)]
+
+        return cmd
+
+    def write(self, img):
+        """Append a frame, (height, width, 3 or 4) uint8"""
+        img = np.asarray(img)
+        if img.ndim != 3 or img.shape[2] not in (3, 4):
+            raise ValueError("Frame should be (height, width, 3 or 4)")
+        img = img[:, :, :3]
+        if img.dtype != np.uint8:
+            img = np.clip(img, 0, 255).astype(np.uint8)
+
+        if self._proc is None:
+            self._shape = img.shape
+            self._proc = subprocess.Popen(
+                self._command(img.shape[1], img.shape[0]),
+                stdin=subprocess.PIPE,
+            )
+        elif img.shape != self._shape:
+            raise ValueError(
+                "Frame {} has shape {}, expected {}".format(
+                    self.n_frames, img.shape, self._shape
+                )
+            )
+
+        self._proc.stdin.write(np.ascontiguousarray(img).tobytes())
+        self.n_frames += 1
+
+    def close(self):
+        """Flush the frames and wait for ffmpeg"""
+        if self._proc is None:
+            return
+        self._proc.stdin.close()
+        if self._proc.wait() != 0:
+            raise RuntimeError(
+                "ffmpeg failed encoding {} ({:d} frames)".format(
+                    self.output, self.n_frames
+                )
+            )
+        self._proc = None
+        print("Encoded {:d} frames into {}".format(self.n_frames, self.output))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None and self._proc is not None:
+            # stop ffmpeg, the movie of a failed render is not finalized
+            self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+            return
+        self.close()
@@ -6,32 +6,83 @@ Fit the solver output from LBIBCell against exponetial decay function: $ C(x) =
 Author: Yongqi Wang <wangyong@student.ethz.ch>
 """
 import numpy as np
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
+
+from instrument import instrumented
+
+# starting C0, k, b of the fit when the profile gives nothing better
+P0 = (1, 2, 1.0)
+
+
+def _one_minus_exp(a):
+    """1 - exp(-a) without cancellation for small a"""
+    return -np.expm1(-a)
+
+
+def shh_read_out_analytic_sol_inf_np(x, p, d, Lf, Lt, k):
+    """Vectorized shh_read_out_analytic_sol_inf
+
+    All arguments broadcast against each other, i.e. x of shape (n,) and the
+    parameters of shape (m, 1) give (m, n). The sinh/cosh are written as
+    decaying exponentials, so it holds for large Lt * k. Outside of
+    0 <= x <= Lt the readout is NaN.
+    """
+    x, p, d, Lf, Lt, k = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (x, p, d, Lf, Lt, k))
+    )
+    with np.errstate(over="ignore", invalid="ignore"):
+        # 1 - exp(-Lf k) cosh(x k)
+        inner = 1 - 0.5 * (np.exp((x - Lf) * k) + np.exp(-(x + Lf) * k))
+        # sinh(Lf k) exp(-x k)
+        outer = 0.5 * (np.exp((Lf - x) * k) - np.exp(-(Lf + x) * k))
+        readout = p / d * np.where(x <= Lf, inner, outer)
+
+    return np.where((x >= 0) & (x <= Lt), readout, np.nan)
+
+
+def shh_read_out_analytic_sol_np(x, p, d, Lf, Lt, k):
+    """Vectorized shh_read_out_analytic_sol
+
+    All arguments broadcast against each other, i.e. x of shape (n,) and the
+    parameters of shape (m, 1) give (m, n). With sinh(a) / sinh(b) written as
+    exp(a - b) (1 - exp(-2a)) / (1 - exp(-2b)) every exponent is <= 0, so it
+    holds for large Lt * k. Outside of 0 <= x <= Lt the readout is NaN.
+    """
+    x, p, d, Lf, Lt, k = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (x, p, d, Lf, Lt, k))
+    )
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        denom = _one_minus_exp(2 * Lt * k)
+        # sinh((Lt - Lf) k) cosh(x k) / sinh(Lt k), x <= Lf
+        inner = (
+            0.5
+            * np.exp((x - Lf) * k)
+            * _one_minus_exp(2 * (Lt - Lf) * k)
+            * (1 + np.exp(-2 * x * k))
+            / denom
+        )
+        # sinh(Lf k) cosh((Lt - x) k) / sinh(Lt k), x > Lf
+        outer = (
+            0.5
+            * np.exp((Lf - x) * k)
+            * _one_minus_exp(2 * Lf * k)
+            * (1 + np.exp(-2 * (Lt - x) * k))
+            / denom
+        )
+        readout = p / d * np.where(x <= Lf, 1 - inner, outer)
+
+    return np.where((x >= 0) & (x <= Lt), readout, np.nan)
 
 
 def shh_read_out_analytic_sol_inf(x, p, d, Lf, Lt, k):
     # k is the inverse of lambda
     assert x >= 0 and x <= Lt
-    readout = 0
-    if x <= Lf:
-        readout = p / d * (1 - np.exp(-Lf * k) * np.cosh(x * k))
-    else:
-        readout = p / d * np.sinh(Lf * k) * np.exp(-x * k)
-    return readout
+    return float(shh_read_out_analytic_sol_inf_np(x, p, d, Lf, Lt, k))
 
 
 def shh_read_out_analytic_sol(x, p, d, Lf, Lt, k):
     # k is the inverse of lambda
     assert x >= 0 and x <= Lt
-    readout = 0
-    if x <= Lf:
-        readout = (
-            p / d * (1 + np.sinh((Lf - Lt) * k) / np.sinh(Lt * k) * np.cosh(x * k))
-        )
-    else:
-        readout = p / d * np.sinh(Lf * k) / np.sinh(Lt * k) * np.cosh((Lt - x) * k)
-    return readout
+    return float(shh_read_out_analytic_sol_np(x, p, d, Lf, Lt, k))
 
 
 # Some aux. function
@@ -60,19 +111,129 @@ def model_func(x, c0, k, b):
     return c0 * np.exp(-k * x) + b
 
 
-def fit_exp(x, y, p0=(1, 2, 1.0)):
-    # p0 # starting search koefs
-    popt, pcov = curve_fit(model_func, x, y, p0, maxfev=5000)
+def model_jac(x, c0, k, b):
+    # analytic jacobian of model_func over (c0, k, b)
+    decay = np.exp(-k * x)
+    return np.stack((decay, -c0 * x * decay, np.ones_like(decay)), axis=-1)
+
+
+def init_exp(x, y, tail=0.2, n_iter=3):
+    """Closed-form estimate of C0, k, b for model_func
+
+    The baseline b is first taken from the tail of the profile, k and C0
+    from a linear regression on log(y - b) weighted by (y - b)^2 (the
+    variance of the log grows as 1 / (y - b)^2). C0 and b are then refined
+    by linear least squares at fixed k, and the regression repeated with the
+    new b. Good enough for a quick look and as p0 of fit_exp.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Positions
+    y : np.ndarray
+        Profile, NaN are left out
+    tail : float, optional
+        Fraction of the largest x used for the first baseline, by default 0.2
+    n_iter : int, optional
+        Number of log regressions, by default 3
+
+    Returns
+    -------
+    tuple of float
+        C0, k, b, NaN if the profile does not decay
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    if x.size < 3:
+        return np.nan, np.nan, np.nan
+
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    n_tail = max(int(np.ceil(tail * x.size)), 1)
+    b = np.median(y[-n_tail:])
+    noise = np.std(y[-n_tail:])
+    c0, k = np.nan, np.nan
+
+    for _ in range(n_iter):
+        dy = y - b
+        scale = np.max(dy)
+        if not scale > 0:
+            break
+        # points lost in the noise of the baseline have no say
+        used = dy > max(3 * noise, 1e-3 * scale)
+        if np.count_nonzero(used) < 2:
+            break
+        w = dy[used] ** 2
+        xw = np.average(x[used], weights=w)
+        lw = np.average(np.log(dy[used]), weights=w)
+        var = np.sum(w * (x[used] - xw) ** 2)
+        if not var > 0:
+            break
+        slope = np.sum(w * (x[used] - xw) * (np.log(dy[used]) - lw)) / var
+        if not slope < 0:
+            break
+        k = -slope
+
+        # C0 and b are linear at fixed k
+        decay = np.exp(-k * (x - x[0]))
+        (c0, b), *_ = np.linalg.lstsq(
+            np.stack((decay, np.ones_like(decay)), axis=1), y, rcond=None
+        )
+        c0 *= np.exp(k * x[0])
+
+    return c0, k, b
+
+
+@instrumented("fit")
+def fit_exp(x, y, p0=None, full_output=False):
+    """Fit model_func to a profile
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        Profile
+    p0 : tuple of float, optional
+        Starting C0, k, b, by default init_exp(x, y) (or P0 if the
+        profile does not decay)
+    full_output : bool, optional
+        Also return the number of function evaluations, by default False
+    """
+    from scipy.optimize import curve_fit
+
+    if p0 is None:
+        p0 = init_exp(x, y)
+        if not np.all(np.isfinite(p0)):
+            p0 = P0
+    popt, pcov, info, _, _ = curve_fit(
+        model_func, x, y, p0, jac=model_jac, maxfev=5000, full_output=True
+    )
+    if full_output:
+        return popt, info["nfev"]
     return popt
 
 
-def plot_and_fit(x, y, label, filename=None, log=False, anl_param=None):
+def plot_and_fit(
+    x, y, label, filename=None, log=False, anl_param=None, popt=None, ci=None
+):
+    # matplotlib only when plotting, fitting alone does not need it
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
     ax.scatter(x, y, label=label, s=2.4, alpha=0.9, c="lightsteelblue")
-    popt = fit_exp(x, y)
+    if popt is None:
+        popt = fit_exp(x, y)
     x_fit = np.linspace(0, 1000, 250)
     y_fit = model_func(x_fit, popt[0], popt[1], popt[2])
     print("C0={:.4f}  Lambda={:.4f} b={:.4f}".format(popt[0], 1 / popt[1], popt[2]))
+    if ci:
+        # i.e. bootstrap_fit(x, y)["ci"]
+        print(
+            "CI: C0=[{:.4f}, {:.4f}]  Lambda=[{:.4f}, {:.4f}] b=[{:.4f}, {:.4f}]".format(
+                *ci["c0"], *ci["lam"], *ci["b"]
+            )
+        )
     fit_label = "C(x) = {:.4f} * exp(-x / {:.4f}) + {:.4f}".format(
         popt[0], 1 / popt[1], popt[2]
     )
@@ -81,11 +242,9 @@ def plot_and_fit(x, y, label, filename=None, log=False, anl_param=None):
         ax.set_yscale("log")
 
     if anl_param:
-        y_anl = np.zeros_like(x_fit)
         p, d, Lf, Lt = anl_param
         k = popt[1]
-        for i in range(x_fit.shape[0]):
-            y_anl[i] = shh_read_out_analytic_sol_inf(x_fit[i], p, d, Lf, Lt, k)
+        y_anl = shh_read_out_analytic_sol_inf_np(x_fit, p, d, Lf, Lt, k)
 
         ax.plot(x_fit, y_anl, label="Analtic solution", c="seagreen", linestyle="--")
 
@@ -93,3 +252,58 @@ def plot_and_fit(x, y, label, filename=None, log=False, anl_param=None):
     if filename:
         fig.savefig("{}.png".format(filename), dpi=200)
         print("Fig saved to {}.png".format(filename))
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    import warnings
+    from glob import glob
+
+    from instrument import add_instrument_arguments, configure_from_args
+
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        description="Compare the closed-form init_exp against the fixed P0 as starting point of fit_exp",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        required=True,
+        help="Directory with Cells_*_to_fit.txt (from flatter_solver_output.py)",
+    )
+    add_instrument_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    files = sorted(glob("{}/Cells_*_to_fit.txt".format(args.input_dir)))
+    if not files:
+        print("No Cells_*_to_fit.txt found in {}".format(args.input_dir))
+        sys.exit(1)
+
+    total_init, total_p0 = 0, 0
+    print("file, lambda init, lambda fit, nfev init, nfev P0")
+    for file in files:
+        to_fit = np.loadtxt(file, delimiter=",", ndmin=2)
+        x, y = to_fit[:, 0], to_fit[:, 1]
+        x, y = x[x > 0], y[x > 0]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            try:
+                popt, nfev_init = fit_exp(x, y, full_output=True)
+                _, nfev_p0 = fit_exp(x, y, p0=P0, full_output=True)
+            except RuntimeError:
+                print("{}, fit failed".format(file))
+                continue
+        total_init += nfev_init
+        total_p0 += nfev_p0
+        print(
+            "{}, {:.4f}, {:.4f}, {:d}, {:d}".format(
+                file, 1 / init_exp(x, y)[1], 1 / popt[1], nfev_init, nfev_p0
+            )
+        )
+
+    print(
+        "Function evaluations: {:d} (init_exp), {:d} (P0)".format(total_init, total_p0)
+    )
@@ -1,57 +1,43 @@
 import os
 import sys
+import time
+import argparse
 import numpy as np
-import glob
-import matplotlib.pyplot as plt
-from vtk import vtkXMLPolyDataReader
-from vtk.util.numpy_support import vtk_to_numpy
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 
+from encode_frames import FrameEncoder, check_ffmpeg
+from cell_geometry import cell_arrays, cells_all_type, polygon_properties
+from vtk_io import read_polydata
+from solver_io import load_solver_field, chunked_mean, discover_solver_out
+from instrument import stage, add_instrument_arguments, configure_from_args
 
-def calculate_centeroid_np(cell):
-    # conver vtk polygon cooridinates to array
-    coor = vtk_to_numpy(cell.GetPoints().GetData())
-
-    length = coor.shape[0]
-    sum_x = np.sum(coor[:, 0])
-    sum_y = np.sum(coor[:, 1])
-    return sum_x / length, sum_y / length
+FILE_DIR = [
+    "../../local/input_geo_175cells",
+    "../../local/input_geo_474cells",
+    "../../local/input_geo_51cells",
+]
+SOURCE_VTP = [
+    "vtk/test_100_175cells.vtp",
+    "vtk/test_200_474cells.vtp",
+    "vtk/test_50_21cells.vtp",
+]
 
 
 def center_centroid_celltype_id(celltype_id, input_file):
-    reader = vtkXMLPolyDataReader()
-    reader.SetFileName(input_file)
-    reader.Update()
-    polyData = reader.GetOutput()
-    polyDataPointData = polyData.GetPointData()
-    # change only this
-    cell_type = polyDataPointData.GetArray("cell_type")
-
-    nbOfCells = polyData.GetNumberOfPolys()
-    count = 0
-
-    centroid_x, centroid_y = [], []
-
-    tmp = []
-
-    for i in range(nbOfCells):
-        cell = polyData.GetCell(i)
-        # make sure the celltype_id is correct
-        nbOfPoints = cell.GetNumberOfPoints()
-        is_celltype_id = True
-        for i in range(nbOfPoints):
-            Id = cell.GetPointIds().GetId(i)
-            if cell_type.GetValue(Id) != celltype_id:
-                is_celltype_id = False
-                break  # to next cell if there's a single mismatch on Ids
-
-        if not is_celltype_id:
-            tmp.append(i)
-            x, y = calculate_centeroid_np(cell)
-            centroid_x.append(x)
-            centroid_y.append(y)
-            count += 1
-
-    centeroids = np.array([centroid_x, centroid_y], dtype=np.float32)
+    cells = cell_arrays(read_polydata(input_file))
+
+    # a single mismatch on Ids excludes the cell from celltype_id
+    is_celltype_id = cells_all_type(cells, celltype_id)
+    nbOfCells = cells.n_cells
+
+    with stage("centroid", file=input_file):
+        props = polygon_properties(cells)
+    centeroids = np.array(
+        [props["centroid_x"][~is_celltype_id], props["centroid_y"][~is_celltype_id]],
+        dtype=np.float32,
+    )
+    count = centeroids.shape[1]
 
     print("{:d} of {:d} cells are type: {:.1f}".format(count, nbOfCells, celltype_id))
 
@@ -60,77 +46,365 @@ def center_centroid_celltype_id(celltype_id, input_file):
     return centeroids_avg
 
 
-def read_solver_out_flat(filename, save_img=False, pic_name=None):
+def read_solver_out_flat(
+    filename,
+    save_img=False,
+    pic_name=None,
+    cache_dir=None,
+    max_cache_bytes=None,
+    shape=None,
+    dtype=float,
+    fill_value=0.0,
+    return_img=False,
+):
+    """Mean along y of the lattice of a solver output
 
+    Raises
+    ------
+    OSError
+        If filename cannot be opened
+    ValueError
+        If filename is not a valid solver output
+    """
     try:
-        f_out = open(filename, "r")
-    except IOError:
-        print("Output file {} cannot be opened".format(filename))
-        sys.exit(1)
+        # <name>.npy is reused on the next run if filename is unchanged
+        with stage("parse", file=filename):
+            arr = load_solver_field(
+                filename,
+                shape=shape,
+                dtype=dtype,
+                fill_value=fill_value,
+                cache_dir=cache_dir,
+                max_cache_bytes=max_cache_bytes,
+            )
+    except OSError as err:
+        # raised to the caller, a worker of a batch fails alone
+        raise OSError(
+            "Output file {} cannot be opened: {}".format(filename, err)
+        ) from err
 
-    arr = np.ndarray((1000, 1000), dtype=float)
+    # mean along y axis, average over x = [1, 1000]
+    with stage("mean", file=filename):
+        mean = chunked_mean(arr, axis=1, ignore_nan=np.isnan(fill_value))
+    if save_img or return_img:
+        with stage("render", file=filename):
+            img = render_contour(arr, pic_name if save_img else None, return_img)
+        if return_img:
+            return mean, img
+
+    return mean
 
-    for line in f_out.readlines():
-        line_list = line.rstrip("\n").split("\t")
-        print(line_list)
-        x = int(line_list[0])
-        y = int(line_list[1])
-        print(x, y)
-        c = line_list[5]
-        arr[x, y] = c
 
-    f_out.close()
-    filename_no_ext, _ = os.path.splitext(filename)
-    np.save("{}.npy".format(filename_no_ext), arr)  # save binary file for future
+def render_contour(arr, pic_name=None, return_img=False):
+    """Contour plot of the lattice, saved to pic_name and/or returned as RGB"""
+    import matplotlib.pyplot as plt
 
-    # mean along y axis, average over x = [1, 1000]
-    mean = np.mean(arr, axis=1)
-    if save_img:
-        fig, ax = plt.subplots(1, figsize=[3, 3])
-        x = np.linspace(0, 999, 1000, dtype=int)
-        y = np.linspace(0, 999, 1000, dtype=int)
-        X, Y = np.meshgrid(x, y)
-        ax.set_axis_off()
-        ax.contour(X, Y, arr)
+    fig, ax = plt.subplots(1, figsize=[3, 3], dpi=300)
+    ax.set_axis_off()
+    # same as contour over meshgrid(x, y), without the full coordinate grids
+    ax.contour(arr)
+    if pic_name:
         fig.savefig(pic_name, dpi=300)
-        fig.clear()
+    img = None
+    if return_img:
+        fig.canvas.draw()
+        img = np.array(fig.canvas.buffer_rgba())[:, :, :3]
+    plt.close(fig)
 
-    return mean
+    return img
 
 
-file_dir = [
-    "../../local/input_geo_175cells",
-    "../../local/input_geo_474cells",
-    "../../local/input_geo_51cells",
-]
-source_vtp = [
-    "vtk/test_100_175cells.vtp",
-    "vtk/test_200_474cells.vtp",
-    "vtk/test_50_21cells.vtp",
-]
+def get_source_mean(source_vtp, source_csv="source_mean.csv"):
+    if not os.path.exists(source_csv):
+        source_mean = np.ndarray((len(source_vtp), 2))
+        for i in range(len(source_vtp)):
+            source_mean[i] = center_centroid_celltype_id(1.0, source_vtp[i])
+
+        np.savetxt(source_csv, source_mean, delimiter=",")
+    else:
+        source_mean = np.loadtxt(source_csv, dtype=float, delimiter=",", ndmin=2)
+
+    return source_mean
+
 
-if not os.path.exists("source_mean.csv"):
-    source_mean = np.ndarray((len(source_vtp), 2))
-    for i in range(len(source_vtp)):
-        source_mean[i] = center_centroid_celltype_id(1.0, source_vtp[i])
-
-    np.savetxt("source_mean.csv", source_mean, delimiter=",")
-else:
-    source_mean = np.loadtxt("source_mean.csv", dtype=float, delimiter=",")
-
-for i in range(len(file_dir)):
-    dir = file_dir[i]
-    mean_y = source_mean[i, 1]
-
-    for file in glob.glob("{}/Cells_*.txt".format(dir)):
-        filename, file_extension = os.path.splitext(file)
-        print("Reading concentration from {}".format(file))
-        out_name = os.path.join("{}_to_fit.txt".format(filename))
-        pic_name = os.path.join("{}_c.png".format(filename))
-
-        print("Saving contour plot from {}".format(pic_name))
-        y = read_solver_out_flat(file, True, pic_name)
-        x = np.arange(1000) - mean_y
-        to_fit = np.stack((x, y), axis=1)
-        print("Saving values for fitting from {}".format(out_name))
+def process_solver_out(
+    file,
+    mean_y,
+    save_img=True,
+    cache_dir=None,
+    max_cache_bytes=None,
+    dtype=float,
+    return_img=False,
+):
+    """Write the contour plot and the profile to fit of one solver output
+
+    Parameters
+    ----------
+    file : str
+        Path to the solver output, i.e. Cells_4000.txt
+    mean_y : float
+        Y coordinate of the source centroid, the profile is shifted by it
+    return_img : bool, optional
+        Also return the contour plot as RGB, by default False
+
+    Returns
+    -------
+    file : str
+        Path to the solver output
+    elapsed : float
+        Time spent in seconds
+    img : np.ndarray
+        Only with return_img, contour plot as RGB
+    """
+    start = time.time()
+    filename, file_extension = os.path.splitext(file)
+    out_name = os.path.join("{}_to_fit.txt".format(filename))
+    pic_name = os.path.join("{}_c.png".format(filename))
+
+    y = read_solver_out_flat(
+        file,
+        save_img,
+        pic_name,
+        cache_dir=cache_dir,
+        max_cache_bytes=max_cache_bytes,
+        dtype=dtype,
+        return_img=return_img,
+    )
+    if return_img:
+        y, img = y
+    x = np.arange(y.shape[0]) - mean_y
+    to_fit = np.stack((x, y), axis=1)
+    with stage("savetxt", file=out_name):
         np.savetxt(out_name, to_fit, delimiter=",", fmt=["%.18e", "%.18e"])
+
+    if return_img:
+        return file, time.time() - start, img
+
+    return file, time.time() - start
+
+
+def encode_contour_movies(file_dir, source_mean, workers=None, fps=10, **kwargs):
+    """Stream the contour plots of every directory into <dir>/contour.mp4|gif
+
+    The solver outputs are processed in timestep order by a pool of
+    processes, the frames go straight into FrameEncoder without saving PNGs.
+
+    Parameters
+    ----------
+    file_dir : list of str
+        Directories with the solver outputs
+    source_mean : np.ndarray
+        Source centroid of every directory
+    workers : int, optional
+        Number of processes, by default os.cpu_count()
+    fps : int, optional
+        Frame rate of the movies, by default 10
+    **kwargs
+        Passed to process_solver_out
+
+    Returns
+    -------
+    list of str
+        Path to the solver outputs failed, left out of the movies
+
+    Raises
+    ------
+    OSError
+        If ffmpeg is not in PATH, checked before any solver output is read
+    """
+    # before any render is spent
+    check_ffmpeg()
+    kwargs["save_img"] = False
+    kwargs["return_img"] = True
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for i in range(len(file_dir)):
+            files = [file for _, file in discover_solver_out(file_dir[i])]
+            if not files:
+                print("No solver output found in {}".format(file_dir[i]))
+                continue
+            task = partial(process_solver_out, mean_y=source_mean[i, 1], **kwargs)
+            futures = [(file, executor.submit(task, file)) for file in files]
+            with FrameEncoder(os.path.join(file_dir[i], "contour"), fps=fps) as encoder:
+                # in timestep order, a failed frame is skipped
+                for file, future in futures:
+                    try:
+                        _, elapsed, img = future.result()
+                    except Exception as err:
+                        failed.append(file)
+                        print("{} failed: {}".format(file, err))
+                        continue
+                    print("{} done in {:.2f}s".format(file, elapsed))
+                    encoder.write(img)
+
+    return failed
+
+
+def schedule_solver_out(file_dir, source_mean):
+    """List the solver outputs of all directories, balanced across directories
+
+    The files are sorted from the largest, so the long jobs start first and
+    the directories are interleaved for the same size.
+
+    Returns
+    -------
+    list of (str, float, int)
+        Path to the solver output, y of the source centroid and its size
+    """
+    jobs = []
+    for i in range(len(file_dir)):
+        files = [file for _, file in discover_solver_out(file_dir[i])]
+        if not files:
+            print("No solver output found in {}".format(file_dir[i]))
+        for rank, file in enumerate(files):
+            jobs.append((rank, file, source_mean[i, 1], os.path.getsize(file)))
+
+    jobs.sort(key=lambda job: (-job[3], job[0]))
+
+    return [(file, mean_y, size) for _, file, mean_y, size in jobs]
+
+
+def run_batch(jobs, workers=None, **kwargs):
+    """Process the solver outputs in a pool of processes
+
+    Parameters
+    ----------
+    jobs : list of (str, float, int)
+        See schedule_solver_out
+    workers : int, optional
+        Number of processes, by default os.cpu_count()
+    **kwargs
+        Passed to process_solver_out
+
+    Returns
+    -------
+    list of str
+        Path to the solver outputs failed
+    """
+    total_bytes = sum(size for _, _, size in jobs)
+    failed = []
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_solver_out, file, mean_y, **kwargs): file
+            for file, mean_y, _ in jobs
+        }
+        for count, future in enumerate(as_completed(futures), 1):
+            file = futures[future]
+            try:
+                _, elapsed = future.result()
+                print(
+                    "[{:d}/{:d}] {} done in {:.2f}s".format(
+                        count, len(jobs), file, elapsed
+                    )
+                )
+            except Exception as err:
+                failed.append(file)
+                print("[{:d}/{:d}] {} failed: {}".format(count, len(jobs), file, err))
+
+    elapsed = max(time.time() - start, 1e-9)
+    print(
+        "{:d} files ({:.1f} MB) in {:.1f}s: {:.2f} files/s, {:.1f} MB/s, {:d} failed".format(
+            len(jobs),
+            total_bytes / 1e6,
+            elapsed,
+            len(jobs) / elapsed,
+            total_bytes / 1e6 / elapsed,
+            len(failed),
+        )
+    )
+
+    return failed
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Flatten the LBIBCell solver outputs (Cells_*.txt) into profiles to fit",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--dirs",
+        type=str,
+        nargs="+",
+        default=FILE_DIR,
+        help="Directories with the solver outputs",
+    )
+    parser.add_argument(
+        "--source_vtp",
+        type=str,
+        nargs="+",
+        default=SOURCE_VTP,
+        help="Initial vtp of each directory, the source are cells of type 1",
+    )
+    parser.add_argument(
+        "--source_csv",
+        type=str,
+        default="source_mean.csv",
+        help="Source centroids, computed from --source_vtp if not existing",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="Number of processes"
+    )
+    parser.add_argument(
+        "--no_img", action="store_true", help="Do not save the contour plots"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Directory of the .npy cache, by default next to the solver outputs",
+    )
+    parser.add_argument(
+        "--max_cache_mb",
+        type=float,
+        default=None,
+        help="Size limit of --cache_dir in MB",
+    )
+    parser.add_argument(
+        "--float32", action="store_true", help="Store the lattice as float32"
+    )
+    parser.add_argument(
+        "--movie",
+        action="store_true",
+        help="Stream the contour plots into <dir>/contour.mp4 and .gif, no PNG",
+    )
+    parser.add_argument("--fps", type=int, default=10, help="Frame rate of --movie")
+    add_instrument_arguments(parser)
+    args = parser.parse_args(argv)
+    configure_from_args(args)
+
+    if len(args.dirs) != len(args.source_vtp):
+        print("--dirs and --source_vtp should have the same length")
+        sys.exit(1)
+
+    source_mean = get_source_mean(args.source_vtp, args.source_csv)
+    if source_mean.shape[0] != len(args.dirs):
+        print("{} does not match --dirs, remove it first".format(args.source_csv))
+        sys.exit(1)
+
+    options = dict(
+        cache_dir=args.cache_dir,
+        max_cache_bytes=None
+        if args.max_cache_mb is None
+        else int(args.max_cache_mb * 1e6),
+        dtype=np.float32 if args.float32 else float,
+    )
+    if args.movie:
+        try:
+            failed = encode_contour_movies(
+                args.dirs, source_mean, args.workers, args.fps, **options
+            )
+        except OSError as err:
+            print(err)
+            sys.exit(1)
+    else:
+        jobs = schedule_solver_out(args.dirs, source_mean)
+        failed = run_batch(jobs, args.workers, save_img=not args.no_img, **options)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+instrument
+
+Per-stage timing and memory records of the analysis scripts. A stage is a
+block of work on one file, i.e. parsing a solver output or rendering a
+contour plot:
+
+    with stage("parse", file=filename):
+        arr = load_solver_field(filename)
+
+    @instrumented("fit")
+    def fit_exp(x, y): ...
+
+Every stage appends one JSON line with its wall time, CPU time, peak RSS
+(of the process so far) and the bytes read and written (from /proc/self/io,
+Linux only) to the log. Optionally every stage is profiled by cProfile and
+dumped to <profile_dir>/<stage>-<pid>-<n>.prof.
+
+Nothing is recorded until a log is set, by configure() or the environment
+variables LBIBCELL_INSTRUMENT_LOG and LBIBCELL_INSTRUMENT_PROFILE_DIR.
+configure() sets them too, so the worker processes of a pool record into
+the same log.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import json
+import time
+import functools
+import itertools
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not on Windows
+    resource = None
+
+LOG_ENV = "LBIBCELL_INSTRUMENT_LOG"
+PROFILE_DIR_ENV = "LBIBCELL_INSTRUMENT_PROFILE_DIR"
+
+_counter = itertools.count()
+
+
+def configure(log=None, profile_dir=None):
+    """Set the JSON lines log and the cProfile dump dir, None to disable"""
+    for env, value in ((LOG_ENV, log), (PROFILE_DIR_ENV, profile_dir)):
+        if value:
+            os.environ[env] = os.path.abspath(value)
+        else:
+            os.environ.pop(env, None)
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def enabled():
+    """Whether the stages are recorded"""
+    return bool(os.environ.get(LOG_ENV))
+
+
+def _io_bytes():
+    """Bytes read and written by the process so far, None if unknown"""
+    try:
+        with open("/proc/self/io") as f_in:
+            fields = dict(line.split(":") for line in f_in)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def stage(name, file=None, **tags):
+    """Record the block as the stage name, on file if given
+
+    Extra keyword arguments are written into the record as they are.
+    """
+    log = os.environ.get(LOG_ENV)
+    if not log:
+        yield
+        return
+
+    profile_dir = os.environ.get(PROFILE_DIR_ENV)
+    profiler = None
+    if profile_dir:
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+    io_start = _io_bytes()
+    rss_start = _peak_rss_mb()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        io_end = _io_bytes()
+        rss_end = _peak_rss_mb()
+
+        record = dict(
+            stage=name,
+            file=file,
+            pid=os.getpid(),
+            start=time.time() - wall,
+            wall=wall,
+            cpu=cpu,
+            peak_rss_mb=rss_end,
+            peak_rss_growth_mb=None if rss_end is None else rss_end - rss_start,
+            bytes_read=None if io_end is None else io_end[0] - io_start[0],
+            bytes_written=None if io_end is None else io_end[1] - io_start[1],
+            failed=failed,
+        )
+        record.update(tags)
+        if profiler is not None:
+            dump = os.path.join(
+                profile_dir,
+                "{}-{:d}-{:d}.prof".format(name, os.getpid(), next(_counter)),
+            )
+            profiler.dump_stats(dump)
+            record["profile"] = dump
+
+        # one write per record, appends of the processes do not interleave
+        with open(log, "a") as f_out:
+            f_out.write(json.dumps(record, default=str) + "\n")
+
+
+def instrumented(name=None):
+    """Decorator recording every call as a stage
+
+    The first argument is taken as the file of the stage if it is a str.
+    """
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            file = args[0] if args and isinstance(args[0], str) else None
+            with stage(stage_name, file=file):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def add_instrument_arguments(parser):
+    """Add --instrument_log and --profile_dir to an argparse parser"""
+    parser.add_argument(
+        "--instrument_log",
+        type=str,
+        default=None,
+        help="Append per-stage timing and memory as JSON lines to this file",
+    )
+    parser.add_argument(
+        "--profile_dir",
+        type=str,
+        default=None,
+        help="Dump a cProfile of every stage into this dir (with --instrument_log)",
+    )
+
+
+def configure_from_args(args):
+    """configure() from the arguments of add_instrument_arguments"""
+    if args.instrument_log:
+        configure(args.instrument_log, args.profile_dir)
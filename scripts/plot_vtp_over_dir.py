@@ -1,18 +1,23 @@
 import os
 import sys
+import time
 import argparse
-import pyvista as pv
-from pyvista import examples
-import numpy as np
-from glob import glob
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from encode_frames import FrameEncoder
+from reporter_timeline import ReporterTimeline
+from instrument import stage, add_instrument_arguments, configure_from_args
 
 CAMERA_POS = [(125, 505, 2200), (125, 505, 0), (0, 1, 0)]  # only for 300 x 1000 box
 
 
 def plot_mesh_with_cell_type(filename, figname):
+    import pyvista as pv
 
-    mesh = pv.read(filename)
+    # a path or a mesh already read, i.e. from ReporterTimeline
+    with stage("vtk_read", file=filename if isinstance(filename, str) else None):
+        mesh = pv.read(filename) if isinstance(filename, str) else filename
     # TODO: Fix colorbar location and camera location
     # TODO: change canvas resolution
     # cell_type = mesh["cell_type"]
@@ -20,62 +25,203 @@ def plot_mesh_with_cell_type(filename, figname):
     # red = np.array([1, 0, 0, 1])
     # mapping = np.array([0.0, 1.0])
     # my_colormap = ListedColormap(newcolors)
-    mesh.plot(
-        cpos=CAMERA_POS,
+    with stage("render", file=figname):
+        mesh.plot(
+            cpos=CAMERA_POS,
+            scalars="cell_type",
+            show_edges=True,
+            color=True,
+            off_screen=True,
+            screenshot=figname,
+        )
+
+
+def render_mesh_with_cell_type(mesh, plotter, figname=None):
+    """Render a mesh on a persistent off-screen plotter
+
+    The actor of the previous frame is replaced, the render window is kept.
+
+    Returns
+    -------
+    np.ndarray
+        RGB image of the frame
+    """
+    plotter.add_mesh(
+        mesh,
+        name="cell_type",
         scalars="cell_type",
         show_edges=True,
-        color=True,
-        off_screen=True,
-        screenshot=figname,
+        reset_camera=False,
     )
+    plotter.camera_position = CAMERA_POS
+
+    return plotter.screenshot(figname, return_img=True)
+
+
+# one off-screen plotter per worker process, see _init_plotter
+_PLOTTER = None
+
 
+def _init_plotter(window_size=None):
+    import pyvista as pv
 
-def plot_mesh_dir(dir, steps=10):
-    # assume
-    count = len(glob("{:s}/Cells_*.vtm".format(dir)))
-    if count == 0:
+    global _PLOTTER
+    _PLOTTER = pv.Plotter(off_screen=True, window_size=window_size)
+
+
+def _plot_frame(filename, figname):
+    import pyvista as pv
+
+    with stage("vtk_read", file=filename):
+        mesh = pv.read(filename)
+    with stage("render", file=filename):
+        img = render_mesh_with_cell_type(mesh, _PLOTTER, figname)
+    # only send the image back if it is not saved
+    return figname if figname else img
+
+
+def plot_mesh_dir(dir, steps=None, workers=1, window_size=None, movie=None, fps=10):
+    """Plot the cell type of every reported timestep
+
+    Parameters
+    ----------
+    dir : str
+        LBIBCell reporter output dir
+    steps : int, optional
+        Only plot the timesteps multiple of it, by default all reported
+    workers : int, optional
+        Number of render processes, by default 1
+    window_size : list of int, optional
+        Resolution of the plots, by default the one of pyvista
+    movie : str, optional
+        Stream the frames into <movie>.mp4 and <movie>.gif instead of
+        saving PNGs in <dir>/fig, by default None
+    fps : int, optional
+        Frame rate of the movie, by default 10
+    """
+    # pyvista only when plotting, it pulls in vtk
+    import pyvista as pv
+
+    # timesteps actually reported, missing frames are skipped
+    timeline = ReporterTimeline(dir, loader=pv.read, prefetch=2)
+    if len(timeline) == 0:
         print("No cell reporter files saved, exiting...")
         sys.exit(1)
 
     fig_dir = os.path.join(dir, "fig")
-    if not os.path.exists(fig_dir):
+    # the movie is streamed, no PNG saved in fig_dir
+    if not movie and not os.path.exists(fig_dir):
         try:
             os.mkdir(fig_dir)
             print("Creating {:s}...".format(fig_dir))
         except OSError:
             print("Creating {:s} failed!".format(fig_dir))
             sys.exit(1)
-    else:
+    elif not movie:
         print("{:s} exist...".format(fig_dir))
 
-    for i in range(0, count):
-        filename = os.path.join(
-            dir, "Cells_{:d}/".format(steps * i), "Cells_{:d}_0.vtp".format(steps * i)
-        )
-        figname = os.path.join(fig_dir, "Cells_{:d}_cell_type.png".format(i))
-        print("Ploting mesh {:s}".format(figname))
-        print("Saving plot to {:s}".format(figname))
-        plot_mesh_with_cell_type(
-            filename=filename,
-            figname=figname,
-        )
+    # only the multiples of steps if given
+    frames = [
+        i for i, step in enumerate(timeline.steps) if not steps or step % steps == 0
+    ]
+    fignames = [
+        None if movie else os.path.join(fig_dir, "Cells_{:d}_cell_type.png".format(i))
+        for i in range(len(frames))
+    ]
+    encoder = FrameEncoder(movie, fps=fps) if movie else None
+    start = time.time()
 
+    if workers > 1:
+        timeline.close()
+        files = [timeline.files[i] for i in frames]
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_plotter, initargs=(window_size,)
+        ) as executor:
+            chunksize = max(1, len(files) // (4 * workers))
+            for out in executor.map(_plot_frame, files, fignames, chunksize=chunksize):
+                if encoder is not None:
+                    with stage("encode"):
+                        encoder.write(out)
+                else:
+                    print("Saving plot to {:s}".format(out))
+    else:
+        plotter = pv.Plotter(off_screen=True, window_size=window_size)
+        with timeline:
+            for i, figname in zip(frames, fignames):
+                print("Ploting mesh {:s}".format(timeline.files[i]))
+                # only the wait for the prefetching thread
+                with stage("vtk_read", file=timeline.files[i]):
+                    mesh = timeline[i]
+                with stage("render", file=timeline.files[i]):
+                    img = render_mesh_with_cell_type(mesh, plotter, figname)
+                if encoder is not None:
+                    with stage("encode"):
+                        encoder.write(img)
+                else:
+                    print("Saving plot to {:s}".format(figname))
+        plotter.close()
 
-if __name__ == "__main__":
+    if encoder is not None:
+        encoder.close()
 
+    elapsed = max(time.time() - start, 1e-9)
+    print(
+        "{:d} frames in {:.1f}s ({:.1f} frames/s)".format(
+            len(frames), elapsed, len(frames) / elapsed
+        )
+    )
+
+
+def main(argv=None, prog=None):
     # Set up the parsing of command-line arguments
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Plot the cell type of every timestep of a reporter output dir",
+    )
     parser.add_argument(
         "--input_dir", type=str, required=True, help="LBIBCell reporter output dir"
     )
     parser.add_argument(
-        "--step", type=int, required=True, default=10, help="Steps in LBIBCell"
+        "--step",
+        type=int,
+        default=None,
+        help="Only plot the timesteps multiple of it, by default all reported",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1, help="Number of render processes"
+    )
+    parser.add_argument(
+        "--window_size",
+        type=int,
+        nargs=2,
+        default=None,
+        help="Resolution of the plots, i.e. 1024 768",
+    )
+    parser.add_argument(
+        "--movie",
+        type=str,
+        default=None,
+        help="Write <movie>.mp4 and <movie>.gif instead of the PNGs",
     )
-    args = parser.parse_args()
+    parser.add_argument("--fps", type=int, default=10, help="Frame rate of --movie")
+    add_instrument_arguments(parser)
+    args = parser.parse_args(argv)
+    configure_from_args(args)
 
     try:
-        plot_mesh_dir(args.input_dir, args.step)
+        plot_mesh_dir(
+            args.input_dir,
+            args.step,
+            args.workers,
+            args.window_size,
+            args.movie,
+            args.fps,
+        )
     except:
         print("Drawing error")
         traceback.print_exc()
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
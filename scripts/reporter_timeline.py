@@ -0,0 +1,188 @@
+"""
+reporter_timeline
+
+Lazy time series over the output dir of vtkCellReporter in LBIBCell:
+
+    Cells_0.vtm
+    Cells_0/Cells_0_0.vtp
+    Cells_100.vtm
+    Cells_100/Cells_100_0.vtp
+    ...
+
+The timesteps are discovered from what exists on disk (the .vtm index first,
+then the Cells_*/Cells_*_0.vtp), so neither a fixed step size nor a complete
+series is assumed. Meshes are decoded on access, kept in a bounded LRU cache
+and optionally prefetched on a background thread.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+
+def _vtm_dataset_file(vtm_file):
+    """Path of the first DataSet in a .vtm, None if it cannot be parsed"""
+    try:
+        root = ET.parse(vtm_file).getroot()
+    except (ET.ParseError, OSError):
+        return None
+
+    for dataset in root.iter("DataSet"):
+        if dataset.get("file"):
+            return os.path.join(os.path.dirname(vtm_file), dataset.get("file"))
+
+    return None
+
+
+def discover_timesteps(dir, prefix="Cells"):
+    """Timesteps and their vtp in a reporter output dir
+
+    Parameters
+    ----------
+    dir : str
+        LBIBCell reporter output dir
+    prefix : str, optional
+        Prefix of the reporter files, by default "Cells"
+
+    Returns
+    -------
+    list of (int, str)
+        Timestep and the path to its vtp, sorted by timestep
+    """
+    found = {}
+    pattern = re.compile(r"^{}_(\d+)\.vtm$".format(re.escape(prefix)))
+    for vtm_file in glob(os.path.join(dir, "{}_*.vtm".format(prefix))):
+        match = pattern.match(os.path.basename(vtm_file))
+        if not match:
+            continue
+        vtp_file = _vtm_dataset_file(vtm_file)
+        if vtp_file is not None and os.path.exists(vtp_file):
+            found[int(match.group(1))] = vtp_file
+
+    # reporter dirs without (or with a broken) .vtm index
+    pattern = re.compile(r"^{0}_(\d+)_0\.vtp$".format(re.escape(prefix)))
+    for vtp_file in glob(os.path.join(dir, "{0}_*".format(prefix), "*_0.vtp")):
+        match = pattern.match(os.path.basename(vtp_file))
+        if match and int(match.group(1)) not in found:
+            found[int(match.group(1))] = vtp_file
+
+    return sorted(found.items())
+
+
+def _read_pyvista(filename):
+    import pyvista as pv
+
+    return pv.read(filename)
+
+
+class ReporterTimeline(Sequence):
+    """Lazy sequence of the meshes in a reporter output dir
+
+    Parameters
+    ----------
+    dir : str
+        LBIBCell reporter output dir
+    loader : callable, optional
+        Decodes a vtp, by default pyvista.read
+    cache_size : int, optional
+        Number of decoded meshes kept, by default 8
+    prefetch : int, optional
+        Number of upcoming frames read on a background thread, by default 0
+    prefix : str, optional
+        Prefix of the reporter files, by default "Cells"
+
+    Examples
+    --------
+    >>> with ReporterTimeline("output", prefetch=2) as timeline:
+    ...     for step, mesh in zip(timeline.steps, timeline):
+    ...         print(step, mesh.n_cells)
+    """
+
+    def __init__(self, dir, loader=None, cache_size=8, prefetch=0, prefix="Cells"):
+        self.dir = dir
+        self.loader = loader or _read_pyvista
+        self.cache_size = max(int(cache_size), 1)
+        self.prefetch = max(int(prefetch), 0)
+
+        frames = discover_timesteps(dir, prefix)
+        self.steps = [step for step, _ in frames]
+        self.files = [vtp_file for _, vtp_file in frames]
+        self._index = {step: i for i, step in enumerate(self.steps)}
+
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("frame {} out of range".format(i))
+
+        mesh = self._get(i)
+        self._schedule(range(i + 1, min(i + 1 + self.prefetch, len(self))))
+
+        return mesh
+
+    def index_of(self, step):
+        """Frame index of a timestep, KeyError if it was not reported"""
+        return self._index[step]
+
+    def at_step(self, step):
+        """Mesh at a timestep"""
+        return self[self.index_of(step)]
+
+    def _get(self, i):
+        with self._lock:
+            if i in self._cache:
+                self._cache.move_to_end(i)
+                return self._cache[i]
+            future = self._pending.pop(i, None)
+
+        mesh = future.result() if future is not None else self.loader(self.files[i])
+        self._store(i, mesh)
+
+        return mesh
+
+    def _store(self, i, mesh):
+        with self._lock:
+            self._cache[i] = mesh
+            self._cache.move_to_end(i)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _schedule(self, frames):
+        if self._executor is None:
+            return
+        with self._lock:
+            # forget what was prefetched for a window the reader left
+            for j in list(self._pending):
+                if j not in frames:
+                    self._pending.pop(j).cancel()
+            for j in frames:
+                if j not in self._cache and j not in self._pending:
+                    self._pending[j] = self._executor.submit(self.loader, self.files[j])
+
+    def close(self):
+        """Stop the prefetching thread"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
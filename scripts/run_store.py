@@ -0,0 +1,471 @@
+"""
+run_store
+
+Pack a whole LBIBCell run (the solver outputs Cells_*.txt and optionally the
+cell reporter vtp) into one chunked and compressed store, and read back only
+the chunks a query needs. The layout is a directory in the spirit of Zarr,
+without any dependency besides numpy:
+
+    run.store/meta.json                   shapes, chunks, dtypes, timesteps
+    run.store/concentration/<t>.<x>.<y>   lattice (n_steps, nx, ny)
+    run.store/profile/<t>.<x>             mean along y (n_steps, nx)
+    run.store/cell_area/<t>.<c>           per cell and reported timestep
+    run.store/cell_centroid_x/<t>.<c>     (n_cell_steps, n_cells), NaN if
+    run.store/cell_centroid_y/<t>.<c>     the cell does not exist (yet)
+    run.store/cell_type/<t>.<c>
+    run.store/geometry/<step>.npz         points and polygons of the cells
+
+Every chunk is the C-ordered block of the array compressed by zlib, the
+edge chunks hold only what is left of the array.
+
+Example:
+    python3 run_store.py --input_dir output --reporter_dir output -o run.store
+
+    >>> store = RunStore("run.store")
+    >>> store.series_at(x=500)             # concentration at x=500 over time
+    >>> store.time_slice(4000)             # lattice at timestep 4000
+    >>> store.cell_series("cell_area", 12)
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import sys
+import json
+import zlib
+import shutil
+import argparse
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+from solver_io import C_COL, read_solver_field, chunked_mean, discover_solver_out
+
+META_NAME = "meta.json"
+CELL_FIELDS = ("cell_area", "cell_centroid_x", "cell_centroid_y", "cell_type")
+
+
+def _chunk_key(index):
+    return ".".join(str(i) for i in index)
+
+
+class RunStore:
+    """Chunked arrays of a packed run, read chunk by chunk
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store
+    cache_size : int, optional
+        Number of decompressed chunks kept, by default 64
+    """
+
+    def __init__(self, path, cache_size=64):
+        self.path = path
+        with open(os.path.join(path, META_NAME)) as f_in:
+            self.meta = json.load(f_in)
+        self.steps = self.meta["steps"]
+        self.cell_steps = self.meta.get("cell_steps", [])
+        self._step_index = {step: i for i, step in enumerate(self.steps)}
+        self._cell_step_index = {step: i for i, step in enumerate(self.cell_steps)}
+        self.cache_size = max(int(cache_size), 1)
+        self._cache = OrderedDict()
+        # number of chunks decompressed, to check what a query touched
+        self.n_chunks_read = 0
+
+    @property
+    def fields(self):
+        """Names of the arrays in the store"""
+        return list(self.meta["fields"])
+
+    def shape(self, name):
+        return tuple(self.meta["fields"][name]["shape"])
+
+    def _chunk(self, name, index):
+        key = (name, index)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        field = self.meta["fields"][name]
+        shape, chunks = field["shape"], field["chunks"]
+        chunk_shape = tuple(min(c, s - i * c) for i, c, s in zip(index, chunks, shape))
+        with open(os.path.join(self.path, name, _chunk_key(index)), "rb") as f_in:
+            data = zlib.decompress(f_in.read())
+        chunk = np.frombuffer(data, dtype=field["dtype"]).reshape(chunk_shape)
+        self.n_chunks_read += 1
+
+        self._cache[key] = chunk
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return chunk
+
+    def read(self, name, *selection):
+        """Read a block of an array, touching only the chunks under it
+
+        Parameters
+        ----------
+        name : str
+            Name of the array, see fields
+        *selection : int or slice
+            One per dimension, the missing ones are taken whole
+
+        Returns
+        -------
+        np.ndarray
+            The block, the dimensions selected by an int are dropped
+        """
+        field = self.meta["fields"][name]
+        shape, chunks = field["shape"], field["chunks"]
+        if len(selection) > len(shape):
+            raise IndexError("{} has {:d} dimensions".format(name, len(shape)))
+        selection = selection + (slice(None),) * (len(shape) - len(selection))
+
+        ranges, squeeze = [], []
+        for dim, (sel, size) in enumerate(zip(selection, shape)):
+            if isinstance(sel, slice):
+                start, stop, step = sel.indices(size)
+                if step != 1:
+                    raise IndexError("Only contiguous slices are supported")
+                stop = max(stop, start)
+            else:
+                start = int(sel) + size if int(sel) < 0 else int(sel)
+                if not 0 <= start < size:
+                    raise IndexError(
+                        "Index {} out of range for {} of size {:d}".format(
+                            sel, name, size
+                        )
+                    )
+                stop = start + 1
+                squeeze.append(dim)
+            ranges.append((start, stop))
+
+        out = np.empty([stop - start for start, stop in ranges], dtype=field["dtype"])
+        chunk_ranges = [
+            range(start // c, (stop - 1) // c + 1) if stop > start else range(0)
+            for (start, stop), c in zip(ranges, chunks)
+        ]
+        for index in itertools.product(*chunk_ranges):
+            chunk = self._chunk(name, index)
+            src, dst = [], []
+            for (start, stop), i, c in zip(ranges, index, chunks):
+                lo, hi = max(start, i * c), min(stop, (i + 1) * c)
+                src.append(slice(lo - i * c, hi - i * c))
+                dst.append(slice(lo - start, hi - start))
+            out[tuple(dst)] = chunk[tuple(src)]
+
+        return out.squeeze(axis=tuple(squeeze)) if squeeze else out
+
+    def step_index(self, step):
+        """Index along time of a solver timestep, KeyError if not packed"""
+        return self._step_index[step]
+
+    def time_slice(self, step, x=slice(None), y=slice(None)):
+        """Concentration [x, y] at a timestep"""
+        return self.read("concentration", self.step_index(step), x, y)
+
+    def profile(self, step=None):
+        """Mean along y at a timestep, or (n_steps, nx) at all of them"""
+        if step is None:
+            return self.read("profile")
+        return self.read("profile", self.step_index(step))
+
+    def series_at(self, x, y=None):
+        """Concentration at x over all timesteps, mean along y if y is None"""
+        if y is None:
+            return self.read("profile", slice(None), x)
+        return self.read("concentration", slice(None), x, y)
+
+    def cell_series(self, name, cell_id):
+        """One of CELL_FIELDS of a cell over all reported timesteps"""
+        if name not in CELL_FIELDS:
+            raise KeyError("Per cell fields are {}".format(CELL_FIELDS))
+        return self.read(name, slice(None), cell_id)
+
+    def cell_geometry(self, step):
+        """points, connectivity, offsets and cell_type of a reported timestep"""
+        if step not in self._cell_step_index:
+            raise KeyError("Timestep {} was not reported".format(step))
+        with np.load(
+            os.path.join(self.path, "geometry", "{:d}.npz".format(step))
+        ) as data:
+            return {key: data[key] for key in data.files}
+
+
+class ChunkedWriter:
+    """Write an array of the store one index along its first axis at a time
+
+    The slices are buffered until a chunk along the first axis is full.
+    """
+
+    def __init__(self, path, name, shape, chunks, dtype=float, level=6):
+        self.path = path
+        self.name = name
+        self.shape = tuple(int(s) for s in shape)
+        self.chunks = tuple(int(min(c, s)) or 1 for c, s in zip(chunks, self.shape))
+        self.dtype = np.dtype(dtype)
+        self.level = level
+        self.n_written = 0
+        self.nbytes = 0
+        self._buffer = np.empty((self.chunks[0],) + self.shape[1:], dtype=self.dtype)
+        self._n_buffered = 0
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+
+    @property
+    def meta(self):
+        return dict(
+            shape=self.shape,
+            chunks=self.chunks,
+            dtype=self.dtype.str,
+            compressor="zlib",
+            level=self.level,
+        )
+
+    def append(self, arr):
+        """Append the next slice along the first axis"""
+        if self.n_written + self._n_buffered >= self.shape[0]:
+            raise IndexError("{} is already full".format(self.name))
+        self._buffer[self._n_buffered] = arr
+        self._n_buffered += 1
+        if self._n_buffered == self.chunks[0]:
+            self.flush()
+
+    def flush(self):
+        """Write the slices buffered"""
+        if not self._n_buffered:
+            return
+        block = self._buffer[: self._n_buffered]
+        i0 = self.n_written // self.chunks[0]
+        rest = [range(0, s, c) for s, c in zip(self.shape[1:], self.chunks[1:])]
+        for starts in itertools.product(*rest):
+            src = tuple(
+                slice(start, start + c) for start, c in zip(starts, self.chunks[1:])
+            )
+            index = (i0,) + tuple(
+                start // c for start, c in zip(starts, self.chunks[1:])
+            )
+            data = zlib.compress(
+                np.ascontiguousarray(block[(slice(None),) + src]).tobytes(),
+                self.level,
+            )
+            with open(
+                os.path.join(self.path, self.name, _chunk_key(index)), "wb"
+            ) as f_out:
+                f_out.write(data)
+            self.nbytes += len(data)
+        self.n_written += self._n_buffered
+        self._n_buffered = 0
+
+
+def _solver_steps(dir):
+    found = discover_solver_out(dir)
+
+    return [step for step, _ in found], [file for _, file in found]
+
+
+def _cell_tables(reporter_dir, store_path):
+    """Per cell properties of every reported timestep, geometry saved as npz"""
+    from reporter_timeline import discover_timesteps
+    from vtk_io import read_polydata
+    from cell_geometry import cell_arrays, cell_type_per_cell, polygon_properties
+
+    frames = discover_timesteps(reporter_dir)
+    os.makedirs(os.path.join(store_path, "geometry"), exist_ok=True)
+    tables = []
+    for step, vtp_file in frames:
+        cells = cell_arrays(read_polydata(vtp_file))
+        props = polygon_properties(cells)
+        tables.append(
+            dict(
+                cell_area=np.abs(props["area"]),
+                cell_centroid_x=props["centroid_x"],
+                cell_centroid_y=props["centroid_y"],
+                cell_type=cell_type_per_cell(cells),
+            )
+        )
+        np.savez_compressed(
+            os.path.join(store_path, "geometry", "{:d}.npz".format(step)),
+            points=cells.points,
+            connectivity=cells.connectivity,
+            offsets=cells.offsets,
+            cell_type=cells.cell_type if cells.cell_type is not None else np.empty(0),
+        )
+
+    return [step for step, _ in frames], tables
+
+
+def pack_run(
+    input_dir,
+    output,
+    reporter_dir=None,
+    chunks=(16, 128, 128),
+    dtype=np.float32,
+    c_col=C_COL,
+    level=6,
+    overwrite=False,
+    shape=None,
+):
+    """Pack the solver outputs (and cell reporter) of a run into a store
+
+    Parameters
+    ----------
+    input_dir : str
+        Directory with the solver outputs Cells_*.txt
+    output : str
+        Directory of the store
+    reporter_dir : str, optional
+        Cell reporter output dir, by default no cell geometry
+    chunks : tuple of int, optional
+        Chunk of the lattice along time, x and y, by default (16, 128, 128)
+    dtype : np.dtype, optional
+        Storage type of the concentration, by default np.float32
+    c_col : int, optional
+        Column of the concentration, by default 5
+    level : int, optional
+        zlib compression level, by default 6
+    overwrite : bool, optional
+        Replace an existing store, by default False
+    shape : tuple of int, optional
+        Size (nx, ny) of the lattice of all timesteps, by default the one of
+        the first timestep
+
+    Returns
+    -------
+    RunStore
+        The store written
+
+    Raises
+    ------
+    ValueError
+        If a timestep has nodes outside of the lattice size
+    """
+    steps, files = _solver_steps(input_dir)
+    if not files:
+        raise IOError("No solver output found in {}".format(input_dir))
+    if os.path.exists(output):
+        if not overwrite:
+            raise IOError("{} exists".format(output))
+        shutil.rmtree(output)
+    os.makedirs(output)
+
+    # the lattice of the first timestep sets the shape of all the others
+    first = read_solver_field(files[0], shape, c_col=c_col)
+    nx, ny = first.shape
+    concentration = ChunkedWriter(
+        output, "concentration", (len(files), nx, ny), chunks, dtype, level
+    )
+    profile = ChunkedWriter(
+        output, "profile", (len(files), nx), chunks[:2], np.float64, level
+    )
+    for i, file in enumerate(files):
+        arr = first if i == 0 else read_solver_field(file, (nx, ny), c_col=c_col)
+        concentration.append(arr)
+        profile.append(chunked_mean(arr, axis=1))
+        print("[{:d}/{:d}] {} packed".format(i + 1, len(files), file))
+    concentration.flush()
+    profile.flush()
+
+    meta = dict(
+        version=1,
+        input_dir=os.path.abspath(input_dir),
+        steps=steps,
+        fields={w.name: w.meta for w in (concentration, profile)},
+    )
+    nbytes = concentration.nbytes + profile.nbytes
+
+    if reporter_dir:
+        cell_steps, tables = _cell_tables(reporter_dir, output)
+        n_cells = max((t["cell_area"].size for t in tables), default=0)
+        meta["cell_steps"] = cell_steps
+        meta["reporter_dir"] = os.path.abspath(reporter_dir)
+        for name in CELL_FIELDS if tables else ():
+            writer = ChunkedWriter(
+                output,
+                name,
+                (len(tables), n_cells),
+                (chunks[0], 1024),
+                np.float64,
+                level,
+            )
+            for table in tables:
+                # cells born later are NaN before
+                row = np.full(n_cells, np.nan)
+                row[: table[name].size] = table[name]
+                writer.append(row)
+            writer.flush()
+            meta["fields"][name] = writer.meta
+            nbytes += writer.nbytes
+        print("{:d} reported timesteps packed".format(len(cell_steps)))
+
+    with open(os.path.join(output, META_NAME), "w") as f_out:
+        json.dump(meta, f_out, indent=1)
+    print("Run packed into {} ({:.1f} MB)".format(output, nbytes / 1e6))
+
+    return RunStore(output)
+
+
+def main(argv=None, prog=None):
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Pack a LBIBCell run into one chunked compressed store",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        required=True,
+        help="Directory with the solver outputs Cells_*.txt",
+    )
+    parser.add_argument(
+        "--reporter_dir",
+        type=str,
+        default=None,
+        help="Cell reporter output dir (Cells_*.vtm), by default no cells",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, required=True, help="Directory of the store"
+    )
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        nargs=3,
+        default=[16, 128, 128],
+        help="Chunk along time, x and y, by default 16 128 128",
+    )
+    parser.add_argument(
+        "--float64", action="store_true", help="Store the lattice as float64"
+    )
+    parser.add_argument(
+        "--shape",
+        type=int,
+        nargs=2,
+        default=None,
+        help="Lattice size NX NY of all timesteps, by default the first one",
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Replace an existing store"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        pack_run(
+            args.input_dir,
+            args.output,
+            args.reporter_dir,
+            tuple(args.chunks),
+            np.float64 if args.float64 else np.float32,
+            overwrite=args.force,
+            shape=tuple(args.shape) if args.shape else None,
+        )
+    except IOError as err:
+        print(err)
+        sys.exit(1)
+    except ValueError as err:
+        print("{}, set a larger --shape".format(err))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,15 +11,20 @@ import os
 import sys
 import argparse
 import numpy as np
-from vtk import vtkXMLPolyDataReader, vtkXMLPolyDataWriter
-from vtk.util.numpy_support import vtk_to_numpy
+
+from cell_geometry import cell_arrays, cell_bounds, set_cells_type
+from cell_index import CellGridIndex, Region, paint_regions
+from vtk_io import read_polydata, write_polydata, add_writer_arguments
+from instrument import stage, add_instrument_arguments, configure_from_args
 
 arg_log = """
 Example: python3 set_cell_id_within_box.py -i Cells_1000_0.vtp --id 2 --box 0 0 200 200 -o Cells_1000_0_cell_id_mod.vtp
+         python3 set_cell_id_within_box.py -i Cells_1000_0.vtp --region box:0,0,200,200:2 --region circle:150,500,80:1
 
 The input should follow the format described in the reporter vtkCellReporter in
-LBIBCell. Since the Points are stored as Float32 and ascii, there will be some
-errors in that section of xml.
+LBIBCell. Since the Points are stored as Float32, writing them as ascii
+(--ascii) introduces some errors in that section of xml, the output is
+appended binary compressed by zlib by default.
 
 Dealing with vtk in python is quite a mess, so I decide to convert the spatial
 cooridnates into numpy array from easy extraction of coordinates data.
@@ -61,6 +66,7 @@ def is_cell_within_box(
     Bool
         Wether the cell is within the limit imposed
     """
+    from vtk.util.numpy_support import vtk_to_numpy
 
     # conver vtk polygon cooridinates to array
     coor = vtk_to_numpy(cell.GetPoints().GetData())
@@ -114,76 +120,97 @@ def is_cell_within_box(
     return is_within
 
 
-def set_celltype_id_random(filename, celltype_id, percentage, output_filename):
-    reader = vtkXMLPolyDataReader()
-    reader.SetFileName(filename)
-    reader.Update()
-    polyData = reader.GetOutput()
-    polyDataPointData = polyData.GetPointData()
-    # change only this
-    cell_type = polyDataPointData.GetArray("cell_type")
+def set_celltype_id_random(
+    filename,
+    celltype_id,
+    percentage,
+    output_filename,
+    data_mode="binary",
+    compressor="zlib",
+):
+    polyData = read_polydata(filename)
+    # change only cell_type
+    cells = cell_arrays(polyData)
 
-    nbOfCells = polyData.GetNumberOfPolys()
+    nbOfCells = cells.n_cells
 
-    choose_idx = np.random.choice(
-        nbOfCells, size=int(nbOfCells * percentage), replace=False
-    )
+    with stage("edit", file=filename):
+        choose_idx = np.random.choice(
+            nbOfCells, size=int(nbOfCells * percentage), replace=False
+        )
 
-    for i in choose_idx:
-        cell = polyData.GetCell(i)
-        # need to iter. thr. all Points of that polygon
-        nbOfPoints = cell.GetNumberOfPoints()
-        for i in range(nbOfPoints):
-            Id = cell.GetPointIds().GetId(i)
-            cell_type.SetValue(Id, celltype_id)
+        set_cells_type(cells, choose_idx, celltype_id)
 
-    writer = vtkXMLPolyDataWriter()
-    writer.SetFileName(output_filename)
-    writer.SetInputData(polyData)
-    writer.SetDataModeToAscii()
-    writer.Write()
+    write_polydata(polyData, output_filename, data_mode, compressor)
 
 
 def write_celltype_id(
-    box, celltype_id, input_file, output_filename, lattice_x=1005, lattice_y=1005
+    box,
+    celltype_id,
+    input_file,
+    output_filename,
+    lattice_x=1005,
+    lattice_y=1005,
+    data_mode="binary",
+    compressor="zlib",
 ):
     MIN_X, MIN_Y, MAX_X, MAX_Y = box
-    reader = vtkXMLPolyDataReader()
-    reader.SetFileName(input_file)
-    reader.Update()
-    polyData = reader.GetOutput()
-    polyDataPointData = polyData.GetPointData()
-    # change only this
-    cell_type = polyDataPointData.GetArray("cell_type")
-
-    nbOfCells = polyData.GetNumberOfPolys()
-    count = 0
-
-    for i in range(nbOfCells):
-        cell = polyData.GetCell(i)
-        if is_cell_within_box(
-            cell, MIN_X, MIN_Y, MAX_X, MAX_Y, False, lattice_x, lattice_y
-        ):
-            # need to iter. thr. all Points of that polygon
-            nbOfPoints = cell.GetNumberOfPoints()
-            for i in range(nbOfPoints):
-                Id = cell.GetPointIds().GetId(i)
-                cell_type.SetValue(Id, celltype_id)
-            count += 1
+    polyData = read_polydata(input_file)
+    # change only cell_type
+    cells = cell_arrays(polyData)
+
+    # same limit as is_cell_within_box, for all cells at once
+    with stage("edit", file=input_file):
+        min_x, min_y, max_x, max_y = cell_bounds(cells).T
+        is_within = (
+            (min_x > MIN_X) & (min_y > MIN_Y) & (max_x < MAX_X) & (max_y < MAX_Y)
+        )
+        count = set_cells_type(cells, is_within, celltype_id)
 
     print("{} cells are within the box limit".format(count))
     print("Cell type id changed to {}".format(celltype_id))
-    writer = vtkXMLPolyDataWriter()
-    writer.SetFileName(output_filename)
-    writer.SetInputData(polyData)
-    writer.SetDataModeToAscii()
-    writer.Write()
+    write_polydata(polyData, output_filename, data_mode, compressor)
 
 
-if __name__ == "__main__":
+def write_celltype_regions(
+    regions, input_file, output_filename, data_mode="binary", compressor="zlib"
+):
+    """Set the cell type in many regions with one read and one write
+
+    Parameters
+    ----------
+    regions : list of cell_index.Region
+        Regions applied in order, a cell in several regions ends up with the
+        type of the last one
+    input_file : str
+        Input vtp from LBIBCell
+    output_filename : str
+        Output vtp
+    data_mode : str, optional
+        "binary" or "ascii", see vtk_io.write_polydata, by default "binary"
+    compressor : str, optional
+        "zlib", "lz4" or "none", by default "zlib"
+    """
+    polyData = read_polydata(input_file)
+    # change only cell_type
+    cells = cell_arrays(polyData)
+
+    with stage("edit", file=input_file, n_regions=len(regions)):
+        counts = paint_regions(cells, regions, CellGridIndex(cells))
+    for region, count in zip(regions, counts):
+        print(
+            "{} cells within {} {} changed to {}".format(
+                count, region.shape, region.coords.tolist(), region.celltype_id
+            )
+        )
+
+    write_polydata(polyData, output_filename, data_mode, compressor)
 
+
+def main(argv=None, prog=None):
     # Set up the parsing of command-line arguments
     parser = argparse.ArgumentParser(
+        prog=prog,
         description="Write a initial round cell for LBIBCell simulation as well as the parameters",
         epilog=arg_log,
         formatter_class=argparse.RawTextHelpFormatter,
@@ -208,16 +235,27 @@ if __name__ == "__main__":
         "--box",
         type=float,
         nargs="+",
-        required=True,
         help="The box limit, i.e. MIN_X, MIN_Y, MAX_X, MAX_Y",
     )
+    parser.add_argument(
+        "--region",
+        type=str,
+        action="append",
+        default=[],
+        help="Region with its own cell type, can be repeated, i.e.\n"
+        "box:0,0,200,200:2, circle:150,500,80:1 or polygon:0,0,300,0,150,200:2\n"
+        "append :intersect to select the cells partly inside",
+    )
     parser.add_argument(
         "-o",
         "--output_file",
         type=str,
         help="Ouput filename, i.e. Cells_4000_0_cell_id_mod.vtp",
     )
-    args = parser.parse_args()
+    add_writer_arguments(parser)
+    add_instrument_arguments(parser)
+    args = parser.parse_args(argv)
+    configure_from_args(args)
 
     filename = args.input
     id = args.id
@@ -225,6 +263,7 @@ if __name__ == "__main__":
     size_y = args.SizeY + 5
     box = args.box
     output_file = args.output_file
+    data_mode = "ascii" if args.ascii else "binary"
     filename_no_ext, ext = os.path.splitext(filename)
 
     if not output_file:
@@ -236,7 +275,10 @@ if __name__ == "__main__":
             "{} not valid, should be a vtp file, i.e. Cells_4000_0.vtp".format(filename)
         )
         sys.exit(1)
-    elif len(box) != 4 or box[0] > box[2] or box[1] > box[3]:
+    elif box is None and not args.region:
+        print("Either --box or --region is required")
+        sys.exit(1)
+    elif box is not None and (len(box) != 4 or box[0] > box[2] or box[1] > box[3]):
         print("Input box dim not valid i.e. --box 1 25 100 150")
         sys.exit(1)
     elif os.path.exists(output_file):
@@ -244,4 +286,30 @@ if __name__ == "__main__":
         if input("Do you want to OVERWRITE {}? [y] ".format(output_file)) != "y":
             sys.exit(1)
 
-    write_celltype_id(box, id, filename, output_file, size_x, size_y)
+    try:
+        regions = [Region.parse(spec) for spec in args.region]
+    except ValueError as err:
+        print(err)
+        sys.exit(1)
+
+    if not regions:
+        write_celltype_id(
+            box,
+            id,
+            filename,
+            output_file,
+            size_x,
+            size_y,
+            data_mode,
+            args.compressor,
+        )
+    else:
+        if box is not None:
+            regions.insert(0, Region("box", box, id))
+        write_celltype_regions(
+            regions, filename, output_file, data_mode, args.compressor
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+solver_io
+
+Bulk parser for the solver output of LBIBCell (Cells_*.txt), every line holds
+the lattice node (x, y) and the solver values separated by tab, i.e.
+
+    0	0	...	...	...	0.0123
+
+The columns are read in large chunks straight into typed arrays instead of
+walking the file line by line. The parsed lattice is cached as <name>.npy
+next to the solver output and memory-mapped on the next run as long as the
+solver output is unchanged.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import re
+import glob
+import json
+import hashlib
+import warnings
+import numpy as np
+
+# column of the lattice node and the concentration in Cells_*.txt
+X_COL = 0
+Y_COL = 1
+C_COL = 5
+# number of lines parsed at once
+CHUNK_ROWS = 1 << 18
+
+
+def discover_solver_out(dir, suffix=""):
+    """Solver outputs Cells_<timestep><suffix>.txt of dir
+
+    Parameters
+    ----------
+    dir : str
+        Directory with the solver outputs
+    suffix : str, optional
+        "" for the solver outputs (the Cells_*_to_fit.txt next to them are
+        left out), "_to_fit" for the profiles, by default ""
+
+    Returns
+    -------
+    list of (int, str)
+        Timestep and path of every file, sorted by timestep
+    """
+    pattern = re.compile(r"^Cells_(\d+){}\.txt$".format(re.escape(suffix)))
+    found = []
+    for file in glob.glob(os.path.join(glob.escape(dir), "Cells_*.txt")):
+        match = pattern.match(os.path.basename(file))
+        if match:
+            found.append((int(match.group(1)), file))
+
+    return sorted(found)
+
+
+def iter_solver_chunks(filename, c_col=C_COL, chunk_rows=CHUNK_ROWS):
+    """Iterate over the solver output in chunks of lines
+
+    Parameters
+    ----------
+    filename : str
+        Path to the solver output, i.e. Cells_4000.txt
+    c_col : int, optional
+        Column of the concentration, by default 5
+    chunk_rows : int, optional
+        Number of lines parsed per chunk, by default 262144
+
+    Yields
+    ------
+    x : np.ndarray of int
+        X coordinates of the lattice nodes in the chunk
+    y : np.ndarray of int
+        Y coordinates of the lattice nodes in the chunk
+    c : np.ndarray of float
+        Concentration on the lattice nodes in the chunk
+    """
+    with open(filename, "r") as f_out, warnings.catch_warnings():
+        # loadtxt warns once the file handle is exhausted
+        warnings.simplefilter("ignore", UserWarning)
+        while True:
+            chunk = np.loadtxt(
+                f_out,
+                delimiter="\t",
+                usecols=(X_COL, Y_COL, c_col),
+                max_rows=chunk_rows,
+                ndmin=2,
+            )
+            if chunk.shape[0] == 0:
+                break
+            yield chunk[:, 0].astype(np.intp), chunk[:, 1].astype(np.intp), chunk[:, 2]
+
+
+def read_solver_columns(filename, c_col=C_COL, chunk_rows=CHUNK_ROWS):
+    """Read the lattice nodes and the concentration of a solver output
+
+    Returns
+    -------
+    x, y, c : np.ndarray
+        See iter_solver_chunks
+    """
+    xs, ys, cs = [], [], []
+    for x, y, c in iter_solver_chunks(filename, c_col, chunk_rows):
+        xs.append(x)
+        ys.append(y)
+        cs.append(c)
+
+    if not xs:
+        return (
+            np.empty(0, dtype=np.intp),
+            np.empty(0, dtype=np.intp),
+            np.empty(0, dtype=float),
+        )
+
+    return np.concatenate(xs), np.concatenate(ys), np.concatenate(cs)
+
+
+def _scatter_chunks(filename, arr, seen, fill_value, c_col, chunk_rows, grow=True):
+    """Scatter the solver output into arr, growing it if shape is unknown"""
+    extent = (0, 0)
+    for x, y, c in iter_solver_chunks(filename, c_col, chunk_rows):
+        need = (int(x.max()) + 1, int(y.max()) + 1)
+        extent = (max(extent[0], need[0]), max(extent[1], need[1]))
+        if need[0] > arr.shape[0] or need[1] > arr.shape[1]:
+            if not grow or isinstance(arr, np.memmap):
+                raise ValueError(
+                    "{} exceeds the lattice size {}".format(filename, arr.shape)
+                )
+            # grow geometrically, the lattice is cropped to the data at the end
+            new_shape = tuple(
+                max(n, 2 * size) if n > size else size
+                for n, size in zip(need, arr.shape)
+            )
+            grown = np.full(new_shape, fill_value, dtype=arr.dtype)
+            grown[: arr.shape[0], : arr.shape[1]] = arr
+            arr = grown
+            if seen is not None:
+                grown = np.zeros(new_shape, dtype=bool)
+                grown[: seen.shape[0], : seen.shape[1]] = seen
+                seen = grown
+        arr[x, y] = c
+        if seen is not None:
+            seen[x, y] = True
+
+    return arr, seen, extent
+
+
+def read_solver_field(
+    filename,
+    shape=None,
+    c_col=C_COL,
+    chunk_rows=CHUNK_ROWS,
+    dtype=float,
+    fill_value=0.0,
+    masked=False,
+    out=None,
+):
+    """Scatter the concentration of a solver output into the lattice
+
+    Parameters
+    ----------
+    filename : str
+        Path to the solver output, i.e. Cells_4000.txt
+    shape : tuple of int, optional
+        Size of the lattice, by default taken from the largest node in the file
+    c_col : int, optional
+        Column of the concentration, by default 5
+    chunk_rows : int, optional
+        Number of lines parsed per chunk, by default 262144
+    dtype : np.dtype, optional
+        Storage type of the lattice, i.e. np.float32, by default float
+    fill_value : float, optional
+        Value of the nodes missing in the file, by default 0.0
+    masked : bool, optional
+        Return a masked array where the missing nodes are masked, by default False
+    out : np.ndarray, optional
+        Preallocated lattice (i.e. np.memmap) written in place, by default None
+
+    Returns
+    -------
+    np.ndarray or np.ma.MaskedArray
+        Concentration indexed as arr[x, y]
+
+    Raises
+    ------
+    ValueError
+        If the file has nodes outside of the given shape (or out)
+    """
+    if out is not None:
+        arr = out
+        arr[...] = fill_value
+    else:
+        arr = np.full(shape or (0, 0), fill_value, dtype=dtype)
+    seen = np.zeros(arr.shape, dtype=bool) if masked else None
+
+    # only an unknown shape grows, a given one is never exceeded
+    arr, seen, extent = _scatter_chunks(
+        filename,
+        arr,
+        seen,
+        fill_value,
+        c_col,
+        chunk_rows,
+        grow=shape is None and out is None,
+    )
+
+    if shape is None and out is None:
+        # crop the over-allocation of growing
+        arr = np.ascontiguousarray(arr[: extent[0], : extent[1]])
+        if seen is not None:
+            seen = seen[: extent[0], : extent[1]]
+
+    if masked:
+        return np.ma.masked_array(arr, mask=~seen)
+
+    return arr
+
+
+def chunked_mean(arr, axis=1, chunk_rows=256, ignore_nan=False):
+    """Mean of a 2D lattice computed over blocks of rows
+
+    Only chunk_rows rows are converted to float64 at once, so it works on
+    memory-mapped lattices larger than the memory.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        Concentration indexed as arr[x, y]
+    axis : int, optional
+        Axis averaged over, by default 1 (over y for each x)
+    chunk_rows : int, optional
+        Number of rows read per block, by default 256
+    ignore_nan : bool, optional
+        Skip the NaN nodes (missing nodes with fill_value=np.nan), by default False
+
+    Returns
+    -------
+    np.ndarray
+        Mean along axis
+    """
+    if axis not in (0, 1):
+        raise ValueError("axis should be 0 or 1, got {}".format(axis))
+
+    n_rows, n_cols = arr.shape
+    if axis == 1:
+        mean = np.empty(n_rows, dtype=float)
+    else:
+        total = np.zeros(n_cols, dtype=float)
+        count = np.zeros(n_cols, dtype=float)
+
+    for start in range(0, n_rows, chunk_rows):
+        block = np.asarray(arr[start : start + chunk_rows], dtype=float)
+        if axis == 1:
+            if ignore_nan:
+                with warnings.catch_warnings():
+                    # all NaN rows give NaN
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    mean[start : start + chunk_rows] = np.nanmean(block, axis=1)
+            else:
+                mean[start : start + chunk_rows] = np.mean(block, axis=1)
+        elif ignore_nan:
+            valid = ~np.isnan(block)
+            total += np.where(valid, block, 0.0).sum(axis=0)
+            count += valid.sum(axis=0)
+        else:
+            total += block.sum(axis=0)
+            count += block.shape[0]
+
+    if axis == 1:
+        return mean
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total / count
+
+
+def _cache_paths(filename, cache_dir=None):
+    """Path of the cached .npy and its metadata for a solver output"""
+    filename_no_ext, _ = os.path.splitext(filename)
+    if cache_dir is None:
+        npy_name = "{}.npy".format(filename_no_ext)
+    else:
+        # same Cells_*.txt names show up in every simulation directory
+        src_dir = os.path.dirname(os.path.abspath(filename))
+        tag = hashlib.sha1(src_dir.encode()).hexdigest()[:8]
+        npy_name = os.path.join(
+            cache_dir, "{}-{}.npy".format(os.path.basename(filename_no_ext), tag)
+        )
+
+    return npy_name, "{}.json".format(npy_name)
+
+
+def _is_cache_valid(filename, npy_name, meta_name, shape, options):
+    """Whether the cached .npy still matches the solver output"""
+    try:
+        src = os.stat(filename)
+        npy = os.stat(npy_name)
+        with open(meta_name, "r") as f_meta:
+            meta = json.load(f_meta)
+    except (OSError, ValueError):
+        return False
+
+    return (
+        meta.get("size") == src.st_size
+        and meta.get("mtime_ns") == src.st_mtime_ns
+        and npy.st_mtime_ns >= src.st_mtime_ns
+        and (shape is None or meta.get("shape") == list(shape))
+        and all(meta.get(key) == value for key, value in options.items())
+    )
+
+
+def evict_cache(cache_dir, max_cache_bytes, keep=()):
+    """Remove the least recently used .npy in cache_dir until it fits max_cache_bytes
+
+    Only .npy with a metadata file written by load_solver_field are evicted.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cache
+    max_cache_bytes : int
+        Size limit of all cached .npy
+    keep : iterable of str, optional
+        Paths of .npy never evicted, by default ()
+
+    Returns
+    -------
+    int
+        Number of bytes removed
+    """
+    keep = set(os.path.abspath(p) for p in keep)
+    entries = []
+    total = 0
+    for meta_name in glob.glob(os.path.join(cache_dir, "*.npy.json")):
+        npy_name = meta_name[: -len(".json")]
+        try:
+            size = os.path.getsize(npy_name)
+            last_used = os.path.getmtime(meta_name)
+        except OSError:
+            continue
+        total += size
+        if os.path.abspath(npy_name) not in keep:
+            entries.append((last_used, size, npy_name, meta_name))
+
+    removed = 0
+    for _, size, npy_name, meta_name in sorted(entries):
+        if total <= max_cache_bytes:
+            break
+        for path in (meta_name, npy_name):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        removed += size
+
+    return removed
+
+
+def load_solver_field(
+    filename,
+    shape=None,
+    c_col=C_COL,
+    dtype=float,
+    fill_value=0.0,
+    cache_dir=None,
+    max_cache_bytes=None,
+):
+    """Load a solver output through the .npy cache
+
+    The cached .npy is memory-mapped read-only if it was written from the
+    same solver output (size and mtime recorded), otherwise the solver output
+    is parsed again and the cache rebuilt. With a known shape the lattice is
+    scattered straight into the memory-mapped .npy, so it is never held in
+    memory as a whole.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the solver output, i.e. Cells_4000.txt
+    shape : tuple of int, optional
+        Size of the lattice, by default taken from the largest node in the file
+    c_col : int, optional
+        Column of the concentration, by default 5
+    dtype : np.dtype, optional
+        Storage type of the lattice, i.e. np.float32, by default float
+    fill_value : float, optional
+        Value of the nodes missing in the file, by default 0.0
+    cache_dir : str, optional
+        Directory of the cache, by default next to the solver output
+    max_cache_bytes : int, optional
+        Size limit of cache_dir, by default unbounded
+
+    Returns
+    -------
+    np.ndarray
+        Concentration indexed as arr[x, y]
+    """
+    npy_name, meta_name = _cache_paths(filename, cache_dir)
+    options = {"c_col": c_col, "dtype": np.dtype(dtype).str, "fill": repr(fill_value)}
+
+    if _is_cache_valid(filename, npy_name, meta_name, shape, options):
+        os.utime(meta_name)  # mark as recently used for eviction
+        return np.load(npy_name, mmap_mode="r")
+
+    src = os.stat(filename)
+
+    if cache_dir is not None and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    # write to a temp. file first, so no reader sees a half written cache
+    tmp_name = "{}.{}.tmp".format(npy_name, os.getpid())
+    if shape is not None:
+        out = np.lib.format.open_memmap(tmp_name, mode="w+", dtype=dtype, shape=shape)
+        read_solver_field(filename, shape, c_col, fill_value=fill_value, out=out)
+        out.flush()
+        del out
+    else:
+        arr = read_solver_field(
+            filename, None, c_col, dtype=dtype, fill_value=fill_value
+        )
+        shape = arr.shape
+        with open(tmp_name, "wb") as f_npy:
+            np.save(f_npy, arr)
+        del arr
+    os.replace(tmp_name, npy_name)
+
+    meta = {
+        "source": os.path.abspath(filename),
+        "size": src.st_size,
+        "mtime_ns": src.st_mtime_ns,
+        "shape": list(shape),
+    }
+    meta.update(options)
+    with open(meta_name, "w") as f_meta:
+        json.dump(meta, f_meta)
+
+    if max_cache_bytes is not None:
+        evict_cache(os.path.dirname(npy_name) or ".", max_cache_bytes, keep=[npy_name])
+
+    return np.load(npy_name, mmap_mode="r")
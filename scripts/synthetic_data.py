@@ -0,0 +1,141 @@
+"""
+synthetic_data
+
+Synthetic inputs in the formats of LBIBCell for benchmarking and trying the
+scripts out without a simulation:
+
+    - solver outputs Cells_<timestep>.txt: every lattice node (x, y) with
+      the concentration in column 5, decaying exponentially along x away
+      from a source
+    - tissues as vtp: N polygon cells on a grid with the point array
+      cell_type, the cells of the first column are the source (type 1)
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import numpy as np
+
+from solver_io import C_COL
+
+
+def solver_field(nx, ny, lam=50.0, source_x=None, noise=0.0, seed=None):
+    """Concentration on a nx x ny lattice decaying along x
+
+    Parameters
+    ----------
+    nx, ny : int
+        Size of the lattice
+    lam : float, optional
+        Decay length, by default 50
+    source_x : float, optional
+        x of the source, by default nx / 10
+    noise : float, optional
+        Std. of the gaussian noise added, by default none
+    seed : int, optional
+        Seed of the noise
+
+    Returns
+    -------
+    np.ndarray
+        (nx, ny) concentration
+    """
+    source_x = nx / 10 if source_x is None else source_x
+    x = np.arange(nx, dtype=float)
+    profile = np.where(
+        x <= source_x,
+        1 - 0.5 * np.exp((x - source_x) / lam),
+        0.5 * np.exp(-(x - source_x) / lam),
+    )
+    c = np.repeat(profile[:, None], ny, axis=1)
+    if noise:
+        c += np.random.default_rng(seed).normal(0, noise, c.shape)
+
+    return c
+
+
+def write_solver_out(filename, c, n_cols=C_COL + 1):
+    """Write a concentration (nx, ny) as a solver output Cells_*.txt
+
+    The columns between y and the concentration are written as 0.
+    """
+    nx, ny = c.shape
+    x, y = np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij")
+    data = np.zeros((nx * ny, n_cols))
+    data[:, 0] = x.ravel()
+    data[:, 1] = y.ravel()
+    data[:, C_COL] = c.ravel()
+    fmt = ["%d", "%d"] + ["%g"] * (n_cols - 3) + ["%.10e"]
+    np.savetxt(filename, data, fmt=fmt, delimiter="\t")
+
+
+def tissue_arrays(n_cells, n_vertices=12, cell_size=20.0, n_source_cols=1, seed=None):
+    """Polygons of a tissue of n_cells on a square grid
+
+    Every cell owns its points, as written by vtkCellReporter. The vertices
+    are jittered radially when seed is given.
+
+    Parameters
+    ----------
+    n_cells : int
+        Number of cells
+    n_vertices : int, optional
+        Number of vertices per cell, by default 12
+    cell_size : float, optional
+        Distance between the cell centers, by default 20
+    n_source_cols : int, optional
+        Number of columns of cells of type 1, by default 1
+    seed : int, optional
+        Seed of the jitter, by default none
+
+    Returns
+    -------
+    points : np.ndarray
+        (n_cells * n_vertices, 3) coordinates
+    polys : np.ndarray
+        (n_cells, n_vertices) point ids of every cell
+    cell_type : np.ndarray
+        (n_cells * n_vertices) cell type of every point
+    """
+    n_rows = max(int(np.ceil(np.sqrt(n_cells))), 1)
+    ids = np.arange(n_cells)
+    # column by column, so the first columns are at low x
+    center_x = (ids // n_rows + 0.5) * cell_size
+    center_y = (ids % n_rows + 0.5) * cell_size
+
+    angle = 2 * np.pi * np.arange(n_vertices) / n_vertices
+    radius = np.full((n_cells, n_vertices), 0.45 * cell_size)
+    if seed is not None:
+        radius *= np.random.default_rng(seed).uniform(0.9, 1.0, radius.shape)
+
+    points = np.zeros((n_cells * n_vertices, 3))
+    points[:, 0] = (center_x[:, None] + radius * np.cos(angle)).ravel()
+    points[:, 1] = (center_y[:, None] + radius * np.sin(angle)).ravel()
+    polys = np.arange(n_cells * n_vertices).reshape(n_cells, n_vertices)
+    cell_type = np.repeat((ids // n_rows < n_source_cols).astype(float), n_vertices)
+
+    return points, polys, cell_type
+
+
+def tissue_polydata(n_cells, **kwargs):
+    """Tissue of n_cells as vtkPolyData, see tissue_arrays"""
+    from vtk import vtkCellArray, vtkPoints, vtkPolyData
+    from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+    points, polys, cell_type = tissue_arrays(n_cells, **kwargs)
+
+    vtk_points = vtkPoints()
+    vtk_points.SetData(numpy_to_vtk(points, deep=True))
+    offsets = np.arange(polys.shape[0] + 1, dtype=np.int64) * polys.shape[1]
+    vtk_polys = vtkCellArray()
+    vtk_polys.SetData(
+        numpy_to_vtkIdTypeArray(offsets, deep=True),
+        numpy_to_vtkIdTypeArray(polys.ravel().astype(np.int64), deep=True),
+    )
+    array = numpy_to_vtk(cell_type, deep=True)
+    array.SetName("cell_type")
+
+    polyData = vtkPolyData()
+    polyData.SetPoints(vtk_points)
+    polyData.SetPolys(vtk_polys)
+    polyData.GetPointData().AddArray(array)
+
+    return polyData
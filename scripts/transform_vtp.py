@@ -0,0 +1,323 @@
+"""
+transform_vtp
+
+Apply a chain of affine transforms on the points of many vtp (from
+vtkCellReporter), or of every frame of reporter output dirs, in one process
+with a pool of workers. The operations are applied left to right in the
+xy-plane, z is left as it is:
+
+    translate:DX,DY             move by (DX, DY)
+    rotate:DEG[,CX,CY]          rotate counterclockwise around (CX, CY),
+                                by default the origin
+    scale:S[,SY[,CX,CY]]        scale by S (and SY along y) around (CX, CY)
+    mirror:x|y[,C]              mirror the x (or y) coordinates around C
+
+The chain is composed into one 2x3 matrix and the points are updated in
+place in the array of the vtkPolyData, without copying them.
+
+Example: python3 transform_vtp.py -i output --ops rotate:90,500,500 translate:-350,0 --output_dir moved
+
+writes moved/output/Cells_<timestep>/Cells_<timestep>_0.vtp, the outputs of
+two inputs at the same path are rejected before anything is written.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+
+from instrument import stage, add_instrument_arguments, configure_from_args
+from vtp_numpy import VtpPolyData
+
+OPERATIONS = ("translate", "rotate", "scale", "mirror")
+
+
+def _around(matrix, center):
+    """Affine 3x3 of the linear 2x2 matrix applied around center"""
+    affine = np.eye(3)
+    affine[:2, :2] = matrix
+    affine[:2, 2] = np.asarray(center) - matrix @ np.asarray(center)
+
+    return affine
+
+
+def parse_operation(text):
+    """Affine 3x3 matrix of an operation, i.e. "rotate:90,500,500"
+
+    Raises
+    ------
+    ValueError
+        If the operation is unknown or its arguments not valid
+    """
+    name, _, values = text.partition(":")
+    name = name.strip().lower()
+    if name not in OPERATIONS:
+        raise ValueError(
+            "Operation {} unknown, should be one of {}".format(text, OPERATIONS)
+        )
+    args = [value.strip() for value in values.split(",")] if values else []
+
+    try:
+        if name == "mirror":
+            if len(args) not in (1, 2) or args[0] not in ("x", "y"):
+                raise ValueError
+            axis = 0 if args[0] == "x" else 1
+            center = np.zeros(2)
+            center[axis] = float(args[1]) if len(args) == 2 else 0.0
+            matrix = np.eye(2)
+            matrix[axis, axis] = -1.0
+            return _around(matrix, center)
+
+        args = [float(arg) for arg in args]
+        if name == "translate":
+            if len(args) != 2:
+                raise ValueError
+            affine = np.eye(3)
+            affine[:2, 2] = args
+            return affine
+        if name == "rotate":
+            if len(args) not in (1, 3):
+                raise ValueError
+            theta = np.deg2rad(args[0])
+            matrix = np.array(
+                [[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]]
+            )
+            return _around(matrix, args[1:] or (0.0, 0.0))
+        # scale
+        if len(args) == 1:
+            args = args * 2
+        if len(args) not in (2, 4):
+            raise ValueError
+        return _around(np.diag(args[:2]), args[2:] or (0.0, 0.0))
+    except ValueError:
+        raise ValueError(
+            "Operation {} not valid, see the doc of transform_vtp".format(text)
+        ) from None
+
+
+def compose(operations):
+    """2x3 matrix of the chain of operations, applied left to right
+
+    Parameters
+    ----------
+    operations : list of str or np.ndarray
+        Operations as in parse_operation, or affine 3x3 matrices
+
+    Returns
+    -------
+    np.ndarray
+        (2, 3) [A | b], a point p goes to A @ p + b
+    """
+    affine = np.eye(3)
+    for operation in operations:
+        if isinstance(operation, str):
+            operation = parse_operation(operation)
+        affine = np.asarray(operation, dtype=float) @ affine
+
+    return affine[:2]
+
+
+def transform_points(points, affine):
+    """Apply a 2x3 matrix in place on the x and y of points (n, 3)"""
+    xy = points[:, :2]
+    # one temporary of the new xy, written back into the same buffer
+    xy[...] = xy @ affine[:, :2].T + affine[:, 2]
+
+    return points
+
+
+def transform_polydata(polyData, affine):
+    """Apply a 2x3 matrix in place on the points of a vtkPolyData
+
+    A vtp_numpy.VtpPolyData is updated in place as well.
+    """
+    if isinstance(polyData, VtpPolyData):
+        transform_points(polyData.points, affine)
+        return polyData
+
+    from vtk.util.numpy_support import vtk_to_numpy
+
+    points = polyData.GetPoints()
+    if points is None or points.GetNumberOfPoints() == 0:
+        return polyData
+    # a view of the vtk array, the update needs no copy back
+    transform_points(vtk_to_numpy(points.GetData()), affine)
+    points.Modified()
+    polyData.Modified()
+
+    return polyData
+
+
+def transform_vtp(
+    input_file, output_file, operations, data_mode="binary", compressor="zlib"
+):
+    """Read a vtp, transform its points and write it
+
+    Parameters
+    ----------
+    input_file : str
+        Input vtp
+    output_file : str
+        Output vtp
+    operations : list of str or np.ndarray
+        See compose
+
+    Returns
+    -------
+    str
+        The output vtp
+    """
+    from vtk_io import read_polydata, write_polydata
+
+    affine = compose(operations)
+    polyData = read_polydata(input_file)
+    with stage("edit", file=input_file):
+        transform_polydata(polyData, affine)
+    write_polydata(polyData, output_file, data_mode, compressor)
+
+    return output_file
+
+
+def list_inputs(inputs):
+    """vtp of the inputs, reporter output dirs expanded to all their frames
+
+    Returns
+    -------
+    list of (str, str)
+        Path of every vtp and its path relative to its input root, i.e.
+        output/Cells_100/Cells_100_0.vtp for the dir output, the name of the
+        file for an input vtp
+    """
+    from reporter_timeline import discover_timesteps
+
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            frames = discover_timesteps(path)
+            if not frames:
+                print("No cell reporter files found in {}, skipped".format(path))
+            # keep the dir name, the frames of two dirs have the same names
+            root = os.path.dirname(os.path.abspath(path))
+            files.extend(
+                (vtp, os.path.relpath(os.path.abspath(vtp), root)) for _, vtp in frames
+            )
+        else:
+            files.append((path, os.path.basename(path)))
+
+    return files
+
+
+def transform_many(jobs, operations, workers=None, **kwargs):
+    """Transform the vtp in a pool of processes
+
+    Parameters
+    ----------
+    jobs : list of (str, str)
+        Input and output vtp
+    operations : list of str or np.ndarray
+        See compose
+    workers : int, optional
+        Number of processes, by default os.cpu_count()
+    **kwargs
+        Passed to transform_vtp
+
+    Returns
+    -------
+    list of str
+        Input vtp failed
+    """
+    from vtk_io import map_vtp
+
+    # parse once here, the workers get the matrix
+    affine = np.vstack((compose(operations), [0.0, 0.0, 1.0]))
+
+    return map_vtp(transform_vtp, jobs, workers, operations=[affine], **kwargs)
+
+
+def main(argv=None, prog=None):
+    from vtk_io import add_writer_arguments, plan_outputs
+
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Translate, rotate, scale or mirror many vtp",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "-i",
+        "--inputs",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Input vtp or cell reporter output dirs",
+    )
+    parser.add_argument(
+        "--ops",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Operations applied left to right:\n"
+        "translate:DX,DY\n"
+        "rotate:DEG[,CX,CY]\n"
+        "scale:S[,SY[,CX,CY]]\n"
+        "mirror:x|y[,C]",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Write the outputs here under their paths relative to the\n"
+        "inputs (a dir keeps its name), by default <name>_moved.vtp\n"
+        "next to every input",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="Output vtp of a single input vtp",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="Number of processes"
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Overwrite existing outputs"
+    )
+    add_writer_arguments(parser)
+    add_instrument_arguments(parser)
+    args = parser.parse_args(argv)
+    configure_from_args(args)
+
+    try:
+        compose(args.ops)
+    except ValueError as err:
+        print(err)
+        sys.exit(1)
+    try:
+        jobs = plan_outputs(
+            list_inputs(args.inputs),
+            args.output_dir,
+            "_moved",
+            args.output,
+            args.force,
+        )
+    except ValueError as err:
+        print(err)
+        sys.exit(1)
+
+    failed = transform_many(
+        jobs,
+        args.ops,
+        args.workers,
+        data_mode="ascii" if args.ascii else "binary",
+        compressor=args.compressor,
+    )
+    print("{:d} vtp transformed".format(len(jobs) - len(failed)))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+vtk_io
+
+Read and write the vtkPolyData (vtp) of vtkCellReporter in LBIBCell.
+
+The vtp are written as appended raw binary compressed by zlib by default,
+ASCII is only meant for debugging since writing and parsing it again is
+slow and Float32 points lose precision.
+
+The vtp are read by the numpy reader of vtp_numpy by default, vtk is only
+imported for the files out of its subset or with backend "vtk" (or the
+environment variable LBIBCELL_VTP_BACKEND=vtk). Both kinds of data are
+handled by cell_geometry.cell_arrays and written back by write_polydata.
+
+The scripts editing many vtp pair the inputs with their outputs by
+plan_outputs and run the edit of every vtp in a pool by map_vtp.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from instrument import stage
+from vtp_numpy import VtpPolyData, UnsupportedVtp, read_vtp, write_vtp
+
+DATA_MODES = ("binary", "ascii")
+COMPRESSORS = ("zlib", "lz4", "none")
+BACKENDS = ("auto", "numpy", "vtk")
+BACKEND_ENV = "LBIBCELL_VTP_BACKEND"
+
+
+def read_polydata(filename, backend=None):
+    """Read a vtp into a VtpPolyData or a vtkPolyData
+
+    Parameters
+    ----------
+    filename : str
+        Path to the vtp
+    backend : str, optional
+        "numpy" (VtpPolyData), "vtk" (vtkPolyData) or "auto", numpy and vtk
+        for the files numpy cannot read, by default LBIBCELL_VTP_BACKEND or
+        "auto"
+    """
+    backend = backend or os.environ.get(BACKEND_ENV, "auto")
+    if backend not in BACKENDS:
+        raise ValueError("backend should be one of {}".format(BACKENDS))
+
+    if backend != "vtk":
+        try:
+            with stage("vtk_read", file=filename, backend="numpy"):
+                return read_vtp(filename)
+        except UnsupportedVtp as err:
+            if backend == "numpy":
+                raise
+            print("{}, read by vtk".format(err))
+
+    from vtk import vtkXMLPolyDataReader
+
+    with stage("vtk_read", file=filename, backend="vtk"):
+        reader = vtkXMLPolyDataReader()
+        reader.SetFileName(filename)
+        reader.Update()
+
+    return reader.GetOutput()
+
+
+def _write_vtk(polyData, filename, data_mode, compressor):
+    from vtk import vtkXMLPolyDataWriter
+
+    if isinstance(polyData, VtpPolyData):
+        polyData = polyData.to_vtk()
+    writer = vtkXMLPolyDataWriter()
+    writer.SetFileName(filename)
+    writer.SetInputData(polyData)
+    if data_mode == "ascii":
+        writer.SetDataModeToAscii()
+        writer.SetCompressorTypeToNone()
+    else:
+        writer.SetDataModeToAppended()
+        writer.EncodeAppendedDataOff()
+        if compressor == "zlib":
+            writer.SetCompressorTypeToZLib()
+        elif compressor == "lz4":
+            writer.SetCompressorTypeToLZ4()
+        else:
+            writer.SetCompressorTypeToNone()
+    if writer.Write() != 1:
+        raise IOError("Writing {} failed".format(filename))
+
+
+def write_polydata(polyData, filename, data_mode="binary", compressor="zlib"):
+    """Write a VtpPolyData or a vtkPolyData into a vtp
+
+    Parameters
+    ----------
+    polyData : VtpPolyData or vtkPolyData
+        Data to write, a VtpPolyData goes through vtk only for lz4
+    filename : str
+        Path to the vtp
+    data_mode : str, optional
+        "binary" (appended raw) or "ascii", by default "binary"
+    compressor : str, optional
+        "zlib", "lz4" or "none", only for binary, by default "zlib"
+
+    Returns
+    -------
+    nbytes : int
+        Size of the vtp written
+    elapsed : float
+        Time spent in seconds
+    """
+    if data_mode not in DATA_MODES:
+        raise ValueError("data_mode should be one of {}".format(DATA_MODES))
+    if compressor not in COMPRESSORS:
+        raise ValueError("compressor should be one of {}".format(COMPRESSORS))
+
+    # lz4 is only written by vtk
+    backend = "numpy"
+    if not isinstance(polyData, VtpPolyData) or compressor == "lz4":
+        backend = "vtk"
+
+    start = time.time()
+    with stage(
+        "vtk_write",
+        file=filename,
+        data_mode=data_mode,
+        compressor=compressor,
+        backend=backend,
+    ):
+        if backend == "numpy":
+            write_vtp(filename, polyData, data_mode, compressor)
+        else:
+            _write_vtk(polyData, filename, data_mode, compressor)
+    elapsed = time.time() - start
+    nbytes = os.path.getsize(filename)
+    print(
+        "Saved to {} ({:.1f} kB {}, {:.3f}s)".format(
+            filename, nbytes / 1e3, data_mode, elapsed
+        )
+    )
+
+    return nbytes, elapsed
+
+
+def add_writer_arguments(parser):
+    """Add --ascii and --compressor to an argparse parser"""
+    parser.add_argument(
+        "--ascii",
+        action="store_true",
+        help="Write the vtp as ASCII for debugging, by default appended binary",
+    )
+    parser.add_argument(
+        "--compressor",
+        type=str,
+        choices=COMPRESSORS,
+        default="zlib",
+        help="Compression of the binary vtp, by default zlib",
+    )
+
+
+def plan_outputs(inputs, output_dir=None, suffix="_out", output=None, force=False):
+    """Pair every input vtp with its output, the existing outputs are skipped
+
+    Parameters
+    ----------
+    inputs : list of str or (str, str)
+        Input vtp, or input vtp and its path relative to its input root
+        (by default its name)
+    output_dir : str, optional
+        Write the outputs here under their relative paths, by default
+        <name><suffix>.vtp next to every input
+    suffix : str, optional
+        Suffix of the outputs next to the inputs, by default "_out"
+    output : str, optional
+        Output vtp of a single input
+    force : bool, optional
+        Overwrite the existing outputs, by default False
+
+    Returns
+    -------
+    list of (str, str)
+        Input and output vtp to write, the dirs of the outputs created
+
+    Raises
+    ------
+    ValueError
+        If an input is not a vtp, or two inputs would have the same output
+    """
+    inputs = [
+        (path, os.path.basename(path)) if isinstance(path, str) else path
+        for path in inputs
+    ]
+    if output is not None and (len(inputs) != 1 or output_dir):
+        raise ValueError("An output file is for a single input vtp, use an output dir")
+
+    jobs = []
+    outputs = {}
+    for input_file, rel_path in inputs:
+        name, ext = os.path.splitext(os.path.basename(input_file))
+        if not os.path.exists(input_file) or ext != ".vtp":
+            raise ValueError("{} not valid, should be a vtp file".format(input_file))
+        if output is not None:
+            out = output
+        elif output_dir:
+            out = os.path.join(output_dir, rel_path)
+        else:
+            out = os.path.join(os.path.dirname(input_file), name + suffix + ext)
+        # checked before anything is written
+        key = os.path.abspath(out)
+        if key in outputs:
+            raise ValueError(
+                "{} and {} would both be written to {}".format(
+                    outputs[key], input_file, out
+                )
+            )
+        outputs[key] = input_file
+        if key == os.path.abspath(input_file):
+            print("{} would overwrite its input, skipped".format(out))
+            continue
+        if os.path.exists(out) and not force:
+            print("{} exist, skipped (--force to overwrite)".format(out))
+            continue
+        jobs.append((input_file, out))
+
+    for _, out in jobs:
+        if os.path.dirname(out):
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+
+    return jobs
+
+
+def map_vtp(func, jobs, workers=None, report=None, **kwargs):
+    """Run func(input_file, output_file, **kwargs) on every vtp in a pool of processes
+
+    A failure is printed and the other vtp go on.
+
+    Parameters
+    ----------
+    func : callable
+        Edit of one vtp, defined at module level to be sent to the processes
+    jobs : list of (str, str)
+        Input and output vtp, see plan_outputs
+    workers : int, optional
+        Number of processes, by default os.cpu_count()
+    report : callable, optional
+        Called as report(input_file, result) here for every vtp done
+    **kwargs
+        Passed to func
+
+    Returns
+    -------
+    list of str
+        Input vtp failed
+    """
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (input_file, executor.submit(func, input_file, output_file, **kwargs))
+            for input_file, output_file in jobs
+        ]
+        for input_file, future in futures:
+            try:
+                result = future.result()
+            except Exception as err:
+                failed.append(input_file)
+                print("{} failed: {}".format(input_file, err))
+                continue
+            if report is not None:
+                report(input_file, result)
+
+    return failed
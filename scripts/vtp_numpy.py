@@ -0,0 +1,475 @@
+"""
+vtp_numpy
+
+Read and write the vtp of vtkCellReporter in LBIBCell with numpy only,
+without importing vtk. Only the subset of the VTK XML PolyData format
+LBIBCell and vtkXMLPolyDataWriter emit for it is handled:
+
+    - one Piece with Points, Polys, PointData and CellData
+    - format ascii, binary (inline base64) or appended (raw or base64)
+    - no compressor or vtkZLibDataCompressor, header_type UInt32 or UInt64,
+      LittleEndian or BigEndian
+
+Anything else (Verts, Lines, Strips, LZ4, several pieces) raises
+UnsupportedVtp, see vtk_io.read_polydata for the fallback to vtk.
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import re
+import zlib
+import base64
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+VTK_TYPES = {
+    "Int8": "i1",
+    "UInt8": "u1",
+    "Int16": "i2",
+    "UInt16": "u2",
+    "Int32": "i4",
+    "UInt32": "u4",
+    "Int64": "i8",
+    "UInt64": "u8",
+    "Float32": "f4",
+    "Float64": "f8",
+}
+NUMPY_TYPES = {
+    np.dtype(code).newbyteorder("<"): name for name, code in VTK_TYPES.items()
+}
+ZLIB_COMPRESSOR = "vtkZLibDataCompressor"
+# uncompressed size of the zlib blocks, as vtkXMLWriter
+BLOCK_SIZE = 32768
+
+
+class UnsupportedVtp(ValueError):
+    """The vtp is outside of the subset read by vtp_numpy"""
+
+
+class VtpPolyData:
+    """Polygons and data arrays of a vtp as numpy arrays
+
+    Attributes
+    ----------
+    points : np.ndarray
+        (nb of points, 3) coordinates
+    connectivity : np.ndarray
+        Point ids of all polygons one after another
+    offsets : np.ndarray
+        (nb of cells + 1) start of every polygon in connectivity
+    point_data : dict of np.ndarray
+        Point arrays by name, (nb of points[, nb of components])
+    cell_data : dict of np.ndarray
+        Cell arrays by name, (nb of cells[, nb of components])
+    """
+
+    def __init__(self, points, connectivity, offsets, point_data=None, cell_data=None):
+        self.points = points
+        self.connectivity = connectivity
+        self.offsets = offsets
+        self.point_data = point_data if point_data is not None else {}
+        self.cell_data = cell_data if cell_data is not None else {}
+
+    @property
+    def n_points(self):
+        return self.points.shape[0]
+
+    @property
+    def n_cells(self):
+        return self.offsets.shape[0] - 1
+
+    @classmethod
+    def from_vtk(cls, polyData):
+        """Copy of the points, polygons and arrays of a vtkPolyData"""
+        from vtk.util.numpy_support import vtk_to_numpy
+        from cell_geometry import _polys_to_numpy
+
+        points = np.array(vtk_to_numpy(polyData.GetPoints().GetData()))
+        connectivity, offsets = _polys_to_numpy(polyData.GetPolys())
+        data = []
+        for vtk_data in (polyData.GetPointData(), polyData.GetCellData()):
+            arrays = {}
+            for i in range(vtk_data.GetNumberOfArrays()):
+                array = vtk_data.GetArray(i)
+                if array is not None:
+                    arrays[array.GetName()] = np.array(vtk_to_numpy(array))
+            data.append(arrays)
+
+        return cls(points, np.array(connectivity), np.array(offsets), *data)
+
+    def to_vtk(self):
+        """vtkPolyData with a copy of the arrays"""
+        from vtk import vtkCellArray, vtkPoints, vtkPolyData
+        from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+        points = vtkPoints()
+        points.SetData(numpy_to_vtk(np.ascontiguousarray(self.points), deep=True))
+        polys = vtkCellArray()
+        polys.SetData(
+            numpy_to_vtkIdTypeArray(self.offsets.astype(np.int64), deep=True),
+            numpy_to_vtkIdTypeArray(self.connectivity.astype(np.int64), deep=True),
+        )
+        polyData = vtkPolyData()
+        polyData.SetPoints(points)
+        polyData.SetPolys(polys)
+        for arrays, vtk_data in (
+            (self.point_data, polyData.GetPointData()),
+            (self.cell_data, polyData.GetCellData()),
+        ):
+            for name, values in arrays.items():
+                array = numpy_to_vtk(np.ascontiguousarray(values), deep=True)
+                array.SetName(name)
+                vtk_data.AddArray(array)
+
+        return polyData
+
+
+class _Decoder:
+    """Decode the DataArray of one vtp, see read_vtp"""
+
+    def __init__(self, root, appended, encoding):
+        big_endian = root.get("byte_order", "LittleEndian") == "BigEndian"
+        self.byte_order = ">" if big_endian else "<"
+        header_type = root.get("header_type", "UInt32")
+        if header_type not in ("UInt32", "UInt64"):
+            raise UnsupportedVtp("header_type {} unknown".format(header_type))
+        self.header_dtype = np.dtype(self.byte_order + VTK_TYPES[header_type])
+        compressor = root.get("compressor")
+        if compressor not in (None, "", ZLIB_COMPRESSOR):
+            raise UnsupportedVtp("compressor {} not supported".format(compressor))
+        self.compressed = bool(compressor)
+        self.appended = appended
+        self.encoding = encoding
+
+    def _header(self, read, n):
+        """n header integers, read(nbytes) gives the next bytes"""
+        return np.frombuffer(read(n * self.header_dtype.itemsize), self.header_dtype)
+
+    def _payload(self, read, read_header):
+        """Bytes of an array, headers through read_header, data through read"""
+        if not self.compressed:
+            (nbytes,) = self._header(read_header, 1)
+            return read(int(nbytes))
+
+        n_blocks, block_size, last_size = self._header(read_header, 3)
+        sizes = self._header(read_header, int(n_blocks))
+        if n_blocks == 0:
+            return bytearray()
+        total = int(block_size) * (int(n_blocks) - 1) + (
+            int(last_size) if last_size else int(block_size)
+        )
+        # decompress straight into one writable buffer
+        out = bytearray(total)
+        raw = read(int(sizes.sum()))
+        pos = out_pos = 0
+        for size in sizes:
+            block = zlib.decompress(raw[pos : pos + int(size)])
+            out[out_pos : out_pos + len(block)] = block
+            pos += int(size)
+            out_pos += len(block)
+
+        return out
+
+    def _base64(self, text, start=0):
+        """Payload of a base64 string from start, as vtkBase64OutputStream
+
+        Uncompressed, the header and the data are one base64 stream,
+        compressed the header is a stream of its own.
+        """
+        pos = [start]
+        # enough base64 to decode the first header integer only
+        n_peek = 4 * -(-self.header_dtype.itemsize // 3)
+
+        def read_stream(nbytes):
+            n_chars = 4 * -(-nbytes // 3)
+            chunk = base64.b64decode(text[pos[0] : pos[0] + n_chars])
+            pos[0] += n_chars
+            return chunk[:nbytes]
+
+        if not self.compressed:
+            # peek the size, then decode header and data together
+            head = base64.b64decode(text[start : start + n_peek])
+            (nbytes,) = np.frombuffer(
+                head[: self.header_dtype.itemsize], self.header_dtype
+            )
+            data = read_stream(self.header_dtype.itemsize + int(nbytes))
+            return bytearray(data[self.header_dtype.itemsize :])
+
+        # the header stream is decoded at once when its size is known
+        (n_blocks,) = np.frombuffer(
+            base64.b64decode(text[start : start + n_peek])[
+                : self.header_dtype.itemsize
+            ],
+            self.header_dtype,
+        )
+        header = read_stream((3 + int(n_blocks)) * self.header_dtype.itemsize)
+        header_pos = [0]
+
+        def read_header(nbytes):
+            chunk = header[header_pos[0] : header_pos[0] + nbytes]
+            header_pos[0] += nbytes
+            return chunk
+
+        return self._payload(read_stream, read_header)
+
+    def _raw(self, blob, start):
+        pos = [start]
+
+        def read(nbytes):
+            chunk = blob[pos[0] : pos[0] + nbytes]
+            pos[0] += nbytes
+            return chunk
+
+        return self._payload(read, read)
+
+    def decode(self, element):
+        """Numpy array of a DataArray element"""
+        vtk_type = element.get("type")
+        if vtk_type not in VTK_TYPES:
+            raise UnsupportedVtp("DataArray type {} not supported".format(vtk_type))
+        dtype = np.dtype(self.byte_order + VTK_TYPES[vtk_type])
+        n_components = int(element.get("NumberOfComponents", 1))
+        fmt = element.get("format")
+
+        if fmt == "ascii":
+            values = np.array(
+                (element.text or "").split(), dtype=dtype.newbyteorder("=")
+            )
+        elif fmt == "binary":
+            text = re.sub(rb"\s+", b"", (element.text or "").encode("ascii"))
+            values = np.frombuffer(self._base64(text), dtype)
+        elif fmt == "appended":
+            if self.appended is None:
+                raise UnsupportedVtp("appended DataArray without AppendedData")
+            offset = int(element.get("offset"))
+            if self.encoding == "base64":
+                payload = self._base64(self.appended, offset)
+            else:
+                payload = self._raw(self.appended, offset)
+            values = np.frombuffer(payload, dtype)
+        else:
+            raise UnsupportedVtp("DataArray format {} unknown".format(fmt))
+
+        if not values.dtype.isnative:
+            values = values.astype(values.dtype.newbyteorder("="))
+        if n_components > 1:
+            values = values.reshape(-1, n_components)
+
+        return values
+
+
+def read_vtp(filename):
+    """Read a vtp of LBIBCell into numpy arrays
+
+    Parameters
+    ----------
+    filename : str
+        Path to the vtp
+
+    Returns
+    -------
+    VtpPolyData
+        Writable arrays, the offsets start with 0
+
+    Raises
+    ------
+    UnsupportedVtp
+        If the vtp is outside of the subset described in the module doc
+    """
+    with open(filename, "rb") as f_in:
+        content = bytearray(os.fstat(f_in.fileno()).st_size)
+        f_in.readinto(content)
+
+    # the appended data is no xml, parse only what is before
+    appended, encoding = None, None
+    tag = content.find(b"<AppendedData")
+    if tag >= 0:
+        tag_end = content.index(b">", tag)
+        match = re.search(rb'encoding="(\w+)"', content[tag:tag_end])
+        encoding = match.group(1).decode() if match else "raw"
+        start = content.index(b"_", tag_end) + 1
+        appended = memoryview(content)[start:]
+        if encoding == "base64":
+            end = content.rfind(b"</AppendedData>")
+            appended = re.sub(rb"\s+", b"", bytes(content[start:end]))
+        root = ET.fromstring(bytes(content[:tag]) + b"</VTKFile>")
+    else:
+        root = ET.fromstring(bytes(content))
+
+    if root.get("type") != "PolyData":
+        raise UnsupportedVtp("{} is no PolyData".format(filename))
+    pieces = root.findall("PolyData/Piece")
+    if len(pieces) != 1:
+        raise UnsupportedVtp("{} has {:d} pieces".format(filename, len(pieces)))
+    piece = pieces[0]
+    for kind in ("Verts", "Lines", "Strips"):
+        if int(piece.get("NumberOf" + kind, 0)):
+            raise UnsupportedVtp("{} has {}".format(filename, kind))
+    decoder = _Decoder(root, appended, encoding)
+
+    n_points = int(piece.get("NumberOfPoints", 0))
+    element = piece.find("Points/DataArray")
+    if element is None:
+        points = np.zeros((n_points, 3))
+    else:
+        points = decoder.decode(element).reshape(n_points, 3)
+
+    connectivity = np.zeros(0, dtype=np.intp)
+    offsets = np.zeros(1, dtype=np.intp)
+    if int(piece.get("NumberOfPolys", 0)):
+        polys = {
+            element.get("Name"): decoder.decode(element)
+            for element in piece.findall("Polys/DataArray")
+        }
+        connectivity = polys["connectivity"].astype(np.intp, copy=False)
+        # the vtp stores the end of every polygon
+        offsets = np.concatenate(([0], polys["offsets"])).astype(np.intp)
+
+    data = []
+    for name in ("PointData", "CellData"):
+        arrays = {}
+        for i, element in enumerate(piece.findall(name + "/DataArray")):
+            arrays[element.get("Name", "array_{:d}".format(i))] = decoder.decode(
+                element
+            )
+        data.append(arrays)
+
+    return VtpPolyData(points, connectivity, offsets, *data)
+
+
+def _ascii_array(values, indent):
+    if values.dtype.kind == "f":
+        fmt = "%.17g" if values.dtype.itemsize == 8 else "%.9g"
+    else:
+        fmt = "%d"
+    flat = values.ravel()
+    lines = []
+    for start in range(0, flat.size, 6):
+        lines.append(
+            indent + " ".join(fmt % value for value in flat[start : start + 6])
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+def _encode_raw(values, compressed, header_dtype, level):
+    """Header and payload of an array, as vtkXMLWriter in appended raw"""
+    data = np.ascontiguousarray(values).tobytes()
+    if not compressed:
+        return np.array([len(data)], header_dtype).tobytes() + data
+
+    blocks = [
+        zlib.compress(data[start : start + BLOCK_SIZE], level)
+        for start in range(0, len(data), BLOCK_SIZE)
+    ]
+    last_size = len(data) % BLOCK_SIZE if blocks else 0
+    header = [len(blocks), BLOCK_SIZE, last_size] + [len(block) for block in blocks]
+
+    return np.array(header, header_dtype).tobytes() + b"".join(blocks)
+
+
+def write_vtp(
+    filename,
+    polyData,
+    data_mode="binary",
+    compressor="zlib",
+    header_type="UInt32",
+    level=5,
+):
+    """Write numpy arrays into a vtp read by vtkXMLPolyDataReader
+
+    Parameters
+    ----------
+    filename : str
+        Path to the vtp
+    polyData : VtpPolyData
+        Data to write
+    data_mode : str, optional
+        "binary" (appended raw) or "ascii", by default "binary"
+    compressor : str, optional
+        "zlib" or "none", only for binary, by default "zlib"
+    header_type : str, optional
+        "UInt32" or "UInt64", by default "UInt32" as vtkXMLWriter
+    level : int, optional
+        zlib compression level, by default 5 as vtkZLibDataCompressor
+
+    Returns
+    -------
+    int
+        Size of the vtp written
+    """
+    if data_mode not in ("binary", "ascii"):
+        raise ValueError("data_mode should be binary or ascii")
+    if compressor not in ("zlib", "none"):
+        raise UnsupportedVtp("compressor {} not supported".format(compressor))
+    header_dtype = np.dtype("<" + VTK_TYPES[header_type])
+    compressed = data_mode == "binary" and compressor == "zlib"
+
+    arrays = [
+        ("PointData", name, values) for name, values in polyData.point_data.items()
+    ]
+    arrays += [
+        ("CellData", name, values) for name, values in polyData.cell_data.items()
+    ]
+    arrays.append(("Points", "Points", polyData.points))
+    arrays.append(("Polys", "connectivity", polyData.connectivity.astype("<i8")))
+    arrays.append(("Polys", "offsets", polyData.offsets[1:].astype("<i8")))
+
+    sections = {"PointData": [], "CellData": [], "Points": [], "Polys": []}
+    blob = []
+    offset = 0
+    indent = " " * 8
+    for section, name, values in arrays:
+        values = np.asarray(values)
+        dtype = values.dtype.newbyteorder("<")
+        if dtype not in NUMPY_TYPES:
+            raise UnsupportedVtp("{} of dtype {} not supported".format(name, dtype))
+        values = values.astype(dtype, copy=False)
+        n_components = values.shape[1] if values.ndim > 1 else 1
+        attrs = 'type="{}" Name="{}"'.format(NUMPY_TYPES[dtype], name)
+        if n_components > 1:
+            attrs += ' NumberOfComponents="{:d}"'.format(n_components)
+        if data_mode == "ascii":
+            sections[section].append(
+                '{}<DataArray {} format="ascii">\n{}{}</DataArray>\n'.format(
+                    indent, attrs, _ascii_array(values, indent + "  "), indent
+                )
+            )
+        else:
+            encoded = _encode_raw(values, compressed, header_dtype, level)
+            sections[section].append(
+                '{}<DataArray {} format="appended" offset="{:d}"/>\n'.format(
+                    indent, attrs, offset
+                )
+            )
+            blob.append(encoded)
+            offset += len(encoded)
+
+    head = '<VTKFile type="PolyData" version="0.1" byte_order="LittleEndian"'
+    head += ' header_type="{}"'.format(header_type)
+    if compressed:
+        head += ' compressor="{}"'.format(ZLIB_COMPRESSOR)
+    xml = ['<?xml version="1.0"?>\n', head + ">\n", "  <PolyData>\n"]
+    xml.append(
+        '    <Piece NumberOfPoints="{:d}" NumberOfVerts="0" NumberOfLines="0" '
+        'NumberOfStrips="0" NumberOfPolys="{:d}">\n'.format(
+            polyData.n_points, polyData.n_cells
+        )
+    )
+    for section in ("PointData", "CellData", "Points", "Polys"):
+        xml.append("      <{}>\n".format(section))
+        xml.extend(sections[section])
+        xml.append("      </{}>\n".format(section))
+    xml.append("    </Piece>\n  </PolyData>\n")
+
+    with open(filename, "wb") as f_out:
+        f_out.write("".join(xml).encode("ascii"))
+        if blob:
+            f_out.write(b'  <AppendedData encoding="raw">\n   _')
+            for encoded in blob:
+                f_out.write(encoded)
+            f_out.write(b"\n  </AppendedData>\n")
+        f_out.write(b"</VTKFile>\n")
+
+    return os.path.getsize(filename)
@@ -0,0 +1,340 @@
+"""
+watch_solver_out
+
+Process the LBIBCell solver outputs (Cells_*.txt) while the simulation is
+still running: the output directories are polled, every completed
+Cells_<timestep>.txt is flattened into its Cells_<timestep>_to_fit.txt (as
+flatter_solver_output.py) and fitted against the exponential decay, and
+<dir>/lambda_vs_time.csv is updated.
+
+A solver output is complete once a later timestep exists or its size and
+modification time did not change over one polling interval. The timesteps
+processed are kept in <dir>/solver_manifest.json, so a restarted watcher
+resumes where it stopped and only redoes a file if it was rewritten.
+
+Example: python3 watch_solver_out.py --dirs output --source_vtp vtk/test_100_175cells.vtp --interval 30
+
+Author: Yongqi Wang <wangyong@student.ethz.ch>
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from fit_exp_decay import fit_exp
+from flatter_solver_output import get_source_mean, process_solver_out
+from solver_io import discover_solver_out
+
+MANIFEST_NAME = "solver_manifest.json"
+LAMBDA_CSV = "lambda_vs_time.csv"
+
+
+def load_manifest(dir):
+    """Timesteps processed in dir, {} if none"""
+    try:
+        with open(os.path.join(dir, MANIFEST_NAME)) as f_in:
+            return {int(step): entry for step, entry in json.load(f_in).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(dir, manifest):
+    """Write the manifest and lambda_vs_time.csv of dir atomically"""
+    name = os.path.join(dir, MANIFEST_NAME)
+    with open(name + ".tmp", "w") as f_out:
+        json.dump({str(step): manifest[step] for step in sorted(manifest)}, f_out)
+    os.replace(name + ".tmp", name)
+
+    name = os.path.join(dir, LAMBDA_CSV)
+    with open(name + ".tmp", "w") as f_out:
+        f_out.write("step,c0,lambda,b\n")
+        for step in sorted(manifest):
+            entry = manifest[step]
+            f_out.write(
+                "{:d},{:.10e},{:.10e},{:.10e}\n".format(
+                    step, entry["c0"], entry["lam"], entry["b"]
+                )
+            )
+    os.replace(name + ".tmp", name)
+
+
+def _stat(file):
+    stat = os.stat(file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def completed_solver_out(dir, last_seen):
+    """Solver outputs of dir that are done being written
+
+    Parameters
+    ----------
+    dir : str
+        Directory with the solver outputs
+    last_seen : dict
+        {file: (size, mtime_ns)} of the previous poll, updated in place
+
+    Returns
+    -------
+    list of (int, str)
+        Timestep and path of the complete outputs, sorted by timestep
+    """
+    found = discover_solver_out(dir)
+
+    complete = []
+    for i, (step, file) in enumerate(found):
+        try:
+            stat = _stat(file)
+        except OSError:
+            continue
+        # the solver moved on to a later timestep, or nothing changed since
+        if i + 1 < len(found) or last_seen.get(file) == stat:
+            complete.append((step, file))
+        last_seen[file] = stat
+
+    return complete
+
+
+def fit_to_fit(file, p0=None):
+    """Fit the Cells_<timestep>_to_fit.txt written next to a solver output
+
+    Returns
+    -------
+    tuple of float
+        C0, k, b, NaN if the fit failed
+    """
+    from scipy.optimize import OptimizeWarning
+
+    to_fit = np.loadtxt(
+        "{}_to_fit.txt".format(os.path.splitext(file)[0]), delimiter=",", ndmin=2
+    )
+    x, y = to_fit[:, 0], to_fit[:, 1]
+    # away from the source, as get_xy_section
+    x, y = x[x > 0], y[x > 0]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", OptimizeWarning)
+            return tuple(fit_exp(x, y, p0))
+    except (RuntimeError, ValueError, TypeError):
+        return np.nan, np.nan, np.nan
+
+
+def poll_once(dir, mean_y, manifest, last_seen, failed, executor=None, **kwargs):
+    """Process the solver outputs of dir completed since the last poll
+
+    Parameters
+    ----------
+    dir : str
+        Directory with the solver outputs
+    mean_y : float
+        y of the source centroid
+    manifest : dict
+        See load_manifest, updated in place
+    last_seen : dict
+        See completed_solver_out
+    failed : dict
+        {file: (size, mtime_ns)} of the outputs failed, updated in place
+    executor : concurrent.futures.Executor, optional
+        Pool running process_solver_out, by default in this process
+    **kwargs
+        Passed to process_solver_out
+
+    Returns
+    -------
+    int
+        Number of timesteps processed
+    """
+    todo = []
+    for step, file in completed_solver_out(dir, last_seen):
+        size, mtime_ns = last_seen[file]
+        entry = manifest.get(step)
+        if entry and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+            continue
+        # a failed output is only retried once it is rewritten
+        if failed.get(file) == last_seen[file]:
+            continue
+        todo.append((step, file))
+    if not todo:
+        return 0
+
+    if executor is None:
+        futures = [
+            partial(process_solver_out, file, mean_y, **kwargs) for _, file in todo
+        ]
+    else:
+        futures = [
+            executor.submit(process_solver_out, file, mean_y, **kwargs).result
+            for _, file in todo
+        ]
+    results = []
+    for (_, file), result in zip(todo, futures):
+        try:
+            results.append(result())
+        except Exception as err:
+            print("{} failed: {}".format(file, err))
+            failed[file] = last_seen[file]
+            results.append(None)
+
+    # fit in timestep order, each starting from the previous timestep
+    n_done = 0
+    for (step, file), result in zip(todo, results):
+        if result is None:
+            continue
+        elapsed = result[1]
+        previous = [s for s in manifest if s < step]
+        p0 = None
+        if previous:
+            last = manifest[max(previous)]
+            if np.isfinite(last["lam"]):
+                p0 = (last["c0"], 1 / last["lam"], last["b"])
+        size, mtime_ns = last_seen[file]
+        try:
+            c0, k, b = fit_to_fit(file, p0)
+        except Exception as err:
+            # one bad output does not stop the watcher, retried once rewritten
+            print("{} failed: {}".format(file, err))
+            failed[file] = last_seen[file]
+            continue
+        manifest[step] = dict(
+            file=os.path.basename(file),
+            size=size,
+            mtime_ns=mtime_ns,
+            c0=float(c0),
+            lam=float(1 / k) if np.isfinite(k) and k != 0 else float("nan"),
+            b=float(b),
+        )
+        print(
+            "{} done in {:.2f}s, lambda={:.4f}".format(
+                file, elapsed, manifest[step]["lam"]
+            )
+        )
+        n_done += 1
+
+    save_manifest(dir, manifest)
+
+    return n_done
+
+
+def watch(dirs, source_mean, interval=10.0, idle_timeout=None, workers=None, **kwargs):
+    """Poll the directories until idle_timeout seconds pass without output
+
+    Parameters
+    ----------
+    dirs : list of str
+        Directories with the solver outputs
+    source_mean : np.ndarray
+        Source centroid of every directory
+    interval : float, optional
+        Seconds between two polls, by default 10
+    idle_timeout : float, optional
+        Stop after that many seconds without a new output, by default never
+        (stop with Ctrl-C)
+    workers : int, optional
+        Number of processes, by default os.cpu_count()
+    **kwargs
+        Passed to process_solver_out
+    """
+    manifests = [load_manifest(dir) for dir in dirs]
+    last_seen = [{} for _ in dirs]
+    failed = [{} for _ in dirs]
+    for dir, manifest in zip(dirs, manifests):
+        if manifest:
+            print("Resuming {} after {:d} timesteps".format(dir, len(manifest)))
+
+    last_output = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            while True:
+                n_done = 0
+                for i, dir in enumerate(dirs):
+                    n_done += poll_once(
+                        dir,
+                        source_mean[i, 1],
+                        manifests[i],
+                        last_seen[i],
+                        failed[i],
+                        executor,
+                        **kwargs
+                    )
+                if n_done:
+                    last_output = time.time()
+                elif idle_timeout is not None and (
+                    time.time() - last_output > idle_timeout
+                ):
+                    print("No new solver output for {:.0f}s, stop".format(idle_timeout))
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped, restart to resume")
+
+
+def main(argv=None, prog=None):
+    # Set up the parsing of command-line arguments
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Process the solver outputs (Cells_*.txt) while LBIBCell is running",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--dirs",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Directories with the solver outputs",
+    )
+    parser.add_argument(
+        "--source_vtp",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Initial vtp of each directory, the source are cells of type 1",
+    )
+    parser.add_argument(
+        "--source_csv",
+        type=str,
+        default="source_mean.csv",
+        help="Source centroids, computed from --source_vtp if not existing",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=10.0, help="Seconds between two polls"
+    )
+    parser.add_argument(
+        "--idle_timeout",
+        type=float,
+        default=None,
+        help="Stop after that many seconds without new output, by default never",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="Number of processes"
+    )
+    parser.add_argument(
+        "--no_img", action="store_true", help="Do not save the contour plots"
+    )
+    args = parser.parse_args(argv)
+
+    if len(args.dirs) != len(args.source_vtp):
+        print("--dirs and --source_vtp should have the same length")
+        sys.exit(1)
+
+    source_mean = get_source_mean(args.source_vtp, args.source_csv)
+    if source_mean.shape[0] != len(args.dirs):
+        print("{} does not match --dirs, remove it first".format(args.source_csv))
+        sys.exit(1)
+
+    watch(
+        args.dirs,
+        source_mean,
+        args.interval,
+        args.idle_timeout,
+        args.workers,
+        save_img=not args.no_img,
+    )
+
+
+if __name__ == "__main__":
+    main()
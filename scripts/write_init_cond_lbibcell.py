@@ -1,16 +1,28 @@
 """
 write_init_cond_lbibcell
 
-Write a initial round cell for LBIBCell simulation as well as the parameters
+Write a initial round cell for LBIBCell simulation as well as the parameters,
+or a whole tissue of round cells packed on a hexagonal grid or at random
+(without overlap) in a box.
 
 Author: Yongqi Wang <wangyong@student.ethz.ch>
 """
 import os
 import sys
 import argparse
-from math import cos, sin, pi
+import numpy as np
 
-from numpy.core.defchararray import center
+PACKINGS = ("hex", "random")
+
+NODE_HEADER = "{}\t{}\t{}\n".format("#Nodes (id", "xPos", "yPos)")
+CONNECTION_HEADER = "{}\t{}\t{}\t{}\t{}\t{}\n".format(
+    "#Connection (nodeId1",
+    "nodeId2",
+    "domainId",
+    "bsolver",
+    "cdesolver",
+    "...)",
+)
 
 
 def create_points_on_cell(radius, center, res):
@@ -27,48 +39,193 @@ def create_points_on_cell(radius, center, res):
 
     Returns
     -------
-    x_pos : list of float
-        A list of all the X coordinates
-    y_pos : list of float
-        A list of all the Y coordinates
+    x_pos : np.ndarray
+        All the X coordinates
+    y_pos : np.ndarray
+        All the Y coordinates
     """
-    x_pos, y_pos = [], []
-    center_x, center_y = center
+    x_pos, y_pos = create_points_on_cells(radius, [center], res)
+
+    return x_pos[0], y_pos[0]
+
+
+def create_points_on_cells(radius, centers, res):
+    """Points on the circles of many cells at once
+
+    Parameters
+    ----------
+    radius : float or np.ndarray
+        Radius of the cells, or one per cell
+    centers : np.ndarray
+        (n_cells, 2) coordinate centers
+    res : int
+        Number of points per cell
 
-    for i in range(res):
-        angle = (2 * pi) * (i / res)
-        x = center_x + (radius * cos(angle))
-        y = center_y + (radius * sin(angle))
-        x_pos.append(x)
-        y_pos.append(y)
+    Returns
+    -------
+    x_pos, y_pos : np.ndarray
+        (n_cells, res) coordinates
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), centers.shape[:1])
+    angle = (2 * np.pi) * (np.arange(res) / res)
+    x_pos = centers[:, [0]] + radius[:, None] * np.cos(angle)
+    y_pos = centers[:, [1]] + radius[:, None] * np.sin(angle)
 
     return x_pos, y_pos
 
 
-def write_circle_points_lbibcell(
-    center,
-    radius,
-    res=360,
-    filename="parameters.txt",
+def pack_cells_hex(box, radius, gap=2.0, n_cells=None):
+    """Centers of cells packed on a hexagonal grid inside the box
+
+    Parameters
+    ----------
+    box : tuple of float
+        MIN_X, MIN_Y, MAX_X, MAX_Y, the cells stay inside
+    radius : float
+        Radius of the cells
+    gap : float, optional
+        Distance between two neighbouring cells, by default 2
+    n_cells : int, optional
+        Only the first n_cells (row by row), by default all that fit
+
+    Returns
+    -------
+    np.ndarray
+        (n_cells, 2) centers
+    """
+    min_x, min_y, max_x, max_y = box
+    pitch = 2 * radius + gap
+    x = np.arange(min_x + radius, max_x - radius + 1e-9, pitch)
+    y = np.arange(min_y + radius, max_y - radius + 1e-9, pitch * np.sqrt(3) / 2)
+    cx = x[None, :] + (np.arange(y.size) % 2)[:, None] * pitch / 2
+    cy = np.broadcast_to(y[:, None], cx.shape)
+    centers = np.stack((cx.ravel(), cy.ravel()), axis=1)
+    # the shifted rows may stick out on the right
+    centers = centers[centers[:, 0] <= max_x - radius + 1e-9]
+
+    return centers if n_cells is None else centers[:n_cells]
+
+
+def pack_cells_random(
+    box, radius, n_cells, gap=2.0, seed=None, max_tries=100, batch_size=4096
 ):
-    """Write the points in plain text per LBIBCell standard
+    """Centers of cells placed at random inside the box without overlap
 
+    Candidates are drawn in batches and kept if they are further than
+    2 * radius + gap from every cell placed before. The cells placed are
+    kept on a uniform grid of side (2 * radius + gap) / sqrt(2), which holds
+    at most one center per grid cell, so a candidate is only compared with
+    the centers of the 5 x 5 grid cells around it.
 
     Parameters
     ----------
+    box : tuple of float
+        MIN_X, MIN_Y, MAX_X, MAX_Y, the cells stay inside
     radius : float
-        the radius of cell
-    center : tuple of float
-        Coordinate center of circle
-    res : int
-        Coordinate center of circle, by default 360
+        Radius of the cells
+    n_cells : int
+        Number of cells
+    gap : float, optional
+        Min. distance between two cells, by default 2
+    seed : int, optional
+        Seed of the placement
+    max_tries : int, optional
+        Number of batches of candidates before giving up, by default 100
+    batch_size : int, optional
+        Max. number of candidates per batch, bounds the memory, by default 4096
+
+    Returns
+    -------
+    np.ndarray
+        (n, 2) centers, n < n_cells if the box is too crowded
+    """
+    min_x, min_y, max_x, max_y = box
+    low = np.array([min_x + radius, min_y + radius])
+    high = np.array([max_x - radius, max_y - radius])
+    if np.any(high < low):
+        # as pack_cells_hex, no cell fits
+        return np.empty((0, 2))
+    rng = np.random.default_rng(seed)
+    min_dist = 2 * radius + gap
+    side = min_dist / np.sqrt(2)
+
+    # index of the center in every grid cell, -1 if empty, 2 cells of padding
+    n_grid = np.floor(np.maximum(high - low, 0) / side).astype(int) + 1
+    grid = np.full(n_grid + 4, -1, dtype=np.intp)
+    offsets = np.arange(-2, 3)
+    centers = np.empty((n_cells, 2))
+    count = 0
+
+    for _ in range(max_tries):
+        n_left = n_cells - count
+        if n_left <= 0:
+            break
+        candidates = rng.uniform(low, high, size=(min(4 * n_left, batch_size), 2))
+        cell = np.floor((candidates - low) / side).astype(np.intp) + 2
+
+        # against the cells placed in the batches before, all at once
+        near = grid[
+            cell[:, 0, None, None] + offsets[None, :, None],
+            cell[:, 1, None, None] + offsets[None, None, :],
+        ].reshape(candidates.shape[0], -1)
+        d2 = ((candidates[:, None, :] - centers[np.maximum(near, 0)]) ** 2).sum(axis=2)
+        clash = ((near >= 0) & (d2 < min_dist**2)).any(axis=1)
+
+        # one by one against the cells placed in this batch
+        for point, (i, j) in zip(candidates[~clash], cell[~clash]):
+            near = grid[i - 2 : i + 3, j - 2 : j + 3]
+            near = near[near >= 0]
+            if near.size and (
+                ((centers[near] - point) ** 2).sum(axis=1).min() < min_dist**2
+            ):
+                continue
+            grid[i, j] = count
+            centers[count] = point
+            count += 1
+            if count == n_cells:
+                break
+
+    if count < n_cells:
+        print("Only {:d} of {:d} cells fit in the box".format(count, n_cells))
+
+    return centers[:count]
+
+
+def write_cells_lbibcell(centers, radius, res=360, filename="parameters.txt"):
+    """Write the points of many round cells in plain text per LBIBCell standard
+
+    The node ids are unique over all cells, every cell is a closed ring of
+    connections with its own domainId (1 for the first cell). The nodes are
+    written twice, as in write_circle_points_lbibcell.
+
+    Parameters
+    ----------
+    centers : np.ndarray
+        (n_cells, 2) coordinate centers
+    radius : float or np.ndarray
+        Radius of the cells, or one per cell
+    res : int, optional
+        Number of points per cell, by default 360
     filename : str, optional
         Path to the parameter file, by default "parameters.txt"
 
     .. _See LBIBCell Doc on format: https://tanakas.bitbucket.io/lbibcell/tutorial_01.html#textinput
 
     """
-    x_pos, y_pos = create_points_on_cell(radius, center, res)
+    x_pos, y_pos = create_points_on_cells(radius, centers, res)
+    n_cells = x_pos.shape[0]
+    ids = np.arange(1, n_cells * res + 1).reshape(n_cells, res)
+    nodes = np.stack((ids.ravel(), x_pos.ravel(), y_pos.ravel()), axis=1)
+    # ring of every cell, the last node back to the first
+    connections = np.stack(
+        (
+            ids.ravel(),
+            np.roll(ids, -1, axis=1).ravel(),
+            np.repeat(np.arange(1, n_cells + 1), res),
+        ),
+        axis=1,
+    )
 
     try:
         f_out = open(filename, "w")
@@ -76,48 +233,51 @@ def write_circle_points_lbibcell(
         print("Output file {} cannot be created".format(filename))
         sys.exit(1)
 
-    # Write header for position and position data
-    f_out.write("{}\t{}\t{}\n".format("#Nodes (id", "xPos", "yPos)"))
+    with f_out:
+        # Write header for position and position data, twice for format reason
+        for _ in range(2):
+            f_out.write(NODE_HEADER)
+            np.savetxt(f_out, nodes, fmt=["%d", "%.17g", "%.17g"], delimiter="\t")
 
-    for i in range(res):
-        f_out.write("{}\t{}\t{}\n".format(i + 1, x_pos[i], y_pos[i]))
+        f_out.write(CONNECTION_HEADER)
+        np.savetxt(f_out, connections, fmt="%d", delimiter="\t")
 
-    # Write header for position again for format reason
-    f_out.write("{}\t{}\t{}\n".format("#Nodes (id", "xPos", "yPos)"))
+    print("Parameters of {:d} cells saved to {} ".format(n_cells, filename))
 
-    for i in range(res):
-        f_out.write("{}\t{}\t{}\n".format(i + 1, x_pos[i], y_pos[i]))
 
-    # Write header for connection
-    f_out.write(
-        "{}\t{}\t{}\t{}\t{}\t{}\n".format(
-            "#Connection (nodeId1",
-            "nodeId2",
-            "domainId",
-            "bsolver",
-            "cdesolver",
-            "...)",
-        )
-    )
+def write_circle_points_lbibcell(
+    center,
+    radius,
+    res=360,
+    filename="parameters.txt",
+):
+    """Write the points in plain text per LBIBCell standard
+
 
-    # Write connection data (all but the last connection)
-    for i in range(0, res - 1):
-        f_out.write("{}\t{}\t{}\n".format(i % res + 1, i % res + 2, 1))
+    Parameters
+    ----------
+    radius : float
+        the radius of cell
+    center : tuple of float
+        Coordinate center of circle
+    res : int
+        Coordinate center of circle, by default 360
+    filename : str, optional
+        Path to the parameter file, by default "parameters.txt"
 
-    # add the last connection (id.res -> 1)
-    f_out.write("{}\t{}\t{}\n".format(res, 1, 1))
+    .. _See LBIBCell Doc on format: https://tanakas.bitbucket.io/lbibcell/tutorial_01.html#textinput
 
-    print("Parameters saved to {} ".format(filename))
-    f_out.close()
+    """
+    write_cells_lbibcell([center], radius, res, filename)
 
     return None
 
 
-if __name__ == "__main__":
-
+def main(argv=None, prog=None):
     # Set up the parsing of command-line arguments
     parser = argparse.ArgumentParser(
-        description="Write a initial round cell for LBIBCell simulation as well as the parameters"
+        prog=prog,
+        description="Write a initial round cell (or a tissue of them with --packing) for LBIBCell simulation as well as the parameters",
     )
     parser.add_argument(
         "--x",
@@ -143,7 +303,40 @@ if __name__ == "__main__":
     parser.add_argument(
         "--res", type=int, default=360, help="Resolution of the circular cell"
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--packing",
+        type=str,
+        choices=PACKINGS,
+        default=None,
+        help="Write a tissue of cells packed in --box instead of a single cell",
+    )
+    parser.add_argument(
+        "--box",
+        type=float,
+        nargs=4,
+        default=[0, 0, 1000, 1000],
+        help="The box of the tissue, i.e. MIN_X, MIN_Y, MAX_X, MAX_Y",
+    )
+    parser.add_argument(
+        "-n",
+        "--n_cells",
+        type=int,
+        default=None,
+        help="Number of cells of the tissue, by default all that fit (hex only)",
+    )
+    parser.add_argument(
+        "--gap", type=float, default=2.0, help="Min. distance between two cells"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Seed of the random packing"
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Overwrite an existing parameter file without asking",
+    )
+    args = parser.parse_args(argv)
 
     x = args.x
     y = args.y
@@ -151,15 +344,41 @@ if __name__ == "__main__":
     out_dir = args.out_dir
     res = args.res
 
-    filename = "{}/parameters_{}_by_{}_radius_{}_res_{}.txt".format(
-        out_dir, int(x), int(y), int(radius), res
-    )
+    if args.packing:
+        if args.packing == "random" and not args.n_cells:
+            print("--n_cells is needed by the random packing")
+            sys.exit(1)
+        filename = "{}/parameters_tissue_{}_{}_cells_radius_{}_res_{}.txt".format(
+            out_dir,
+            args.packing,
+            args.n_cells if args.n_cells else "max",
+            int(radius),
+            res,
+        )
+    else:
+        filename = "{}/parameters_{}_by_{}_radius_{}_res_{}.txt".format(
+            out_dir, int(x), int(y), int(radius), res
+        )
 
     # be sure not to remove previous file
-    if os.path.exists(filename):
+    if os.path.exists(filename) and not args.force:
         print("Parameter {} exist".format(filename))
         if input("Do you want to OVERWRITE {}? [y] ".format(filename)) != "y":
             sys.exit(1)
 
-    center = [x, y]
-    write_circle_points_lbibcell(center, radius, res, filename=filename)
+    if args.packing == "hex":
+        centers = pack_cells_hex(args.box, radius, args.gap, args.n_cells)
+    elif args.packing == "random":
+        centers = pack_cells_random(args.box, radius, args.n_cells, args.gap, args.seed)
+    else:
+        centers = [[x, y]]
+
+    if len(centers) == 0:
+        print("No cell of radius {} fits in the box {}".format(radius, args.box))
+        sys.exit(1)
+
+    write_cells_lbibcell(centers, radius, res, filename=filename)
+
+
+if __name__ == "__main__":
+    main()
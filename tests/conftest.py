@@ -0,0 +1,38 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the scripts import each other by module name
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+)
+
+
+def _cells_of(polygons, cell_type=None):
+    """CellArrays of a list of (n, 2) vertices, every cell owns its points"""
+    from cell_geometry import CellArrays
+
+    polygons = [np.asarray(polygon, dtype=float) for polygon in polygons]
+    points = np.zeros((sum(len(polygon) for polygon in polygons), 3))
+    points[:, :2] = np.vstack(polygons)
+    offsets = np.concatenate(([0], np.cumsum([len(polygon) for polygon in polygons])))
+
+    return CellArrays(points, np.arange(points.shape[0]), offsets, cell_type)
+
+
+@pytest.fixture
+def cells_of():
+    return _cells_of
+
+
+@pytest.fixture
+def tissue_cells():
+    """200 jittered cells, no vertex or edge on a lattice node"""
+    from synthetic_data import tissue_arrays
+
+    points, polys, _ = tissue_arrays(200, n_vertices=16, seed=0)
+    polygons = points[polys, :2] + (3.1416, 2.7183)
+
+    return _cells_of(list(polygons))
@@ -0,0 +1,31 @@
+import numpy as np
+from batch_fit import fit_profiles
+from fit_exp_decay import model_func
+
+
+def test_one_series_is_split_over_the_workers():
+    x = np.arange(0.0, 200.0)
+    rng = np.random.default_rng(0)
+    lam = 30 + np.arange(24.0)
+    Y = model_func(x, 5.0, 1 / lam[:, None], 0.5) + rng.normal(0, 0.02, (24, x.size))
+    series = np.zeros(24, dtype=int)
+
+    serial = fit_profiles(x, Y, series, workers=1)
+    # three blocks warm started on their own, the same fits
+    table = fit_profiles(x, Y, series, workers=3)
+    assert table["success"].all()
+    np.testing.assert_array_equal(table["series"], 0)
+    np.testing.assert_array_equal(table["index"], np.arange(24))
+    np.testing.assert_allclose(table["lam"], serial["lam"], rtol=1e-6)
+    np.testing.assert_allclose(table["lam"], lam, rtol=0.05)
+
+
+def test_series_keep_their_labels_and_order():
+    x = np.arange(0.0, 100.0)
+    Y = np.tile(model_func(x, 2.0, 0.05, 0.1), (10, 1))
+    series = np.repeat([3, 7], [7, 3])
+
+    table = fit_profiles(x, Y, series, workers=4)
+    np.testing.assert_array_equal(table["series"], series)
+    np.testing.assert_array_equal(table["index"], [0, 1, 2, 3, 4, 5, 6, 0, 1, 2])
+    np.testing.assert_allclose(table["k"], 0.05, rtol=1e-6)
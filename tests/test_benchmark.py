@@ -0,0 +1,31 @@
+import json
+
+import benchmark
+
+
+def test_failed_case_is_recorded_and_the_run_goes_on(tmp_path, monkeypatch, capsys):
+    def bench_ok(tmp_dir, scale):
+        return None, lambda: sum(range(100))
+
+    def bench_broken(tmp_dir, scale):
+        def func():
+            raise RuntimeError("boom")
+
+        return None, func
+
+    monkeypatch.setattr(
+        benchmark, "BENCHMARKS", {"broken": bench_broken, "ok": bench_ok}
+    )
+    results = str(tmp_path / "results.jsonl")
+    records = benchmark.run_benchmarks(["broken", "ok"], ["small"], 2, results)
+
+    with open(results) as f_in:
+        written = [json.loads(line) for line in f_in]
+    assert [r["benchmark"] for r in records] == ["broken", "ok"]
+    assert [r["benchmark"] for r in written] == ["broken", "ok"]
+    assert written[0]["error"] == "RuntimeError: boom" and "min" not in written[0]
+    assert written[1]["min"] <= written[1]["median"]
+
+    # the failed record is left out of the comparison
+    benchmark.compare(results, written[0]["commit"], written[0]["commit"])
+    assert "broken" not in capsys.readouterr().out.split("ratio")[-1]
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from cell_geometry import polygon_properties
+
+
+def regular_polygon(n, radius, center=(0.0, 0.0), phase=0.3):
+    angle = phase + 2 * np.pi * np.arange(n) / n
+    return np.stack(
+        (center[0] + radius * np.cos(angle), center[1] + radius * np.sin(angle)),
+        axis=1,
+    )
+
+
+@pytest.mark.parametrize("clockwise", [False, True])
+def test_analytic_shapes(cells_of, clockwise):
+    square = [(1, 1), (3, 1), (3, 3), (1, 3)]
+    triangle = [(0, 0), (3, 0), (0, 6)]
+    hexagon = regular_polygon(6, 10.0, center=(500.5, 250.25))
+    # unit squares at x in [0, 2], y in [0, 1] and x in [0, 1], y in [1, 2]
+    l_shape = [(0, 0), (2, 0), (2, 1), (1, 1), (1, 2), (0, 2)]
+    # extra vertices on the lower edge do not move the centroid
+    dense = [(1, 1), (1.1, 1), (1.2, 1), (1.3, 1), (3, 1), (3, 3), (1, 3)]
+    polygons = [square, triangle, hexagon, l_shape, dense]
+    if clockwise:
+        polygons = [np.asarray(polygon)[::-1] for polygon in polygons]
+
+    props = polygon_properties(cells_of(polygons))
+
+    np.testing.assert_allclose(
+        props["area"], [4, 9, 1.5 * np.sqrt(3) * 100, 3, 4], rtol=1e-12
+    )
+    np.testing.assert_allclose(props["centroid_x"], [2, 1, 500.5, 5 / 6, 2])
+    np.testing.assert_allclose(props["centroid_y"], [2, 2, 250.25, 5 / 6, 2])
+    np.testing.assert_allclose(
+        props["perimeter"], [8, 9 + np.sqrt(45), 60, 8, 8], rtol=1e-12
+    )
+    # square of side a: a^4 / 12 about both axes, no product
+    np.testing.assert_allclose(props["ixx"][[0, 4]], 16 / 12)
+    np.testing.assert_allclose(props["iyy"][[0, 4]], 16 / 12)
+    np.testing.assert_allclose(props["ixy"][[0, 4]], 0, atol=1e-12)
+    np.testing.assert_allclose(props["aspect_ratio"][[0, 2]], 1, rtol=1e-9)
+
+
+def test_regular_polygon_tends_to_circle(cells_of):
+    n = np.array([3, 8, 64, 1024])
+    props = polygon_properties(
+        cells_of([regular_polygon(k, 5.0, center=(20, 30)) for k in n])
+    )
+
+    np.testing.assert_allclose(
+        props["area"], n * 25 * np.sin(2 * np.pi / n) / 2, rtol=1e-12
+    )
+    np.testing.assert_allclose(props["circularity"][-1], 1, rtol=1e-5)
+    np.testing.assert_allclose(props["centroid_x"], 20)
+    np.testing.assert_allclose(props["centroid_y"], 30)
+
+
+def test_reductions_match_vtk_cells():
+    from vtk.util.numpy_support import vtk_to_numpy
+    from synthetic_data import tissue_polydata
+    from cell_geometry import (
+        cell_arrays,
+        cell_bounds,
+        cell_type_per_cell,
+        cell_vertex_mean,
+        cells_all_type,
+        set_cells_type,
+    )
+
+    polyData = tissue_polydata(30, n_source_cols=2, seed=0)
+    cells = cell_arrays(polyData)
+    # one point of cell 3 disagrees with the others
+    cells.cell_type[cells.connectivity[cells.offsets[3]]] = 7
+    cell_type = vtk_to_numpy(polyData.GetPointData().GetArray("cell_type"))
+
+    bounds, means, types = [], [], []
+    for i in range(polyData.GetNumberOfCells()):
+        cell = polyData.GetCell(i)
+        ids = [cell.GetPointId(j) for j in range(cell.GetNumberOfPoints())]
+        x_min, x_max, y_min, y_max, _, _ = cell.GetBounds()
+        bounds.append((x_min, y_min, x_max, y_max))
+        means.append(np.mean([polyData.GetPoint(k)[:2] for k in ids], axis=0))
+        values = cell_type[ids]
+        types.append(values[0] if (values == values[0]).all() else np.nan)
+
+    np.testing.assert_allclose(cell_bounds(cells), bounds)
+    np.testing.assert_allclose(cell_vertex_mean(cells), means)
+    np.testing.assert_array_equal(cell_type_per_cell(cells), types)
+    np.testing.assert_array_equal(cells_all_type(cells, 1.0), np.array(types) == 1)
+
+    # the cell types are a view of the vtk array
+    assert set_cells_type(cells, np.array([0, 5]), 4) == 2
+    for i in (0, 5):
+        cell = polyData.GetCell(i)
+        assert all(
+            cell_type[cell.GetPointId(j)] == 4 for j in range(cell.GetNumberOfPoints())
+        )
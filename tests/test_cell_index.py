@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from matplotlib.path import Path
+
+from cell_index import CellGridIndex, Region
+
+REGIONS = [
+    ("box", (40, 30, 190, 170)),
+    ("box", (-10, -10, 15, 400)),
+    ("circle", (150, 140, 75)),
+    ("circle", (0, 0, 30)),
+    ("polygon", (10, 10, 280, 40, 150, 260)),
+    # non-convex
+    ("polygon", (0, 0, 300, 0, 300, 300, 150, 80, 0, 300)),
+]
+
+
+def brute_force(cells, shape, coords, mode):
+    """Cells with all (contain) or any (intersect) vertex inside, one by one"""
+    coords = np.asarray(coords, dtype=float)
+    selected = []
+    for i in range(cells.n_cells):
+        xy = cells.points[cells.connectivity[cells.offsets[i] : cells.offsets[i + 1]]]
+        x, y = xy[:, 0], xy[:, 1]
+        if shape == "box":
+            inside = (
+                (x > coords[0]) & (y > coords[1]) & (x < coords[2]) & (y < coords[3])
+            )
+        elif shape == "circle":
+            inside = np.hypot(x - coords[0], y - coords[1]) < coords[2]
+        else:
+            inside = Path(coords.reshape(-1, 2)).contains_points(xy[:, :2])
+        if inside.all() if mode == "contain" else inside.any():
+            selected.append(i)
+
+    return selected
+
+
+@pytest.mark.parametrize("mode", ["contain", "intersect"])
+@pytest.mark.parametrize("bucket_size", [None, 7.0, 1000.0])
+def test_query_matches_brute_force(tissue_cells, mode, bucket_size):
+    index = CellGridIndex(tissue_cells, bucket_size)
+    for shape, coords in REGIONS:
+        found = index.query(Region(shape, coords, 2, mode))
+        expected = brute_force(tissue_cells, shape, coords, mode)
+        assert sorted(found) == expected, (shape, coords)
+
+
+def test_cells_of_no_extent(cells_of):
+    # most cells collapsed to a point, the median cell size is 0
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(0, 1000, (300, 2))
+    polygons = [np.repeat(center[None], 4, axis=0) for center in centers[:250]]
+    polygons += [center + [(0, 0), (5, 0), (5, 5), (0, 5)] for center in centers[250:]]
+    cells = cells_of(polygons)
+
+    index = CellGridIndex(cells)
+    assert index.n_buckets.prod() < 20 * cells.n_cells
+    region = ("box", (100, 100, 600, 700))
+    for mode in ("contain", "intersect"):
+        found = index.query(Region(*region, 2, mode))
+        assert sorted(found) == brute_force(cells, *region, mode)
+    # a tiny bucket size given is bounded as well
+    assert CellGridIndex(cells, 1e-9).n_buckets.prod() < 20 * cells.n_cells
@@ -0,0 +1,35 @@
+import numpy as np
+from matplotlib.path import Path
+
+from cell_readout import rasterize_cells
+
+
+def test_labels_match_point_in_polygon(tissue_cells):
+    shape = (320, 300)
+    labels = rasterize_cells(tissue_cells, shape)
+
+    x, y = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing="ij")
+    nodes = np.stack((x.ravel(), y.ravel()), axis=1)
+    expected = np.full(shape, -1)
+    for i in range(tissue_cells.n_cells):
+        ids = tissue_cells.connectivity[
+            tissue_cells.offsets[i] : tissue_cells.offsets[i + 1]
+        ]
+        inside = Path(tissue_cells.points[ids, :2]).contains_points(nodes)
+        expected[inside.reshape(shape)] = i
+
+    # the tissue is ~290 wide, part of it is cut by the lattice
+    assert (expected >= 0).sum() > 10000
+    np.testing.assert_array_equal(labels, expected)
+
+
+def test_nodes_on_left_and_lower_edges_are_inside(cells_of):
+    square = [(2, 3), (5, 3), (5, 7), (2, 7)]
+    # out of the lattice on the left, cut at x = 0
+    cut = [(-4.5, 10.5), (1.5, 10.5), (1.5, 12.5), (-4.5, 12.5)]
+    labels = rasterize_cells(cells_of([square, cut]), (8, 16))
+
+    expected = np.full((8, 16), -1)
+    expected[2:5, 3:7] = 0
+    expected[0:2, 11:13] = 1
+    np.testing.assert_array_equal(labels, expected)
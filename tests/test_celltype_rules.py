@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pytest
+
+from synthetic_data import tissue_polydata
+from cell_geometry import cell_arrays, cell_type_per_cell
+from vtk_io import read_polydata, write_polydata
+from celltype_rules import check_rule, main
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        {"random": "0.5", "set": 1},
+        {"random": True, "set": 1},
+        {"random": 1.5, "set": 1},
+        {"random": 0.5, "seed": "42", "set": 1},
+        {"set": "1"},
+        {"type": 0.5, "set": 1},
+        {"distance": {"min": 100, "max": 50}, "set": 1},
+        {"distance": {"min": "0"}, "set": 1},
+        {"distance": {"from": [0, "0"]}, "set": 1},
+    ],
+)
+def test_invalid_rule_raises_value_error(rule):
+    with pytest.raises(ValueError):
+        check_rule(rule)
+
+
+def test_rules_over_many_vtp(tmp_path):
+    inputs = []
+    for i in range(3):
+        inputs.append(str(tmp_path / "tissue_{}.vtp".format(i)))
+        write_polydata(tissue_polydata(6, seed=i), inputs[-1])
+    rules = str(tmp_path / "rules.json")
+    with open(rules, "w") as f_out:
+        json.dump({"rules": [{"type": 0, "set": 3}]}, f_out)
+    output_dir = str(tmp_path / "out")
+
+    main(["--rules", rules, "-i"] + inputs + ["--output_dir", output_dir])
+    for input_file in inputs:
+        before = cell_type_per_cell(cell_arrays(read_polydata(input_file)))
+        after = cell_type_per_cell(
+            cell_arrays(read_polydata(input_file.replace(str(tmp_path), output_dir)))
+        )
+        np.testing.assert_array_equal(after, np.where(before == 0, 3, before))
+
+    # the same name twice would be written to the same output
+    with pytest.raises(SystemExit):
+        main(["--rules", rules, "-i", inputs[0], inputs[0], "--output_dir", output_dir])
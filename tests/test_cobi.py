@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from cobi import COMMANDS
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+HEAVY = ("scipy", "matplotlib", "pyvista", "vtkmodules")
+
+
+@pytest.mark.parametrize("command", list(COMMANDS))
+def test_help_without_heavy_imports(command):
+    # the help of a command only imports its module
+    code = (
+        "import sys\n"
+        "from cobi import run\n"
+        "try:\n"
+        "    run({!r}, ['-h'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in {!r}))\n"
+    ).format(command, HEAVY)
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=SCRIPTS,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert out.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from scipy.optimize import curve_fit
+
+from fit_exp_decay import fit_exp, init_exp, model_func
+from bootstrap_fit import bootstrap_fit, fit_exp_batch, resample_weights
+
+TRUE = (5.0, 1 / 40, 0.5)
+
+
+@pytest.fixture
+def profiles():
+    x = np.arange(0.0, 200.0)
+    rng = np.random.default_rng(0)
+    Y = model_func(x, *TRUE) + rng.normal(0, 0.05, (5, x.size))
+
+    return x, Y
+
+
+def reference_fit(x, y):
+    popt, _ = curve_fit(model_func, x, y, p0=(1.0, 0.01, 0.0), maxfev=10000)
+
+    return popt
+
+
+def test_fit_exp_matches_curve_fit(profiles):
+    x, Y = profiles
+    for y in Y:
+        np.testing.assert_allclose(fit_exp(x, y), reference_fit(x, y), rtol=1e-6)
+    # the closed form start is already close
+    np.testing.assert_allclose(init_exp(x, Y[0]), TRUE, rtol=0.1)
+
+
+def test_fit_exp_batch_matches_curve_fit(profiles):
+    x, Y = profiles
+    popt, converged = fit_exp_batch(x, Y)
+
+    assert converged.all()
+    for p, y in zip(popt, Y):
+        np.testing.assert_allclose(p, reference_fit(x, y), rtol=1e-6)
+
+
+def test_bootstrap_weights_are_repeated_points(profiles):
+    x, Y = profiles
+    weights = resample_weights(x.size, 4, rng=np.random.default_rng(1))
+    popt, converged = fit_exp_batch(x, Y[0], weights)
+
+    assert converged.all()
+    for p, w in zip(popt, weights.astype(int)):
+        expected = reference_fit(np.repeat(x, w), np.repeat(Y[0], w))
+        np.testing.assert_allclose(p, expected, rtol=1e-6)
+
+
+def test_jackknife_leaves_one_out(profiles):
+    x, Y = profiles
+    x, y = x[:60], Y[0, :60]
+    result = bootstrap_fit(x, y, method="jackknife", workers=1, batch_size=25)
+
+    assert result["n_failed"] == 0
+    for i in (0, 17, 59):
+        c0, k, b = reference_fit(np.delete(x, i), np.delete(y, i))
+        np.testing.assert_allclose(result["replicates"][i], (c0, 1 / k, b), rtol=1e-6)
@@ -0,0 +1,147 @@
+import os
+import glob
+import time
+
+import numpy as np
+import pytest
+
+from synthetic_data import solver_field, write_solver_out
+from solver_io import discover_solver_out, load_solver_field, read_solver_field
+
+
+@pytest.fixture
+def solver_out(tmp_path):
+    c = solver_field(300, 300, noise=1e-3, seed=0)
+    filename = str(tmp_path / "Cells_0.txt")
+    write_solver_out(filename, c)
+
+    return filename, c
+
+
+def test_round_trip(solver_out, tmp_path):
+    filename, c = solver_out
+    np.testing.assert_allclose(read_solver_field(filename), c, rtol=1e-9)
+
+    # the cache is written on the first read and used on the second
+    cache_dir = str(tmp_path / "cache")
+    for _ in range(2):
+        np.testing.assert_allclose(
+            load_solver_field(filename, cache_dir=cache_dir), c, rtol=1e-9
+        )
+
+
+def test_chunks_match_a_single_parse(tmp_path):
+    c = solver_field(60, 40, noise=1e-3, seed=2)
+    filename = str(tmp_path / "Cells_0.txt")
+    write_solver_out(filename, c)
+    # nodes in any order, the lattice grows in every direction
+    with open(filename) as f_in:
+        lines = f_in.readlines()
+    np.random.default_rng(0).shuffle(lines)
+    with open(filename, "w") as f_out:
+        f_out.writelines(lines[:-5])
+
+    single = read_solver_field(filename, masked=True, chunk_rows=len(lines))
+    for shape in (None, (60, 40), (70, 45)):
+        chunked = read_solver_field(filename, shape, chunk_rows=7, masked=True)
+        assert chunked.shape == (shape or c.shape)
+        np.testing.assert_array_equal(chunked.mask[:60, :40], single.mask)
+        np.testing.assert_array_equal(chunked[:60, :40], single)
+    assert np.count_nonzero(single.mask) == 5
+    np.testing.assert_allclose(single[~single.mask], c[~single.mask], rtol=1e-9)
+
+
+def test_shape_smaller_than_data_raises(solver_out):
+    filename, _ = solver_out
+    with pytest.raises(ValueError):
+        read_solver_field(filename, (200, 200))
+    with pytest.raises(ValueError):
+        read_solver_field(filename, (200, 200), masked=True)
+
+
+def test_shape_larger_than_data_is_kept(solver_out):
+    filename, c = solver_out
+    arr = read_solver_field(filename, (400, 350), masked=True)
+    assert arr.shape == (400, 350)
+    assert np.count_nonzero(~arr.mask) == c.size
+    np.testing.assert_allclose(arr[:300, :300], c)
+
+
+def test_bad_output_fails_alone(solver_out, tmp_path):
+    from flatter_solver_output import read_solver_out_flat, run_batch
+
+    filename, c = solver_out
+    missing = str(tmp_path / "Cells_1.txt")
+    with pytest.raises(OSError):
+        read_solver_out_flat(missing)
+
+    jobs = [(filename, 150.0, 1), (missing, 150.0, 1)]
+    failed = run_batch(jobs, workers=2, save_img=False)
+    assert failed == [missing]
+    to_fit = np.loadtxt(str(tmp_path / "Cells_0_to_fit.txt"), delimiter=",")
+    np.testing.assert_allclose(to_fit[:, 1], c.mean(axis=1))
+
+
+def test_cache_evicts_the_least_recently_used(tmp_path):
+    files = []
+    for i in range(3):
+        files.append(str(tmp_path / "run" / "Cells_{}.txt".format(i)))
+        os.makedirs(os.path.dirname(files[-1]), exist_ok=True)
+        write_solver_out(files[-1], solver_field(50, 40, noise=1e-3, seed=i))
+    cache_dir = str(tmp_path / "cache")
+    # room for two lattices of float64
+    max_bytes = 2 * 50 * 40 * 8 + 1000
+
+    def cached():
+        return sorted(
+            os.path.basename(name).split("-")[0]
+            for name in glob.glob(os.path.join(cache_dir, "*.npy"))
+        )
+
+    load_solver_field(files[0], cache_dir=cache_dir, max_cache_bytes=max_bytes)
+    time.sleep(0.01)
+    load_solver_field(files[1], cache_dir=cache_dir, max_cache_bytes=max_bytes)
+    time.sleep(0.01)
+    # a hit marks Cells_0 as used, Cells_1 is now the oldest
+    arr = load_solver_field(files[0], cache_dir=cache_dir, max_cache_bytes=max_bytes)
+    assert isinstance(arr, np.memmap)
+    time.sleep(0.01)
+    load_solver_field(files[2], cache_dir=cache_dir, max_cache_bytes=max_bytes)
+    assert cached() == ["Cells_0", "Cells_2"]
+
+    # a rewritten solver output is parsed again
+    time.sleep(0.01)
+    write_solver_out(files[0], solver_field(50, 40, noise=1e-3, seed=5))
+    np.testing.assert_allclose(
+        load_solver_field(files[0], cache_dir=cache_dir),
+        solver_field(50, 40, noise=1e-3, seed=5),
+        rtol=1e-9,
+    )
+
+
+def test_movie_without_ffmpeg_fails_before_rendering(solver_out, monkeypatch):
+    import encode_frames
+    from flatter_solver_output import encode_contour_movies
+
+    filename, _ = solver_out
+    monkeypatch.setattr(encode_frames.shutil, "which", lambda name: None)
+    with pytest.raises(OSError, match="ffmpeg"):
+        encode_contour_movies([os.path.dirname(filename)], np.zeros((1, 2)))
+    # no solver output was processed
+    assert not os.path.exists(filename.replace(".txt", "_to_fit.txt"))
+
+
+def test_discover_solver_out(tmp_path):
+    # glob characters in the dir name are taken literally
+    dir = tmp_path / "run[1]"
+    dir.mkdir()
+    for name in ("Cells_10.txt", "Cells_2.txt", "Cells_2_to_fit.txt", "Cells_x.txt"):
+        (dir / name).write_text("")
+
+    assert discover_solver_out(str(dir)) == [
+        (2, str(dir / "Cells_2.txt")),
+        (10, str(dir / "Cells_10.txt")),
+    ]
+    assert discover_solver_out(str(dir), "_to_fit") == [
+        (2, str(dir / "Cells_2_to_fit.txt"))
+    ]
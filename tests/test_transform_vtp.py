@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pytest
+
+from synthetic_data import tissue_polydata
+from vtk_io import read_polydata, write_polydata
+from transform_vtp import main
+from move_vtp import main as move_main
+
+
+def write_reporter_dir(dir, steps=(0, 100)):
+    for step in steps:
+        frame = os.path.join(dir, "Cells_{}".format(step))
+        os.makedirs(frame)
+        write_polydata(
+            tissue_polydata(4, seed=step),
+            os.path.join(frame, "Cells_{}_0.vtp".format(step)),
+        )
+
+
+def test_reporter_dirs_keep_their_paths(tmp_path):
+    for run in ("run_a", "run_b"):
+        write_reporter_dir(str(tmp_path / run / "output"))
+    inputs = [str(tmp_path / run / "output") for run in ("run_a", "run_b")]
+    moved = str(tmp_path / "moved")
+
+    # same dir names, the outputs would collide
+    with pytest.raises(SystemExit):
+        main(["-i"] + inputs + ["--ops", "translate:1,0", "--output_dir", moved])
+    assert not os.path.exists(moved)
+
+    main(["-i", inputs[0], "--ops", "translate:1,0", "--output_dir", moved])
+    for step in (0, 100):
+        rel = os.path.join("output", "Cells_{}".format(step))
+        name = "Cells_{}_0.vtp".format(step)
+        before = read_polydata(os.path.join(inputs[0], "Cells_{}".format(step), name))
+        after = read_polydata(os.path.join(moved, rel, name))
+        np.testing.assert_allclose(after.points[:, 0], before.points[:, 0] + 1)
+
+
+def test_move_vtp_does_not_ask(tmp_path, monkeypatch):
+    input_file = str(tmp_path / "in.vtp")
+    output_file = str(tmp_path / "out.vtp")
+    write_polydata(tissue_polydata(4, seed=0), input_file)
+    monkeypatch.setattr("builtins.input", pytest.fail)
+
+    move_main(["-i", input_file, "-o", output_file, "-x", "-350"])
+    before = read_polydata(output_file).points.copy()
+    # skipped without -f, overwritten with it
+    move_main(["-i", input_file, "-o", output_file, "-x", "10"])
+    np.testing.assert_array_equal(read_polydata(output_file).points, before)
+    move_main(["-i", input_file, "-o", output_file, "-x", "10", "-f"])
+    np.testing.assert_allclose(
+        read_polydata(output_file).points[:, 0],
+        read_polydata(input_file).points[:, 0] + 10,
+    )
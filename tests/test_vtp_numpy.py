@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from synthetic_data import tissue_polydata
+from vtp_numpy import VtpPolyData, read_vtp, write_vtp
+from vtk_io import _write_vtk
+
+
+def vtk_read(filename):
+    from vtk import vtkXMLPolyDataReader
+
+    reader = vtkXMLPolyDataReader()
+    reader.SetFileName(filename)
+    reader.Update()
+
+    return reader.GetOutput()
+
+
+def assert_same(a, b):
+    np.testing.assert_array_equal(a.points, b.points)
+    np.testing.assert_array_equal(a.connectivity, b.connectivity)
+    np.testing.assert_array_equal(a.offsets, b.offsets)
+    assert sorted(a.point_data) == sorted(b.point_data)
+    for name in a.point_data:
+        np.testing.assert_array_equal(a.point_data[name], b.point_data[name])
+
+
+@pytest.mark.parametrize(
+    "data_mode, compressor, header_type",
+    [
+        ("binary", "zlib", "UInt32"),
+        ("binary", "none", "UInt32"),
+        ("binary", "zlib", "UInt64"),
+        ("ascii", "none", "UInt32"),
+    ],
+)
+def test_numpy_written_read_by_vtk(tmp_path, data_mode, compressor, header_type):
+    polyData = VtpPolyData.from_vtk(tissue_polydata(50, seed=0))
+    filename = str(tmp_path / "tissue.vtp")
+    write_vtp(filename, polyData, data_mode, compressor, header_type)
+
+    read = vtk_read(filename)
+    assert read.GetNumberOfCells() == 50
+    assert_same(VtpPolyData.from_vtk(read), polyData)
+
+
+@pytest.mark.parametrize(
+    "data_mode, compressor", [("binary", "zlib"), ("binary", "none"), ("ascii", None)]
+)
+def test_vtk_written_read_by_numpy(tmp_path, data_mode, compressor):
+    polyData = tissue_polydata(50, seed=1)
+    filename = str(tmp_path / "tissue.vtp")
+    _write_vtk(polyData, filename, data_mode, compressor)
+
+    assert_same(read_vtp(filename), VtpPolyData.from_vtk(polyData))
@@ -0,0 +1,23 @@
+import numpy as np
+
+from synthetic_data import solver_field, write_solver_out
+from watch_solver_out import poll_once
+
+
+def test_bad_output_does_not_stop_the_watcher(tmp_path):
+    write_solver_out(str(tmp_path / "Cells_0.txt"), solver_field(100, 50, seed=0))
+    # not a solver output, the reader raises in the worker
+    (tmp_path / "Cells_100.txt").write_text("not a number\n")
+    write_solver_out(str(tmp_path / "Cells_200.txt"), solver_field(100, 50, seed=1))
+
+    manifest, last_seen, failed = {}, {}, {}
+    # the last output is complete once unchanged over two polls
+    poll_once(str(tmp_path), 25.0, manifest, last_seen, failed, save_img=False)
+    n_done = poll_once(str(tmp_path), 25.0, manifest, last_seen, failed, save_img=False)
+
+    assert n_done == 1
+    assert sorted(manifest) == [0, 200]
+    assert list(failed) == [str(tmp_path / "Cells_100.txt")]
+    assert np.isfinite(manifest[200]["lam"])
+    # not retried until rewritten
+    assert poll_once(str(tmp_path), 25.0, manifest, last_seen, failed) == 0
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import pdist
+
+from write_init_cond_lbibcell import pack_cells_hex, pack_cells_random
+
+BOX = (0, 0, 600, 400)
+RADIUS = 10.0
+GAP = 2.0
+
+
+def assert_packed(centers):
+    """Inside the box and no two cells closer than 2 * radius + gap"""
+    assert centers.shape[1] == 2
+    assert (centers >= np.array(BOX[:2]) + RADIUS - 1e-9).all()
+    assert (centers <= np.array(BOX[2:]) - RADIUS + 1e-9).all()
+    assert pdist(centers).min() >= 2 * RADIUS + GAP - 1e-9
+
+
+def test_hex_density():
+    centers = pack_cells_hex(BOX, RADIUS, GAP)
+    assert_packed(centers)
+    # one cell per pitch^2 sqrt(3) / 2 over the area reachable by the centers
+    pitch = 2 * RADIUS + GAP
+    area = (BOX[2] - BOX[0] - 2 * RADIUS) * (BOX[3] - BOX[1] - 2 * RADIUS)
+    assert centers.shape[0] == pytest.approx(
+        area / (pitch**2 * np.sqrt(3) / 2), rel=0.1
+    )
+    assert len(pack_cells_hex(BOX, RADIUS, GAP, n_cells=10)) == 10
+
+
+def test_random_places_all_cells_that_fit():
+    centers = pack_cells_random(BOX, RADIUS, 200, GAP, seed=0)
+    assert centers.shape == (200, 2)
+    assert_packed(centers)
+    np.testing.assert_array_equal(
+        pack_cells_random(BOX, RADIUS, 200, GAP, seed=0), centers
+    )
+
+
+def test_random_density_when_crowded():
+    centers = pack_cells_random(BOX, RADIUS, 10000, GAP, seed=0)
+    assert_packed(centers)
+    # random sequential adsorption jams at a coverage of 0.547 of the disks
+    # of diameter 2 * radius + gap around the centers
+    area = (BOX[2] - BOX[0] - 2 * RADIUS) * (BOX[3] - BOX[1] - 2 * RADIUS)
+    coverage = centers.shape[0] * np.pi * (RADIUS + GAP / 2) ** 2 / area
+    assert 0.45 < coverage < 0.6
+
+
+@pytest.mark.parametrize("box", [(0, 0, 15, 400), (0, 0, 600, 15), (0, 0, 5, 5)])
+def test_box_smaller_than_a_cell(box):
+    assert pack_cells_hex(box, RADIUS, GAP).shape == (0, 2)
+    assert pack_cells_random(box, RADIUS, 10, GAP, seed=0).shape == (0, 2)